@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import time
 from machine import Pin,I2C
+import utime
+import metrics
 
 # device I2C pins
 LCD1602_SDA = Pin(4)
@@ -86,9 +88,11 @@ class LCD1602:
     self.command(LCD_DISPLAYCONTROL | self._showcontrol)
 
   def print_lcd(self, message: str):
+    t0 = utime.ticks_us()
     self.clear()
     self.setCursor(0, 0)
     self.printout(message)
+    metrics.LCD_WRITE.since(t0)
 
   def begin(self,cols,lines):
     if (lines > 1):
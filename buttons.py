@@ -0,0 +1,173 @@
+# Interrupt-driven, debounced button input.
+#
+# Pin IRQs only timestamp the edge into a ring buffer and wake the
+# dispatcher, so nothing polls while the buttons are idle. The dispatcher
+# debounces each button separately, recognises long and double presses where
+# they are enabled, and queues (button, kind) events for coroutines waiting
+# in event().
+
+import array
+import machine
+import uasyncio
+import utime
+
+PRESS = 1
+LONG = 2
+DOUBLE = 3
+
+RING_SIZE = 32  # power of two
+RING_MASK = RING_SIZE - 1
+
+DEBOUNCE_MS = 50
+
+
+def _per_button(value, count):
+    if isinstance(value, int):
+        value = [value] * count
+    if len(value) != count:
+        raise ValueError("need one value per button")
+    return array.array("H", value)
+
+
+class Buttons:
+    """Buttons on pull-up pins, pressed when the pin reads 0
+
+    debounce_ms, long_ms and double_ms take one value for every button or a
+    list with one per button. A long_ms or double_ms of 0 turns that gesture
+    off; a button with neither reports PRESS as soon as it goes down.
+    """
+
+    def __init__(self, pins, debounce_ms=DEBOUNCE_MS, long_ms=0, double_ms=0):
+        count = len(pins)
+        self.pins = [machine.Pin(pin, machine.Pin.IN, machine.Pin.PULL_UP) for pin in pins]
+        self.debounce_ms = _per_button(debounce_ms, count)
+        self.long_ms = _per_button(long_ms, count)
+        self.double_ms = _per_button(double_ms, count)
+
+        # raw edges written by the IRQ handler: ticks and (button << 1) | pressed
+        self.edge_ticks = array.array("i", [0] * RING_SIZE)
+        self.edge_codes = bytearray(RING_SIZE)
+        self.edge_head = 0
+        self.edge_tail = 0
+        self.overflows = 0
+        self.flag = uasyncio.ThreadSafeFlag()
+
+        # debounced state of each button
+        self.down = bytearray(count)
+        self.changed_at = array.array("i", [0] * count)
+        self.unsettled = bytearray(count)  # an edge was dropped as bounce, re-read the pin later
+        self.long_sent = bytearray(count)
+        self.clicks = bytearray(count)
+
+        # recognised events waiting for event()
+        self.events = bytearray(RING_SIZE)
+        self.event_head = 0
+        self.event_tail = 0
+        self.ready = uasyncio.Event()
+
+        for button, pin in enumerate(self.pins):
+            pin.irq(lambda p, b=button: self._irq(b, p), machine.Pin.IRQ_FALLING | machine.Pin.IRQ_RISING)
+
+    def _irq(self, button, pin):
+        head = self.edge_head
+        following = (head + 1) & RING_MASK
+        if following == self.edge_tail:
+            self.overflows += 1
+            return
+        self.edge_ticks[head] = utime.ticks_ms()
+        self.edge_codes[head] = (button << 1) | (pin.value() ^ 1)
+        self.edge_head = following
+        self.flag.set()
+
+    def _emit(self, button, kind):
+        following = (self.event_head + 1) & RING_MASK
+        if following == self.event_tail:
+            return  # nobody is listening, drop it
+        self.events[self.event_head] = (button << 2) | kind
+        self.event_head = following
+        self.ready.set()
+
+    def _edge(self, button, pressed, now):
+        if pressed == self.down[button]:
+            return
+        if utime.ticks_diff(now, self.changed_at[button]) < self.debounce_ms[button]:
+            self.unsettled[button] = 1
+            return
+        self.down[button] = pressed
+        self.changed_at[button] = now
+        self.unsettled[button] = 0
+        long_ms = self.long_ms[button]
+        double_ms = self.double_ms[button]
+
+        if pressed:
+            self.long_sent[button] = 0
+            if not long_ms and not double_ms:
+                self._emit(button, PRESS)
+        elif (long_ms or double_ms) and not self.long_sent[button]:
+            if not double_ms:
+                self._emit(button, PRESS)
+            elif self.clicks[button]:
+                self.clicks[button] = 0
+                self._emit(button, DOUBLE)
+            else:
+                self.clicks[button] = 1
+
+    def _timers(self, now):
+        # returns ms until the next timer is due, or None when nothing is pending
+        due = None
+        for button in range(len(self.pins)):
+            # the soonest of this button's debounce and gesture timers
+            wait = None
+            if self.unsettled[button]:
+                elapsed = utime.ticks_diff(now, self.changed_at[button])
+                if elapsed >= self.debounce_ms[button]:
+                    self._edge(button, self.pins[button].value() ^ 1, now)
+                    self.unsettled[button] = 0
+                else:
+                    wait = self.debounce_ms[button] - elapsed
+            elapsed = utime.ticks_diff(now, self.changed_at[button])
+            if self.down[button] and self.long_ms[button] and not self.long_sent[button]:
+                if elapsed >= self.long_ms[button]:
+                    self.long_sent[button] = 1
+                    self.clicks[button] = 0
+                    self._emit(button, LONG)
+                else:
+                    left = self.long_ms[button] - elapsed
+                    wait = left if wait is None else min(wait, left)
+            elif self.clicks[button] and not self.down[button]:
+                if elapsed >= self.double_ms[button]:
+                    self.clicks[button] = 0
+                    self._emit(button, PRESS)
+                else:
+                    left = self.double_ms[button] - elapsed
+                    wait = left if wait is None else min(wait, left)
+            if wait is not None and (due is None or wait < due):
+                due = wait
+        return due
+
+    async def run(self):
+        """Dispatcher task: sleeps until an edge arrives or a gesture timer is due"""
+        due = None
+        while True:
+            if due is None:
+                await self.flag.wait()
+            else:
+                try:
+                    await uasyncio.wait_for_ms(self.flag.wait(), due)
+                except uasyncio.TimeoutError:
+                    pass
+            while self.edge_tail != self.edge_head:
+                tail = self.edge_tail
+                code = self.edge_codes[tail]
+                self._edge(code >> 1, code & 1, self.edge_ticks[tail])
+                self.edge_tail = (tail + 1) & RING_MASK
+            due = self._timers(utime.ticks_ms())
+
+    async def event(self):
+        """Wait for the next (button, kind) event"""
+        while self.event_tail == self.event_head:
+            self.ready.clear()
+            await self.ready.wait()
+        code = self.events[self.event_tail]
+        self.event_tail = (self.event_tail + 1) & RING_MASK
+        return code >> 2, code & 3
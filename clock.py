@@ -0,0 +1,97 @@
+# Time and randomness for the effects.
+#
+# Effects read the time with clock.ticks_ms(), wait with clock.sleep_ms()
+# and draw random numbers with clock.randrange(), always through the
+# module, so a recorder can swap in a VirtualClock and a fixed seed and get
+# the same frames on every run. On the tree these are the plain utime,
+# uasyncio and random functions. Animation gives an effect its own running
+# time, which is what it should draw from rather than from frame counts.
+# sleep_ms() also tallies what the effects asked to sleep, which the frame
+# governor takes out of the time between frames to see the work left over.
+
+import random
+import uasyncio
+import utime
+
+YIELD_MS = 5  # virtual time a bare yield stands for, about one busy-loop pass on the Pico
+
+ticks_ms = utime.ticks_ms
+ticks_diff = utime.ticks_diff
+_sleep_ms = uasyncio.sleep_ms
+randrange = random.randrange
+
+# sleeps through sleep_ms() and the ms they asked for, since the governor last reset them
+sleeps = 0
+slept_ms = 0
+
+
+async def sleep_ms(ms):
+    global sleeps, slept_ms
+    sleeps += 1
+    slept_ms += ms
+    await _sleep_ms(ms)
+
+
+def seed(value):
+    random.seed(value)
+
+
+class VirtualClock:
+    """Time that only moves when an effect sleeps, so recordings are reproducible
+
+    on_advance(now, target) is called before each step forward.
+    """
+
+    def __init__(self, start=0, yield_ms=YIELD_MS, on_advance=None):
+        self.now = start
+        self.yield_ms = yield_ms
+        self.on_advance = on_advance
+
+    def ticks_ms(self):
+        return self.now
+
+    def advance(self, ms):
+        target = self.now + ms
+        if self.on_advance:
+            self.on_advance(self.now, target)
+        self.now = target
+
+    async def sleep_ms(self, ms):
+        self.advance(ms if ms > 0 else self.yield_ms)
+        await uasyncio.sleep_ms(0)
+
+
+class Animation:
+    """Milliseconds since an effect started, so it can draw the frame for "now"
+
+    The count is built from ticks_diff of successive readings, so it runs
+    on smoothly through the tick counter wrapping, however long the effect
+    runs. A slow frame just means the next one is drawn further along.
+    """
+
+    def __init__(self):
+        self.last = ticks_ms()
+        self.ms = 0
+
+    def now(self):
+        t = ticks_ms()
+        self.ms += ticks_diff(t, self.last)
+        self.last = t
+        return self.ms
+
+    async def next_frame(self, budget_ms):
+        """Sleep whatever is left of budget_ms since the last now()"""
+        await sleep_ms(max(budget_ms - ticks_diff(ticks_ms(), self.last), 0))
+
+
+def use(virtual):
+    """Route the effects' time through a VirtualClock"""
+    global ticks_ms, _sleep_ms
+    ticks_ms = virtual.ticks_ms
+    _sleep_ms = virtual.sleep_ms
+
+
+def use_real():
+    global ticks_ms, _sleep_ms
+    ticks_ms = utime.ticks_ms
+    _sleep_ms = uasyncio.sleep_ms
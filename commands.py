@@ -0,0 +1,102 @@
+# Coalescing queue between /control and the LEDs.
+#
+# Dragging the colour picker fires requests faster than frames can be
+# pushed. submit() keeps at most one pending command per target, last write
+# wins: a 'set' per LED, a 'range' per span (which also swallows pending
+# sets inside it), and anything acting on the whole tree (fill, clear, an
+# effect) replaces the whole queue. run() applies what is pending at most
+# once per frame tick and pushes one frame for the batch, so the tree stays
+# within a tick or two of the last command however bursty the input.
+
+import uasyncio
+import utime
+import metrics
+
+TICK_MS = 20
+MAX_PENDING = 32
+
+WHOLE_TREE = ('all',)
+
+pending = {}   # key -> (action, data, brightness, ticks_us when submitted)
+order = []     # pending keys, oldest first
+ready = uasyncio.Event()
+
+submitted = 0
+coalesced = 0  # commands replaced before they were applied
+rejected = 0
+applied = 0
+batches = 0
+max_depth = 0
+
+
+def _key(action, data):
+    if action == 'set':
+        return ('set', data['data']['index'])
+    if action == 'range':
+        return ('range', data['data']['start'], data['data']['end'])
+    return WHOLE_TREE
+
+
+def _drop(key):
+    global coalesced
+    del pending[key]
+    order.remove(key)
+    coalesced += 1
+
+
+def submit(action, data, brightness):
+    """Queue a command; False when the queue is full"""
+    global submitted, rejected, max_depth
+    key = _key(action, data)
+    if key is WHOLE_TREE:
+        for old in order[:]:
+            _drop(old)
+    else:
+        if key in pending:
+            _drop(key)
+        if key[0] == 'range':
+            for old in order[:]:
+                if old[0] == 'set' and key[1] <= old[1] <= key[2]:
+                    _drop(old)
+    if len(order) >= MAX_PENDING:
+        rejected += 1
+        return False
+    pending[key] = (action, data, brightness, utime.ticks_us())
+    order.append(key)
+    submitted += 1
+    max_depth = max(max_depth, len(order))
+    ready.set()
+    return True
+
+
+async def run(apply, after_batch):
+    """Apply pending commands with apply(action, data, brightness), then call after_batch(), once per tick"""
+    global applied, batches
+    while True:
+        await ready.wait()
+        ready.clear()
+        started = utime.ticks_ms()
+        batch = [pending.pop(key) for key in order]
+        order.clear()
+        for action, data, brightness, submitted_at in batch:
+            try:
+                await apply(action, data, brightness)
+            except Exception as e:
+                print('Command', action, 'failed:', e)
+            metrics.COMMAND_LATENCY.since(submitted_at)
+        applied += len(batch)
+        batches += 1
+        after_batch()
+        await uasyncio.sleep_ms(max(TICK_MS - utime.ticks_diff(utime.ticks_ms(), started), 0))
+
+
+def stats():
+    return {
+        'depth': len(order),
+        'max_depth': max_depth,
+        'submitted': submitted,
+        'coalesced': coalesced,
+        'rejected': rejected,
+        'applied': applied,
+        'batches': batches,
+    }
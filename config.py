@@ -0,0 +1,257 @@
+# Runtime configuration, loaded once at boot from config.json on flash.
+#
+# Everything that used to be a module constant and differs between
+# deployments (strip wiring, Wi-Fi, effect timing) lives here, so a tree can
+# be retuned over HTTP without reflashing code. update() validates every
+# value before anything changes and reports which fields did change, so
+# callers only reallocate buffers when a size-affecting field moved.
+
+import uos
+import ujson
+
+CONFIG_FILE = "config.json"
+
+MAX_STRIPS = 8
+MAX_PIN = 29
+
+# fields whose change means frame buffers and lookup tables must be reallocated
+SIZE_FIELDS = ("strips",)
+
+# fields never sent back out over HTTP
+SECRET_FIELDS = ("password", "api_token")
+
+DEFAULTS = {
+    "strips": [[22, 283]],
+    "button_pins": [21, 20, 19, 18],
+    "ssid": "Number9",
+    "password": "freyacat",
+    "static_ip": "192.168.0.20",
+    "subnet_mask": "255.255.255.0",
+    "gateway": "192.168.0.1",
+    "dns": "8.8.8.8",
+    "fast_sequence_period_ms": 750,
+    "fast_sequence_twinkle_duration_ms": 200,
+    "twinkling_period_fixed_ms": 20,
+    "twinkling_period_max_variable_ms": 100,
+    "twinkling_duration_ms": 700,
+    "fade_in_duration_ms": 2000,
+    "fadeout_time_ms": 800,
+    "fade_to_cherry_duration": 2000,
+    "power_budget_ma": 8000,
+    "power_ma_per_channel": 20,
+    "gamma": 1.0,
+    "white_balance": [255, 255, 255],
+    "dither": False,
+    "render_bits": 8,
+    "frame_budget_ms": 20,
+    "log_level": "info",
+    "api_token": "",
+    "rate_limit_per_s": 20,
+    "rate_limit_burst": 40,
+}
+
+
+def _int(value):
+    # bool is an int subclass, but true in a config file is a mistake, not 1
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _pins(value, name):
+    if not isinstance(value, list):
+        raise ValueError("{} must be a list".format(name))
+    for pin in value:
+        if not _int(pin) or not 0 <= pin <= MAX_PIN:
+            raise ValueError("{}: bad pin {}".format(name, pin))
+    return value
+
+
+def _strips(value):
+    if not isinstance(value, list) or not 1 <= len(value) <= MAX_STRIPS:
+        raise ValueError("strips must list 1 to {} [pin, count] pairs".format(MAX_STRIPS))
+    pins = []
+    for strip in value:
+        if not isinstance(strip, list) or len(strip) != 2:
+            raise ValueError("strips must list [pin, count] pairs")
+        _pins(strip[:1], "strips")
+        if not _int(strip[1]) or strip[1] < 1:
+            raise ValueError("strips: bad LED count {}".format(strip[1]))
+        pins.append(strip[0])
+    if len(set(pins)) != len(pins):
+        raise ValueError("strips: pins must be distinct")
+    return [list(strip) for strip in value]
+
+
+def _text(value, name):
+    if not isinstance(value, str):
+        raise ValueError("{} must be a string".format(name))
+    return value
+
+
+def _address(value, name):
+    # empty means DHCP
+    _text(value, name)
+    if value:
+        parts = value.split(".")
+        if len(parts) != 4 or not all(p.isdigit() and int(p) < 256 for p in parts):
+            raise ValueError("{}: bad address {}".format(name, value))
+    return value
+
+
+def _ms(value, name):
+    if not _int(value) or value < 1:
+        raise ValueError("{} must be a positive number of ms".format(name))
+    return value
+
+
+def _ma(value, name):
+    if not _int(value) or value < 1:
+        raise ValueError("{} must be a positive number of mA".format(name))
+    return value
+
+
+def _count(value, name):
+    if not _int(value) or value < 1:
+        raise ValueError("{} must be a positive whole number".format(name))
+    return value
+
+
+def _gamma(value, name):
+    if not (_int(value) or isinstance(value, float)) or not 1.0 <= value <= 3.0:
+        raise ValueError("{} must be a number from 1.0 to 3.0".format(name))
+    return float(value)
+
+
+def _balance(value, name):
+    if not isinstance(value, list) or len(value) != 3:
+        raise ValueError("{} must be [red, green, blue]".format(name))
+    for channel in value:
+        if not _int(channel) or not 1 <= channel <= 255:
+            raise ValueError("{}: each channel must be 1 to 255".format(name))
+    return list(value)
+
+
+def _flag(value, name):
+    if not isinstance(value, bool):
+        raise ValueError("{} must be true or false".format(name))
+    return value
+
+
+def _bits(value, name):
+    if value not in (8, 16):
+        raise ValueError("{} must be 8 or 16".format(name))
+    return value
+
+
+def _level(value, name):
+    if value not in ("debug", "info", "warning", "error"):
+        raise ValueError("{} must be debug, info, warning or error".format(name))
+    return value
+
+
+VALIDATORS = {
+    "strips": lambda v, n: _strips(v),
+    "button_pins": _pins,
+    "ssid": _text,
+    "password": _text,
+    "static_ip": _address,
+    "subnet_mask": _address,
+    "gateway": _address,
+    "dns": _address,
+    "fast_sequence_period_ms": _ms,
+    "fast_sequence_twinkle_duration_ms": _ms,
+    "twinkling_period_fixed_ms": _ms,
+    "twinkling_period_max_variable_ms": _ms,
+    "twinkling_duration_ms": _ms,
+    "fade_in_duration_ms": _ms,
+    "fadeout_time_ms": _ms,
+    "fade_to_cherry_duration": _ms,
+    "power_budget_ma": _ma,
+    "power_ma_per_channel": _ma,
+    "gamma": _gamma,
+    "white_balance": _balance,
+    "dither": _flag,
+    "render_bits": _bits,
+    "frame_budget_ms": _ms,
+    "log_level": _level,
+    "api_token": _text,
+    "rate_limit_per_s": _count,
+    "rate_limit_burst": _count,
+}
+
+
+def _copy(value):
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+class Config:
+    __slots__ = tuple(DEFAULTS)
+
+    def __init__(self):
+        for name, value in DEFAULTS.items():
+            setattr(self, name, _copy(value))
+
+    @property
+    def num_leds(self):
+        return sum(count for _, count in self.strips)
+
+    def validate(self, values):
+        """Checked copy of values; raises ValueError without changing anything"""
+        if not isinstance(values, dict):
+            raise ValueError("settings must be an object")
+        checked = {}
+        for name, value in values.items():
+            if name not in VALIDATORS:
+                raise ValueError("unknown setting {}".format(name))
+            checked[name] = VALIDATORS[name](value, name)
+        return checked
+
+    def apply(self, checked):
+        """Store values from validate(); returns the set of changed field names"""
+        changed = set()
+        for name, value in checked.items():
+            if getattr(self, name) != value:
+                setattr(self, name, value)
+                changed.add(name)
+        return changed
+
+    def update(self, values):
+        """Validate values and apply them all or none; returns the set of changed field names"""
+        return self.apply(self.validate(values))
+
+    def size_changed(self, changed):
+        return any(name in changed for name in SIZE_FIELDS)
+
+    def to_dict(self, secrets=False):
+        return {name: getattr(self, name) for name in DEFAULTS if secrets or name not in SECRET_FIELDS}
+
+
+def load(path=CONFIG_FILE):
+    """Defaults overlaid with the file on flash; a missing or broken file falls back to defaults"""
+    cfg = Config()
+    try:
+        with open(path) as f:
+            cfg.update(ujson.load(f))
+    except OSError:
+        print('No', path, '- using defaults')
+    except ValueError as e:
+        print('Ignoring', path, ':', e)
+        cfg = Config()
+    return cfg
+
+
+def save(cfg, path=CONFIG_FILE):
+    # write a temporary file and rename it, so a reset mid-write can't corrupt the config
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        ujson.dump(cfg.to_dict(secrets=True), f)
+    uos.rename(tmp, path)
+
+
+def reload(path=CONFIG_FILE):
+    """Re-read the file into current; returns the set of changed field names"""
+    return current.update(load(path).to_dict(secrets=True))
+
+
+current = load()
@@ -0,0 +1,75 @@
+# Host-side DDP sender for exercising realtime.py from a PC.
+#
+#   python3 ddp_send.py 192.168.0.20 --fps 40 --drop-every 10
+#
+# Streams a moving rainbow at the tree. --drop-every skips a sequence number
+# now and then so the receiver's dropped-packet counter can be checked, and
+# stopping the sender lets the receiver time out back to local effects.
+
+import argparse
+import colorsys
+import socket
+import struct
+import time
+
+DDP_PORT = 4048
+DDP_FLAG_VERSION_1 = 0x40
+DDP_FLAG_PUSH = 0x01
+DDP_TYPE_RGB8 = 0x0B
+DDP_ID_DISPLAY = 1
+DDP_MAX_DATA = 1440
+
+
+def rainbow_frame(num_leds, t):
+    frame = bytearray(num_leds * 3)
+    for i in range(num_leds):
+        r, g, b = colorsys.hsv_to_rgb((i / num_leds + t) % 1.0, 1.0, 1.0)
+        frame[i * 3:i * 3 + 3] = bytes((int(r * 255), int(g * 255), int(b * 255)))
+    return frame
+
+
+def packets(frame, seq):
+    """Split one frame into DDP datagrams, setting PUSH on the last one"""
+    for offset in range(0, len(frame), DDP_MAX_DATA):
+        chunk = frame[offset:offset + DDP_MAX_DATA]
+        flags = DDP_FLAG_VERSION_1
+        if offset + len(chunk) >= len(frame):
+            flags |= DDP_FLAG_PUSH
+        header = struct.pack('>BBBBIH', flags, seq, DDP_TYPE_RGB8, DDP_ID_DISPLAY, offset, len(chunk))
+        yield header + chunk
+        seq = seq % 15 + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream DDP frames to the tree')
+    parser.add_argument('host')
+    parser.add_argument('--port', type=int, default=DDP_PORT)
+    parser.add_argument('--leds', type=int, default=283)
+    parser.add_argument('--fps', type=float, default=40)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--drop-every', type=int, default=0,
+                        help='skip every Nth datagram to simulate packet loss')
+    args = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    seq = 1
+    sent = skipped = 0
+    start = time.monotonic()
+    next_frame = start
+    while time.monotonic() - start < args.seconds:
+        frame = rainbow_frame(args.leds, (time.monotonic() - start) / 4)
+        for datagram in packets(frame, seq):
+            seq = seq % 15 + 1
+            if args.drop_every and (sent + skipped + 1) % args.drop_every == 0:
+                skipped += 1
+                continue
+            sock.sendto(datagram, (args.host, args.port))
+            sent += 1
+        next_frame += 1 / args.fps
+        time.sleep(max(next_frame - time.monotonic(), 0))
+
+    print(f'sent {sent} datagrams, deliberately dropped {skipped}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+# Golden-frame recorder and comparator for the effects, run on the host.
+#
+#   python3 golden.py record                 # (re)write golden/<effect>.golden for every effect
+#   python3 golden.py record rainbow wave    # just these
+#   python3 golden.py check                  # re-render and compare against golden/
+#   python3 golden.py diff a.golden b.golden # compare two recordings
+#
+# Effects run on a clock.VirtualClock with a fixed seed, so time only moves
+# when an effect sleeps and every run draws the same random numbers. The
+# frame on the LEDs is captured every step_ms of virtual time. Button-driven
+# effects get a press every press_ms. A golden file is a zlib-compressed
+# JSON header line followed by the frames, three bytes per LED.
+#
+# check exits non-zero when any pixel differs by more than --tolerance in
+# any channel, listing the frames and pixels that moved.
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import zlib
+
+import hostshim
+
+hostshim.install()
+
+import clock      # noqa: E402
+import spatial    # noqa: E402
+import webserver  # noqa: E402
+import ws2812     # noqa: E402
+
+GOLDEN_DIR = 'golden'
+SEED = 2023
+IDLE_SPINS = 4  # loop turns without the clock moving before the effect counts as waiting
+
+
+class NoLcd:
+    def print_lcd(self, message):
+        pass
+
+    def setCursor(self, col, row):
+        pass
+
+    def printout(self, text):
+        pass
+
+
+# name -> (step_ms, duration_ms, press_ms, factory(button))
+EFFECTS = {
+    'rainbow': (20, 2000, 0, lambda button: webserver.rainbow_effect(128)),
+    'wave': (30, 2000, 0, lambda button: webserver.wave_effect(128)),
+    'snow': (20, 4000, 0, lambda button: spatial.snow_effect(128)),
+    'pulse': (20, 2000, 0, lambda button: spatial.pulse_effect(128)),
+    'gradient': (20, 2000, 0, lambda button: spatial.gradient_effect(128)),
+    'plasma': (20, 2000, 0, lambda button: spatial.plasma_effect(128)),
+    'fast_sequence': (20, 2000, 0, lambda button: ws2812.fast_sequence(button, [], clock.ticks_ms())),
+    'twinkling': (20, 2000, 0, lambda button: ws2812.twinkling(button, [], clock.ticks_ms())),
+    'enchanted_forest': (50, 12000, 2000, lambda button: ws2812.enchanted_forest_base(NoLcd(), button)),
+    'twinkling_only': (50, 6000, 2000, lambda button: ws2812.twinkling_only(NoLcd(), button)),
+}
+
+
+def frame():
+    out = bytearray(3 * ws2812.NUM_LEDS)
+    for i in range(ws2812.NUM_LEDS):
+        c = ws2812.ar[i]
+        out[3 * i] = c >> 16
+        out[3 * i + 1] = (c >> 8) & 0xFF
+        out[3 * i + 2] = c & 0xFF
+    return out
+
+
+async def drive(factory, step_ms, duration_ms, press_ms):
+    frames = bytearray()
+    button = asyncio.Event()
+    state = {'sample': 0, 'press': press_ms}
+
+    def on_advance(now, target):
+        while state['sample'] < target and state['sample'] < duration_ms:
+            frames.extend(frame())
+            state['sample'] += step_ms
+        if press_ms and target >= state['press']:
+            button.set()
+            state['press'] += press_ms
+
+    virtual = clock.VirtualClock(on_advance=on_advance)
+    clock.use(virtual)
+    task = asyncio.create_task(factory(button))
+    try:
+        while not task.done() and state['sample'] < duration_ms:
+            before = virtual.now
+            for _ in range(IDLE_SPINS):
+                await asyncio.sleep(0)
+            if virtual.now == before and not task.done():
+                # waiting on something other than the clock, e.g. a button press
+                virtual.advance(virtual.yield_ms)
+        if task.done() and not task.cancelled() and task.exception():
+            raise task.exception()
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        clock.use_real()
+    return frames
+
+
+def record(name, seed=SEED):
+    """Render one effect deterministically; returns (header, frames)"""
+    step_ms, duration_ms, press_ms, factory = EFFECTS[name]
+    clock.seed(seed)
+    ws2812.pixels_fill((0, 0, 0))
+    ws2812.pixels_show()
+    frames = asyncio.run(drive(factory, step_ms, duration_ms, press_ms))
+    header = {
+        'effect': name,
+        'seed': seed,
+        'step_ms': step_ms,
+        'press_ms': press_ms,
+        'num_leds': ws2812.NUM_LEDS,
+        'frames': len(frames) // (3 * ws2812.NUM_LEDS),
+    }
+    return header, bytes(frames)
+
+
+def save(path, header, frames):
+    with open(path, 'wb') as f:
+        f.write(zlib.compress(json.dumps(header).encode() + b'\n' + frames, 9))
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        data = zlib.decompress(f.read())
+    line, frames = data.split(b'\n', 1)
+    return json.loads(line), frames
+
+
+def compare(expected, got, tolerance=0, show=5):
+    """Print per-pixel differences; returns the number of frames that differ"""
+    (header_a, frames_a), (header_b, frames_b) = expected, got
+    for key in ('num_leds', 'step_ms'):
+        if header_a[key] != header_b[key]:
+            print(f'  {key} differs: {header_a[key]} vs {header_b[key]}')
+            return max(header_a['frames'], header_b['frames'])
+    width = 3 * header_a['num_leds']
+    bad_frames = 0
+    if header_a['frames'] != header_b['frames']:
+        print(f'  frame count differs: {header_a["frames"]} vs {header_b["frames"]}')
+        bad_frames += abs(header_a['frames'] - header_b['frames'])
+    for f in range(min(header_a['frames'], header_b['frames'])):
+        a = frames_a[f * width:(f + 1) * width]
+        b = frames_b[f * width:(f + 1) * width]
+        if a == b:
+            continue
+        moved = []
+        worst = 0
+        for led in range(header_a['num_leds']):
+            delta = max(abs(a[3 * led + c] - b[3 * led + c]) for c in range(3))
+            if delta > tolerance:
+                moved.append(led)
+            worst = max(worst, delta)
+        if not moved:
+            continue
+        bad_frames += 1
+        print(f'  frame {f} ({f * header_a["step_ms"]} ms): {len(moved)} pixels differ, worst channel delta {worst}')
+        for led in moved[:show]:
+            print(f'    led {led}: expected {tuple(a[3 * led:3 * led + 3])} got {tuple(b[3 * led:3 * led + 3])}')
+        if len(moved) > show:
+            print(f'    ... and {len(moved) - show} more')
+    return bad_frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record and check golden frames of the effects')
+    parser.add_argument('command', choices=('record', 'check', 'diff'))
+    parser.add_argument('names', nargs='*', help='effects for record/check, or two files for diff')
+    parser.add_argument('--dir', default=GOLDEN_DIR)
+    parser.add_argument('--tolerance', type=int, default=0, help='allowed difference per channel')
+    parser.add_argument('--show', type=int, default=5, help='pixels listed per differing frame')
+    args = parser.parse_args()
+
+    if args.command == 'diff':
+        if len(args.names) != 2:
+            parser.error('diff takes two golden files')
+        bad = compare(load(args.names[0]), load(args.names[1]), args.tolerance, args.show)
+        print('identical' if not bad else f'{bad} frames differ')
+        sys.exit(1 if bad else 0)
+
+    names = args.names or list(EFFECTS)
+    failed = []
+    for name in names:
+        if name not in EFFECTS:
+            parser.error(f'unknown effect {name}; choose from {", ".join(EFFECTS)}')
+        path = os.path.join(args.dir, name + '.golden')
+        if args.command == 'record':
+            os.makedirs(args.dir, exist_ok=True)
+            header, frames = record(name)
+            save(path, header, frames)
+            print(f'{name}: {header["frames"]} frames -> {path} ({os.path.getsize(path)} bytes)')
+        else:
+            if not os.path.exists(path):
+                print(f'{name}: no golden file at {path}')
+                failed.append(name)
+                continue
+            expected = load(path)
+            bad = compare(expected, record(name, expected[0]['seed']), args.tolerance, args.show)
+            print(f'{name}: {"ok" if not bad else f"{bad} frames differ"}')
+            if bad:
+                failed.append(name)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
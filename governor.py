@@ -0,0 +1,116 @@
+# Frame budget governor: gives up optional work when frames run late.
+#
+# After every push it takes the frame's busy time, the time since the last
+# push less what the effect asked to sleep through clock.sleep_ms(), so an
+# effect pacing itself at 30 ms isn't taken for a slow one. What's left is
+# building the frame plus whatever else held the CPU, HTTP mostly. When the
+# smoothed busy time stays over the budget for DEGRADE_FRAMES frames the
+# quality drops a level; when it stays within the budget for RESTORE_FRAMES
+# frames it comes back up one. The levels add up:
+#   1  no dithering in the output stage
+#   2  half as many new twinkles
+#   3  a quarter as many new twinkles, static layers redrawn every other frame
+# Pushes that don't follow an effect's sleep (a command batch, a DDP frame)
+# and gaps over IDLE_MS (an effect waiting on a button) aren't frames of a
+# running animation and are left out.
+
+import array
+import clock
+import metrics
+
+IDLE_MS = 500
+OVER_PERCENT = 120       # how far over the budget counts as blown
+DEGRADE_FRAMES = 10
+RESTORE_FRAMES = 100
+HISTORY = 64             # frames kept for /stats
+
+NO_DITHER = 1
+THIN_TWINKLES = 2
+HALF_RATE_STATIC = 3
+MAX_LEVEL = 3
+
+budget_ms = 20
+level = 0
+smoothed = 0             # busy time in 1/8 ms, averaged over about 8 frames
+over = 0                 # frames in a row over the budget
+within = 0               # frames in a row within it
+last = None
+frames = 0
+degrades = 0
+restores = 0
+history = array.array("H", [0 for _ in range(HISTORY)])  # busy ms of the last HISTORY frames
+levels = bytearray(HISTORY)                               # quality level each of them was built at
+
+
+def configure(cfg):
+    global budget_ms
+    budget_ms = cfg.frame_budget_ms
+
+
+def frame_shown():
+    global last, smoothed, over, within, level, frames, degrades, restores
+    now = clock.ticks_ms()
+    paced = clock.sleeps
+    slept = clock.slept_ms
+    clock.sleeps = 0
+    clock.slept_ms = 0
+    if last is None or not paced or clock.ticks_diff(now, last) > IDLE_MS:
+        last = now
+        return
+    busy = max(clock.ticks_diff(now, last) - slept, 0)
+    last = now
+    metrics.FRAME_BUSY.record(busy * 1000)
+    history[frames % HISTORY] = min(busy, 0xFFFF)
+    levels[frames % HISTORY] = level
+    frames += 1
+
+    smoothed += busy - (smoothed >> 3)
+    if smoothed > budget_ms * 8 * OVER_PERCENT // 100:
+        within = 0
+        over += 1
+        if over >= DEGRADE_FRAMES and level < MAX_LEVEL:
+            level += 1
+            over = 0
+            degrades += 1
+            metrics.info('Frames over budget at', smoothed / 8, 'ms, quality level', level)
+    elif smoothed <= budget_ms * 8:
+        over = 0
+        within += 1
+        if within >= RESTORE_FRAMES and level > 0:
+            level -= 1
+            within = 0
+            restores += 1
+            metrics.info('Frames back within budget, quality level', level)
+    else:
+        over = 0
+        within = 0
+
+
+def dithering():
+    """False while dithering is being skipped"""
+    return level < NO_DITHER
+
+
+def twinkle_stride():
+    """Keep one new twinkle in this many"""
+    return 1 if level < THIN_TWINKLES else 2 if level < MAX_LEVEL else 4
+
+
+def static_due():
+    """Whether this frame should redraw the layers that don't move"""
+    return level < HALF_RATE_STATIC or not frames & 1
+
+
+def stats():
+    count = min(frames, HISTORY)
+    first = frames - count
+    return {
+        'level': level,
+        'budget_ms': budget_ms,
+        'smoothed_ms': smoothed / 8,
+        'degrades': degrades,
+        'restores': restores,
+        # oldest first
+        'busy_ms': [history[(first + k) % HISTORY] for k in range(count)],
+        'levels': [levels[(first + k) % HISTORY] for k in range(count)],
+    }
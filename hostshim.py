@@ -0,0 +1,207 @@
+# Stand-ins for the MicroPython modules, so host-side scripts can import the
+# firmware modules under CPython.
+#
+#   import hostshim
+#   hostshim.install()
+#   import wifi
+#
+# Only what those scripts exercise is provided. network.WLAN is FakeWLAN,
+# which plays back a script of connect outcomes to simulate a flapping link.
+# rp2.StateMachine counts the words it is given instead of driving a pin.
+
+import asyncio
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_CONNECT_FAIL = -1
+STAT_NO_AP_FOUND = -2
+STAT_GOT_IP = 3
+
+
+def ticks_ms():
+    return int(time.monotonic() * 1000)
+
+
+def ticks_us():
+    return int(time.monotonic() * 1000000)
+
+
+def ticks_diff(a, b):
+    return a - b
+
+
+def ticks_add(a, b):
+    return a + b
+
+
+class ThreadSafeFlag:
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
+
+
+class FakeWLAN:
+    """network.WLAN stand-in
+
+    Each connect() takes the next entry of script: None means the access
+    point is not found, otherwise the link comes up and stays up for that
+    many ms (0 for good). connect_ms is how long joining takes.
+    """
+
+    script = []
+    connect_ms = 300
+    address = "192.168.0.20"
+
+    def __init__(self, interface=0):
+        self._active = False
+        self._ifconfig = (self.address, "255.255.255.0", "192.168.0.1", "8.8.8.8")
+        self._started = None
+        self._outcome = None
+        self.connects = 0
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = value
+
+    def ifconfig(self, values=None):
+        if values is None:
+            return self._ifconfig
+        self._ifconfig = tuple(values)
+
+    def connect(self, ssid, password):
+        script = FakeWLAN.script
+        self._outcome = script[self.connects] if self.connects < len(script) else 0
+        self._started = ticks_ms()
+        self.connects += 1
+
+    def disconnect(self):
+        self._started = None
+
+    def status(self):
+        if self._started is None or not self._active:
+            return STAT_IDLE
+        elapsed = ticks_diff(ticks_ms(), self._started)
+        if elapsed < self.connect_ms:
+            return STAT_CONNECTING
+        if self._outcome is None:
+            return STAT_NO_AP_FOUND
+        if self._outcome and elapsed >= self.connect_ms + self._outcome:
+            return STAT_IDLE  # link dropped
+        return STAT_GOT_IP
+
+    def isconnected(self):
+        return self.status() == STAT_GOT_IP
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=None, pull=None):
+        self.id = id
+        self._value = 1 if pull == Pin.PULL_UP else 0
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = value
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def toggle(self):
+        self._value ^= 1
+
+    def irq(self, handler=None, trigger=0):
+        self.handler = handler
+
+
+class StateMachine:
+    """rp2.StateMachine stand-in that counts the words put to it
+
+    With record set, it also keeps them in received, for checks of what
+    each strip was sent; off by default so long runs don't grow.
+    """
+
+    record = False
+
+    def __init__(self, id, program=None, freq=0, sideset_base=None):
+        self.id = id
+        self.words = 0
+        self.received = []
+
+    def active(self, value=None):
+        return 1
+
+    def put(self, value, shift=0):
+        self.words += len(value) if hasattr(value, '__len__') else 1
+        if self.record:
+            self.received.extend(value if hasattr(value, '__len__') else (value,))
+
+
+class PIO:
+    OUT_LOW = 0
+    SHIFT_LEFT = 0
+    JOIN_TX = 1
+
+
+def asm_pio(**options):
+    return lambda program: program
+
+
+HEAP_SIZE = 256 * 1024 * 1024  # nothing like the Pico's; the host has no real limit
+
+
+def mem_alloc():
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    for key, value in attrs.items():
+        setattr(module, key, value)
+    sys.modules[name] = module
+    return module
+
+
+def install():
+    """Register the stand-ins in sys.modules; call before importing firmware modules"""
+    uasyncio = _module("uasyncio")
+    uasyncio.__dict__.update({k: v for k, v in vars(asyncio).items() if not k.startswith("_")})
+    uasyncio.sleep_ms = lambda ms: asyncio.sleep(ms / 1000)
+    uasyncio.wait_for_ms = lambda awaitable, ms: asyncio.wait_for(awaitable, ms / 1000)
+    uasyncio.ThreadSafeFlag = ThreadSafeFlag
+
+    _module("utime", ticks_ms=ticks_ms, ticks_us=ticks_us, ticks_diff=ticks_diff, ticks_add=ticks_add,
+            sleep_ms=lambda ms: time.sleep(ms / 1000), time=time.time)
+    _module("ujson", **{k: getattr(json, k) for k in ("dumps", "loads", "dump", "load")})
+    sys.modules["uos"] = os
+    _module("micropython", const=lambda value: value, native=lambda f: f)
+    _module("machine", Pin=Pin, I2C=lambda *args, **kwargs: None)
+    _module("rp2", StateMachine=StateMachine, PIO=PIO, asm_pio=asm_pio)
+    shim_gc = _module("gc", **{k: getattr(gc, k) for k in dir(gc) if not k.startswith("_")})
+    shim_gc.mem_alloc = mem_alloc
+    shim_gc.mem_free = lambda: HEAP_SIZE - mem_alloc()
+    shim_gc.threshold = lambda amount=None: None
+    _module("network", WLAN=FakeWLAN, STA_IF=0, STAT_IDLE=STAT_IDLE, STAT_CONNECTING=STAT_CONNECTING,
+            STAT_CONNECT_FAIL=STAT_CONNECT_FAIL, STAT_NO_AP_FOUND=STAT_NO_AP_FOUND, STAT_GOT_IP=STAT_GOT_IP)
@@ -0,0 +1,124 @@
+# Host-side throughput benchmark and fuzzer for httpreq.py.
+#
+#   python3 http_bench.py              # requests/s for typical requests, whole and split
+#   python3 http_bench.py --fuzz 20000 # mutated requests; only HttpError may come out
+#
+# The fuzzer checks that every input either parses or raises HttpError, that
+# a parsed body is exactly Content-Length bytes inside the buffer, and that
+# feeding the same bytes in random pieces gives the same result as feeding
+# them whole.
+
+import argparse
+import random
+import time
+
+import httpreq
+
+REQUESTS = [
+    b'GET / HTTP/1.1\r\nHost: 192.168.0.20\r\nUser-Agent: Mozilla/5.0 (X11; Linux x86_64)\r\n'
+    b'Accept: text/html,application/xhtml+xml\r\nAccept-Language: en-GB,en;q=0.9\r\n'
+    b'Accept-Encoding: gzip, deflate\r\nConnection: keep-alive\r\n\r\n',
+    b'POST /control HTTP/1.1\r\nHost: 192.168.0.20\r\nContent-Type: application/json\r\n'
+    b'Content-Length: 71\r\n\r\n'
+    b'{"action": "fill", "data": {"color": "#00ff00"}, "brightness": 128}    ',
+    b'GET /state HTTP/1.0\n\n',
+]
+
+
+def parse(data, pieces=None):
+    """(method, path, body) for data fed whole or in pieces; raises HttpError"""
+    request = httpreq.Request()
+    if pieces is None:
+        done = request.feed(data)
+    else:
+        done = False
+        start = 0
+        for stop in pieces + [len(data)]:
+            done = request.feed(data[start:stop])
+            start = stop
+            if done:
+                break
+    if not done:
+        return None
+    return request.method, request.path, bytes(request.body), request
+
+
+def benchmark(seconds):
+    request = httpreq.Request()
+    for data in REQUESTS:
+        for split in (None, 16):
+            count = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < seconds:
+                request.reset()
+                if split is None:
+                    request.feed(data)
+                else:
+                    for i in range(0, len(data), split):
+                        request.feed(data[i:i + split])
+                count += 1
+            elapsed = time.perf_counter() - start
+            how = 'whole' if split is None else f'{split}-byte pieces'
+            print(f'{data.split(b" ")[1].decode():10} {how:16} {count / elapsed:9.0f} req/s '
+                  f'{len(data) * count / elapsed / 1e6:6.2f} MB/s')
+
+
+def mutate(rng, data):
+    data = bytearray(data)
+    for _ in range(rng.randint(1, 6)):
+        choice = rng.random()
+        at = rng.randrange(len(data) + 1)
+        if choice < 0.3 and data:
+            data[min(at, len(data) - 1)] = rng.randrange(256)
+        elif choice < 0.5:
+            data[at:at] = rng.choice([b'\r\n', b'\n', b':', b' ', b'\r\n\r\n', b'Content-Length: 99999\r\n',
+                                      b'Transfer-Encoding: chunked\r\n', b'X: ' + b'y' * rng.randrange(2000) + b'\r\n'])
+        elif choice < 0.7:
+            del data[at:at + rng.randrange(1, 20)]
+        else:
+            data[at:at] = bytes(rng.randrange(256) for _ in range(rng.randrange(1, 40)))
+    return bytes(data)
+
+
+def fuzz(iterations, seed):
+    rng = random.Random(seed)
+    outcomes = {}
+    for n in range(iterations):
+        data = mutate(rng, rng.choice(REQUESTS))
+        try:
+            whole = parse(data)
+        except httpreq.HttpError as e:
+            whole = e.status
+        pieces = sorted(rng.sample(range(1, len(data)), min(len(data) - 1, rng.randrange(1, 8)))) if len(data) > 1 else []
+        try:
+            split = parse(data, pieces)
+        except httpreq.HttpError as e:
+            split = e.status
+
+        if isinstance(whole, tuple):
+            method, path, body, request = whole
+            assert len(body) == request.content_length, (n, data)
+            assert request.head_end + len(body) <= len(request.buf), (n, data)
+            assert isinstance(split, tuple) and split[:3] == whole[:3], (n, data, split)
+            key = 'parsed'
+        else:
+            assert split == whole or (split is None) == (whole is None), (n, data, whole, split)
+            key = whole
+        outcomes[key] = outcomes.get(key, 0) + 1
+    print(f'{iterations} mutated requests, outcomes: {outcomes}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark and fuzz the HTTP request parser')
+    parser.add_argument('--seconds', type=float, default=1, help='time per benchmark case')
+    parser.add_argument('--fuzz', type=int, default=0, metavar='N', help='run N fuzz iterations instead')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if args.fuzz:
+        fuzz(args.fuzz, args.seed)
+    else:
+        benchmark(args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+# Incremental HTTP/1.1 request parser with bounded, preallocated buffers.
+#
+# Each Request owns one bytearray: the head is read into the first
+# head_size bytes and the body lands right after it, so the body is handed
+# out as a memoryview of the same buffer without copying. Headers are
+# recorded as offsets into the buffer and only compared byte by byte when
+# looked up; the method and path are the only strings made per request.
+# A small pool of Requests is allocated at import, which also caps how
+# many requests are parsed at once.
+#
+# Plain Python, so host tools can import it without the MicroPython shims.
+
+import array
+
+HEAD_SIZE = 1024
+BODY_SIZE = 2048
+MAX_HEADERS = 24
+POOL_SIZE = 3
+
+
+class HttpError(Exception):
+    """A request that can't be served; status is the HTTP status to answer with"""
+
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+def _is(buf, start, stop, name):
+    # case-insensitive compare of buf[start:stop] with lower-case bytes name
+    if stop - start != len(name):
+        return False
+    for k in range(len(name)):
+        if buf[start + k] | 0x20 != name[k]:
+            return False
+    return True
+
+
+class Request:
+    def __init__(self, head_size=HEAD_SIZE, body_size=BODY_SIZE, max_headers=MAX_HEADERS):
+        self.head_size = head_size
+        self.body_size = body_size
+        self.max_headers = max_headers
+        self.buf = bytearray(head_size + body_size)
+        self.mv = memoryview(self.buf)
+        # per header: name start, name stop, value start, value stop
+        self.fields = array.array("H", [0] * (4 * max_headers))
+        self.reset()
+
+    def reset(self):
+        self.filled = 0
+        self.scanned = 0
+        self.line_start = 0
+        self.colon = -1
+        self.head_end = 0
+        self.method = None
+        self.path = None
+        self.num_headers = 0
+        self.content_length = 0
+        self.body = None
+        self.client = None  # peer address, filled in by the server
+        self.held = False   # set by handlers that keep the connection open, e.g. a frame stream
+
+    def _request_line(self, start, stop):
+        buf = self.buf
+        first = second = -1
+        for i in range(start, stop):
+            if buf[i] == 32:
+                if first < 0:
+                    first = i
+                else:
+                    second = i
+                    break
+        if first <= start or second <= first + 1 or bytes(self.mv[second + 1:stop]) not in (b'HTTP/1.0', b'HTTP/1.1'):
+            raise HttpError(400, 'Malformed request line')
+        try:
+            self.method = bytes(self.mv[start:first]).decode()
+            self.path = bytes(self.mv[first + 1:second]).decode()
+        except UnicodeError:
+            raise HttpError(400, 'Malformed request line')
+
+    def _header(self, start, stop, colon):
+        buf = self.buf
+        if colon <= start or colon >= stop:
+            raise HttpError(400, 'Malformed header')
+        if self.num_headers == self.max_headers:
+            raise HttpError(431, 'Too many headers')
+        value = colon + 1
+        while value < stop and buf[value] in (32, 9):
+            value += 1
+        while stop > value and buf[stop - 1] in (32, 9):
+            stop -= 1
+        k = 4 * self.num_headers
+        self.fields[k] = start
+        self.fields[k + 1] = colon
+        self.fields[k + 2] = value
+        self.fields[k + 3] = stop
+        self.num_headers += 1
+
+        if _is(buf, start, colon, b'content-length'):
+            if value == stop:
+                raise HttpError(400, 'Bad Content-Length')
+            length = 0
+            for i in range(value, stop):
+                digit = buf[i] - 48
+                if not 0 <= digit <= 9:
+                    raise HttpError(400, 'Bad Content-Length')
+                length = length * 10 + digit
+                if length > self.body_size:
+                    raise HttpError(413, 'Body too large')
+            self.content_length = length
+        elif _is(buf, start, colon, b'transfer-encoding'):
+            raise HttpError(501, 'Transfer-Encoding not supported')
+
+    def _scan(self):
+        # look at bytes not seen yet, one line at a time, until the blank line ending the head
+        buf = self.buf
+        end = min(self.filled, self.head_size)
+        i = self.scanned
+        while i < end:
+            c = buf[i]
+            if c == 10:
+                start = self.line_start
+                stop = i - 1 if i > start and buf[i - 1] == 13 else i
+                self.line_start = i + 1
+                colon = self.colon
+                self.colon = -1
+                if self.method is None:
+                    self._request_line(start, stop)
+                elif stop == start:
+                    self.head_end = i + 1
+                    break
+                else:
+                    self._header(start, stop, colon)
+            elif c == 58 and self.colon < 0:
+                self.colon = i
+            i += 1
+        self.scanned = i
+
+    def _received(self):
+        # True once the head and the whole body are in the buffer
+        if not self.head_end:
+            self._scan()
+            if not self.head_end:
+                if self.filled >= self.head_size:
+                    raise HttpError(431, 'Request header too large')
+                return False
+        stop = self.head_end + self.content_length
+        if self.filled < stop:
+            return False
+        self.body = self.mv[self.head_end:stop]
+        return True
+
+    def feed(self, data):
+        """Add received bytes; True once the request is complete. Bytes past the buffer are dropped"""
+        count = min(len(data), len(self.buf) - self.filled)
+        self.mv[self.filled:self.filled + count] = data[:count]
+        self.filled += count
+        return self._received()
+
+    async def read(self, reader):
+        """Read one request from a stream; False if the client closed without sending anything"""
+        self.reset()
+        while True:
+            stop = self.head_end + self.content_length if self.head_end else self.head_size
+            if self.filled < stop:
+                n = await reader.readinto(self.mv[self.filled:stop])
+                if not n:
+                    if self.filled == 0:
+                        return False
+                    raise HttpError(400, 'Incomplete request')
+                self.filled += n
+            if self._received():
+                return True
+
+    def header(self, name):
+        """Value of a header as a memoryview, or None; name is lower-case bytes"""
+        fields = self.fields
+        for k in range(0, 4 * self.num_headers, 4):
+            if _is(self.buf, fields[k], fields[k + 1], name):
+                return self.mv[fields[k + 2]:fields[k + 3]]
+        return None
+
+
+pool = [Request() for _ in range(POOL_SIZE)]
+
+
+def acquire():
+    """A free Request, or None when all are busy"""
+    if pool:
+        request = pool.pop()
+        request.reset()
+        return request
+    return None
+
+
+def release(request):
+    request.body = None
+    pool.append(request)
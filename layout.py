@@ -0,0 +1,155 @@
+# Physical LED layout shared by the effects and the web page.
+#
+# layout.json holds the x/y position of every LED (SVG units, y pointing
+# down). At load time the positions are turned into per-LED byte tables and
+# bucket index tables so spatial effects only do table lookups per frame.
+
+import array
+import math
+import ujson
+import ws2812
+
+LAYOUT_FILE = "layout.json"
+
+ROW_HEIGHT = 12    # vertical LED pitch in layout units
+COLUMN_WIDTH = 3   # horizontal LED pitch in layout units
+SECTOR_SHIFT = 4   # 256 angle steps >> 4 = 16 sectors
+RING_SHIFT = 4     # 256 radius steps >> 4 = 16 rings
+
+NOWHERE = 0xFFFF   # grid cell without an LED
+
+name = None
+capacity = 0       # number of LEDs the layout file places
+viewbox = None
+star = None
+labels = None
+
+# Per LED: raw position and positions normalised to 0..255
+xs = array.array("h")
+ys = array.array("h")
+x8 = bytearray()
+y8 = bytearray()
+angle8 = bytearray()   # around the star centre, 0 = straight up, clockwise
+radius8 = bytearray()  # distance from the star centre, 255 = furthest LED
+row_of = bytearray()
+column_of = bytearray()
+
+# Buckets: lists of array("H") holding LED indices
+rows = []
+columns = []
+sectors = []
+rings = []
+
+# grid[row * num_columns + column] is the LED in that cell, or NOWHERE
+grid = array.array("H")
+num_rows = 0
+num_columns = 0
+
+
+def _buckets(keys, count):
+    lists = [[] for _ in range(count)]
+    for led, key in enumerate(keys):
+        lists[key].append(led)
+    return [array.array("H", indices) for indices in lists]
+
+
+def load(path=LAYOUT_FILE, num_leds=None):
+    """Read the layout file and rebuild every lookup table"""
+    global name, capacity, viewbox, star, labels, xs, ys, x8, y8, angle8, radius8
+    global row_of, column_of, rows, columns, sectors, rings, grid, num_rows, num_columns
+
+    if num_leds is None:
+        num_leds = ws2812.NUM_LEDS
+    with open(path) as f:
+        data = ujson.load(f)
+
+    name = data["name"]
+    viewbox = data["viewbox"]
+    star = data["star"]
+    labels = data["labels"]
+    points = data["leds"]
+    capacity = len(points)
+    if len(points) < num_leds:
+        raise ValueError("layout has {} LEDs, need {}".format(len(points), num_leds))
+
+    xs = array.array("h", [round(points[led][0]) for led in range(num_leds)])
+    ys = array.array("h", [round(points[led][1]) for led in range(num_leds)])
+    min_x, max_x = min(xs), max(xs)
+    min_y, max_y = min(ys), max(ys)
+    width = max(max_x - min_x, 1)
+    height = max(max_y - min_y, 1)
+
+    # the star is the natural centre for anything radial
+    star_leds = range(star[0], star[1] + 1)
+    centre_x = sum(xs[led] for led in star_leds) / len(star_leds)
+    centre_y = sum(ys[led] for led in star_leds) / len(star_leds)
+    max_radius = max(math.sqrt((x - centre_x) ** 2 + (y - centre_y) ** 2) for x, y in zip(xs, ys)) or 1
+
+    x8 = bytearray(num_leds)
+    y8 = bytearray(num_leds)
+    angle8 = bytearray(num_leds)
+    radius8 = bytearray(num_leds)
+    row_of = bytearray(num_leds)
+    column_of = bytearray(num_leds)
+    for led in range(num_leds):
+        dx = xs[led] - centre_x
+        dy = ys[led] - centre_y
+        x8[led] = (xs[led] - min_x) * 255 // width
+        y8[led] = (ys[led] - min_y) * 255 // height
+        angle8[led] = int(math.atan2(dx, -dy) * 128 / math.pi) & 0xFF
+        radius8[led] = int(math.sqrt(dx * dx + dy * dy) * 255 / max_radius)
+        row_of[led] = (ys[led] - min_y + ROW_HEIGHT // 2) // ROW_HEIGHT
+        column_of[led] = (xs[led] - min_x + COLUMN_WIDTH // 2) // COLUMN_WIDTH
+
+    num_rows = max(row_of) + 1
+    num_columns = max(column_of) + 1
+    rows = _buckets(row_of, num_rows)
+    columns = _buckets(column_of, num_columns)
+    sectors = _buckets([a >> SECTOR_SHIFT for a in angle8], 256 >> SECTOR_SHIFT)
+    rings = _buckets([r >> RING_SHIFT for r in radius8], 256 >> RING_SHIFT)
+
+    grid = array.array("H", [NOWHERE] * (num_rows * num_columns))
+    for led in range(num_leds):
+        grid[row_of[led] * num_columns + column_of[led]] = led
+
+
+def led_at(row, column):
+    """LED in a grid cell, or None"""
+    if 0 <= row < num_rows and 0 <= column < num_columns:
+        led = grid[row * num_columns + column]
+        if led != NOWHERE:
+            return led
+    return None
+
+
+def fill_indices(indices, color):
+    """Set every LED in an index table to one colour"""
+    for led in indices:
+        ws2812.pixels_set(led, color)
+
+
+def fill_row(row, color):
+    fill_indices(rows[row], color)
+
+
+def fill_column(column, color):
+    fill_indices(columns[column], color)
+
+
+def fill_sector(sector, color):
+    fill_indices(sectors[sector], color)
+
+
+def fill_ring(ring, color):
+    fill_indices(rings[ring], color)
+
+
+def paint(table, palette, offset=0):
+    """Colour each LED from a 256-entry packed palette indexed by its byte in table, e.g. y8 or radius8"""
+    ar = ws2812.ar
+    for led in range(len(table)):
+        ar[led] = palette[(table[led] + offset) & 0xFF]
+    ws2812.pixels_touched(0, len(table))
+
+
+load()
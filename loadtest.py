@@ -0,0 +1,262 @@
+# Host-side load test of webserver.handle_client under CPython.
+#
+#   python3 loadtest.py --clients 12 --seconds 10 --mix state=6,set=2,fill=1,range=1
+#   python3 loadtest.py --out after.json --compare before.json
+#
+# Runs the real request path (parser, router, middleware, command queue)
+# against in-memory streams, with hostshim standing in for the hardware.
+# Each simulated browser polls and posts according to the mix, with a
+# random think time between requests, while rainbow_effect runs alongside
+# under webserver.effects, as it would on the tree. A set, fill or range
+# stops it just as on the device; it is started again on the next check
+# so there is a frame rate to measure, and the report counts how often
+# that happened.
+# The report covers latency percentiles per request type, status counts,
+# peak traced heap and the rainbow frame rate with and without the load,
+# with the frames lost to those interruptions included in the loaded rate.
+# Absolute numbers are host numbers; compare runs of different builds made
+# on the same machine.
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+import tracemalloc
+
+import hostshim
+
+hostshim.install()
+
+import commands   # noqa: E402
+import metrics    # noqa: E402
+import webserver  # noqa: E402
+
+MSS = 536  # bytes handed over per read, like a small TCP segment
+
+
+class Reader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+
+    async def readinto(self, buf):
+        await asyncio.sleep(0)
+        n = min(len(buf), len(self.data), MSS)
+        buf[:n] = self.data[:n]
+        self.data = self.data[n:]
+        return n
+
+
+class Writer:
+    def __init__(self, address):
+        self.address = address
+        self.first = None
+        self.sent = 0
+
+    def write(self, data):
+        if self.first is None:
+            self.first = data
+        self.sent += len(data)
+
+    async def drain(self):
+        await asyncio.sleep(0)
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+    def get_extra_info(self, name):
+        return (self.address, 50000)
+
+    def status(self):
+        if not self.first:
+            return 0
+        line = self.first if isinstance(self.first, str) else bytes(self.first).decode()
+        return int(line.split()[1])
+
+
+def control(action, data):
+    body = json.dumps({'action': action, 'data': data, 'brightness': 128}).encode()
+    return (b'POST /control HTTP/1.1\r\nHost: tree\r\nContent-Type: application/json\r\n'
+            b'Content-Length: %d\r\n\r\n' % len(body)) + body
+
+
+def build(op, rng, num_leds):
+    colour = '#%06x' % rng.randrange(0x1000000)
+    if op == 'state':
+        return b'GET /state HTTP/1.1\r\nHost: tree\r\n\r\n'
+    if op == 'page':
+        return b'GET / HTTP/1.1\r\nHost: tree\r\nAccept: text/html\r\n\r\n'
+    if op == 'metrics':
+        return b'GET /metrics HTTP/1.1\r\nHost: tree\r\n\r\n'
+    if op == 'set':
+        return control('set', {'index': rng.randrange(num_leds), 'color': colour})
+    if op == 'fill':
+        return control('fill', {'color': colour})
+    if op == 'range':
+        start = rng.randrange(num_leds)
+        return control('range', {'start': start, 'end': min(start + rng.randrange(1, 40), num_leds - 1),
+                                 'color': colour})
+    raise ValueError('unknown op ' + op)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, weight = part.split('=')
+        mix[name] = float(weight)
+    return mix
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def at(p):
+        return round(ordered[min(int(p * len(ordered)), len(ordered) - 1)] * 1000, 3)
+
+    return {'count': len(ordered), 'p50_ms': at(0.5), 'p90_ms': at(0.9), 'p99_ms': at(0.99),
+            'max_ms': round(ordered[-1] * 1000, 3)}
+
+
+async def browser(n, args, mix, stop_at, latencies, statuses):
+    rng = random.Random(args.seed * 1000 + n)
+    address = '10.0.0.{}'.format(n + 1)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.perf_counter() < stop_at:
+        op = rng.choices(names, weights)[0]
+        writer = Writer(address)
+        started = time.perf_counter()
+        await webserver.handle_client(Reader(build(op, rng, webserver.ws2812.NUM_LEDS)), writer)
+        latencies.setdefault(op, []).append(time.perf_counter() - started)
+        status = writer.status()
+        statuses[status] = statuses.get(status, 0) + 1
+        await asyncio.sleep(args.think_ms / 1000 * rng.uniform(0.5, 1.5))
+
+
+RESTART_CHECK_S = 0.05
+
+
+async def rainbow(restarts):
+    # restarts counts the effect being stopped by a command, and running to its end
+    effects = webserver.effects
+    await effects.start('rainbow', webserver.rainbow_effect(128))
+    while True:
+        await asyncio.sleep(RESTART_CHECK_S)
+        if effects.running():
+            continue
+        restarts['interrupted' if effects.name is None else 'finished'] += 1
+        await effects.start('rainbow', webserver.rainbow_effect(128))
+
+
+async def frame_rate(seconds):
+    frames = metrics.FRAME_BUILD.count
+    await asyncio.sleep(seconds)
+    return (metrics.FRAME_BUILD.count - frames) / seconds
+
+
+async def run(args, mix):
+    tracemalloc.start()
+    queue = asyncio.create_task(commands.run(webserver.apply_command, webserver.ws2812.pixels_show))
+    restarts = {'interrupted': 0, 'finished': 0}
+    effect = asyncio.create_task(rainbow(restarts))
+
+    baseline_fps = await frame_rate(args.baseline)
+    tracemalloc.reset_peak()
+    baseline_restarts = dict(restarts)
+
+    latencies = {}
+    statuses = {}
+    stop_at = time.perf_counter() + args.seconds
+    clients = [asyncio.create_task(browser(n, args, mix, stop_at, latencies, statuses)) for n in range(args.clients)]
+    loaded_fps = await frame_rate(args.seconds)
+    await asyncio.gather(*clients)
+    peak = tracemalloc.get_traced_memory()[1]
+
+    for task in (queue, effect):
+        task.cancel()
+    await webserver.effects.stop()
+    total = sum(statuses.values())
+    errors = sum(count for status, count in statuses.items() if not 200 <= status < 300)
+    return {
+        'latency': {op: percentiles(samples) for op, samples in latencies.items()},
+        'all': percentiles([s for samples in latencies.values() for s in samples]),
+        'requests': total,
+        'requests_per_s': round(total / args.seconds, 1),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'error_rate': round(errors / total, 4) if total else None,
+        'peak_heap_bytes': peak,
+        'rainbow_fps': {'baseline': round(baseline_fps, 1), 'loaded': round(loaded_fps, 1),
+                        'impact': round(1 - loaded_fps / baseline_fps, 3) if baseline_fps else None,
+                        'interrupted_under_load': restarts['interrupted'] - baseline_restarts['interrupted'],
+                        'finished_under_load': restarts['finished'] - baseline_restarts['finished']},
+        'commands': commands.stats(),
+        'command_latency_ms': {
+            'avg': round(metrics.COMMAND_LATENCY.total_us / metrics.COMMAND_LATENCY.count / 1000, 3)
+            if metrics.COMMAND_LATENCY.count else None,
+            'recent_max': metrics.COMMAND_LATENCY.recent_max_us() / 1000,
+        },
+    }
+
+
+def build_id():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(new, old):
+    def row(name, a, b):
+        if a is None or b is None:
+            return
+        change = (b - a) / a * 100 if a else 0
+        print(f'{name:28} {a:>12} {b:>12} {change:+7.1f}%')
+
+    print(f'{"":28} {old["build"] or "old":>12} {new["build"] or "new":>12}')
+    for key in ('p50_ms', 'p90_ms', 'p99_ms', 'max_ms'):
+        row('latency ' + key, old['results']['all'][key], new['results']['all'][key])
+    row('requests_per_s', old['results']['requests_per_s'], new['results']['requests_per_s'])
+    row('error_rate', old['results']['error_rate'], new['results']['error_rate'])
+    row('peak_heap_bytes', old['results']['peak_heap_bytes'], new['results']['peak_heap_bytes'])
+    row('rainbow fps loaded', old['results']['rainbow_fps']['loaded'], new['results']['rainbow_fps']['loaded'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test webserver.handle_client with simulated browsers')
+    parser.add_argument('--clients', type=int, default=12)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--baseline', type=float, default=3, help='seconds of rainbow alone before the load')
+    parser.add_argument('--mix', default='state=6,set=2,fill=1,range=1',
+                        help='op=weight pairs; ops are state, page, metrics, set, fill, range')
+    parser.add_argument('--think-ms', type=float, default=200, help='mean pause between a browser\'s requests')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default='loadtest.json', help='where to save the results')
+    parser.add_argument('--compare', metavar='JSON', help='earlier results to compare against')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+    for op in mix:
+        build(op, random.Random(), 1)  # reject unknown ops before starting
+
+    report = {
+        'build': build_id(),
+        'args': vars(args),
+        'results': asyncio.run(run(args, mix)),
+    }
+    print(json.dumps(report['results'], indent=2))
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Saved', args.out)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
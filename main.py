@@ -38,9 +38,7 @@ def setpixel(a,b):
 
 
 def fillrange(a,b,c):
-    while a <= b:
-        ws2812.pixels_set(a,c)
-        a=a+1
+    ws2812.pixels_fill_range(a,b+1,c)
     
 
 # async def main1(a,b,c):
@@ -0,0 +1,136 @@
+# Planned garbage collection and heap telemetry.
+#
+# Left alone, MicroPython collects whenever an allocation runs short, which
+# tends to be mid-frame or halfway through building the web page. Instead
+# frame_shown() runs right after each frame push, while the effect is about
+# to sleep out the rest of its frame budget, and collects there once half
+# of gc.threshold has been allocated. The threshold follows the measured
+# allocation rate, so the allocator's own collection only fires when no
+# frames are being shown. run() covers that case, samples the heap and
+# turns load shedding on when the largest free block gets too small.
+
+import array
+import gc
+import uasyncio
+import utime
+import metrics
+import ws2812
+
+SAMPLE_MS = 10000
+HISTORY = 32
+MIN_THRESHOLD = 4096
+THRESHOLD_WINDOW_MS = 1000  # let about this much allocation build up between collections
+PROBE_STEP = 1024           # precision of the largest-block search
+
+# webpage() builds a ~25 KB string; below this the next page load could fail
+SHED_BELOW_BYTES = 32768
+RECOVER_ABOVE_BYTES = 49152
+
+threshold = MIN_THRESHOLD
+alloc_rate = 0      # bytes per second, smoothed
+after_collect = 0   # gc.mem_alloc() right after the last planned collection
+collected_at = 0
+collections = 0
+
+largest = 0
+free_history = array.array("I", [0] * HISTORY)
+largest_history = array.array("I", [0] * HISTORY)
+samples = 0
+
+shedding = False
+shed = 0            # connections refused while shedding
+
+
+def collect():
+    global after_collect, collected_at, collections
+    t0 = utime.ticks_us()
+    gc.collect()
+    metrics.GC_COLLECT.since(t0)
+    after_collect = gc.mem_alloc()
+    collected_at = utime.ticks_ms()
+    collections += 1
+
+
+def _retune(allocated):
+    global alloc_rate, threshold
+    elapsed = utime.ticks_diff(utime.ticks_ms(), collected_at)
+    if elapsed > 0:
+        alloc_rate = (alloc_rate * 3 + allocated * 1000 // elapsed) // 4
+    threshold = max(MIN_THRESHOLD, min(alloc_rate * THRESHOLD_WINDOW_MS // 1000, gc.mem_free() // 2))
+    gc.threshold(threshold)
+
+
+def _maybe_collect():
+    global after_collect
+    allocated = gc.mem_alloc() - after_collect
+    if allocated < 0:
+        # the allocator collected on its own; measure from here
+        after_collect = gc.mem_alloc()
+    elif allocated >= threshold // 2:
+        _retune(allocated)
+        collect()
+
+
+def frame_shown():
+    _maybe_collect()
+
+
+def largest_block():
+    """Largest single allocation that would succeed now, found by bisection"""
+    low, high = 0, gc.mem_free()
+    while high - low > PROBE_STEP:
+        middle = (low + high) // 2
+        try:
+            bytearray(middle)
+        except MemoryError:
+            high = middle
+            continue
+        low = middle
+        gc.collect()  # the probe is garbage; free it before trying a larger one
+    return low
+
+
+def sample():
+    global largest, samples, shedding
+    collect()
+    largest = largest_block()
+    free_history[samples % HISTORY] = gc.mem_free()
+    largest_history[samples % HISTORY] = largest
+    samples += 1
+
+    if not shedding and largest < SHED_BELOW_BYTES:
+        shedding = True
+        metrics.warning('Heap fragmented, largest block', largest, '- refusing connections')
+    elif shedding and largest >= RECOVER_ABOVE_BYTES:
+        shedding = False
+        metrics.info('Heap recovered, largest block', largest)
+
+
+async def run():
+    """Background task: collects when no frames are shown and samples the heap"""
+    gc.threshold(threshold)
+    while True:
+        await uasyncio.sleep_ms(SAMPLE_MS)
+        _maybe_collect()
+        sample()
+
+
+def stats():
+    count = min(samples, HISTORY)
+    order = [(samples - count + i) % HISTORY for i in range(count)]
+    return {
+        'free': gc.mem_free(),
+        'allocated': gc.mem_alloc(),
+        'largest_block': largest,
+        'fragmentation': 1 - largest / max(free_history[(samples - 1) % HISTORY], 1) if samples else None,
+        'threshold': threshold,
+        'alloc_rate': alloc_rate,
+        'collections': collections,
+        'shedding': shedding,
+        'shed': shed,
+        'free_history': [free_history[i] for i in order],
+        'largest_history': [largest_history[i] for i in order],
+    }
+
+
+ws2812.show_listeners.append(frame_shown)
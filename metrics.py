@@ -0,0 +1,142 @@
+# On-device timing and a log-level gate.
+#
+# Hot paths take utime.ticks_us() before the work and call since() on one of
+# the timers below afterwards; that is a subtraction, a ring buffer store and
+# a short bucket scan, with no allocation. GET /metrics renders the
+# cumulative histograms in Prometheus text format, plus the largest of the
+# last RING_SIZE samples so a recent spike stays visible.
+#
+# debug() and friends take print()-style arguments and drop them unless the
+# configured log_level lets them through. Pass values as separate arguments
+# rather than a formatted string, so nothing is built for a dropped line.
+
+import array
+import utime
+import config
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+
+PREFIX = "lights_"
+RING_SIZE = 32  # power of two
+RING_MASK = RING_SIZE - 1
+
+# histogram bucket upper bounds in us; samples above the last go to +Inf
+BUCKETS_US = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+BUCKET_LABELS = tuple('{}'.format(b / 1000000) for b in BUCKETS_US) + ('+Inf',)
+
+level = INFO
+
+
+def configure(cfg):
+    global level
+    level = LEVELS[cfg.log_level]
+
+
+def debug(*args):
+    if level <= DEBUG:
+        print(*args)
+
+
+def info(*args):
+    if level <= INFO:
+        print(*args)
+
+
+def warning(*args):
+    if level <= WARNING:
+        print(*args)
+
+
+def error(*args):
+    if level <= ERROR:
+        print(*args)
+
+
+now = utime.ticks_us
+
+
+class Timer:
+    __slots__ = ('name', 'help', 'recent', 'count', 'total_us', 'buckets')
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.recent = array.array("I", [0] * RING_SIZE)
+        self.count = 0
+        self.total_us = 0
+        self.buckets = array.array("I", [0] * (len(BUCKETS_US) + 1))
+
+    def since(self, started_us):
+        """Record the time from started_us (a utime.ticks_us() value) until now"""
+        self.record(utime.ticks_diff(utime.ticks_us(), started_us))
+
+    def record(self, us):
+        self.recent[self.count & RING_MASK] = us
+        self.count += 1
+        self.total_us += us
+        bucket = 0
+        for bound in BUCKETS_US:
+            if us <= bound:
+                break
+            bucket += 1
+        self.buckets[bucket] += 1
+
+    def recent_max_us(self):
+        return max(self.recent[:min(self.count, RING_SIZE)]) if self.count else 0
+
+
+timers = []
+
+
+def timer(name, help):
+    t = Timer(name, help)
+    timers.append(t)
+    return t
+
+
+FRAME_BUILD = timer('frame_build', 'Rendering one frame into the buffer')
+FRAME_LIMIT = timer('frame_limit', 'Power limiting and colour correction in pixels_show')
+PIO_PUSH = timer('pio_push', 'Writing a frame to the PIO FIFOs')
+HTTP_PARSE = timer('http_parse', 'Reading and parsing a request')
+HTTP_RESPOND = timer('http_respond', 'Handling a parsed request and writing the response')
+LCD_WRITE = timer('lcd_write', 'Writing a message to the LCD')
+GC_COLLECT = timer('gc_collect', 'Planned garbage collections')
+FRAME_BUSY = timer('frame_busy', 'Time per animation frame not spent sleeping, as seen by the governor')
+COMMAND_LATENCY = timer('command_latency', 'From a /control request to the command being applied')
+
+
+def prometheus(extra=None):
+    """Lines of Prometheus text exposition for every timer, plus extra as {name: (type, help, value)}
+
+    value may also be a dict from a label string such as 'path="/"' to a value.
+    """
+    lines = []
+    for t in timers:
+        metric = PREFIX + t.name + '_seconds'
+        lines.append('# HELP {} {}'.format(metric, t.help))
+        lines.append('# TYPE {} histogram'.format(metric))
+        cumulative = 0
+        for label, count in zip(BUCKET_LABELS, t.buckets):
+            cumulative += count
+            lines.append('{}_bucket{{le="{}"}} {}'.format(metric, label, cumulative))
+        lines.append('{}_sum {}'.format(metric, t.total_us / 1000000))
+        lines.append('{}_count {}'.format(metric, t.count))
+        lines.append('# TYPE {}{}_recent_max_seconds gauge'.format(PREFIX, t.name))
+        lines.append('{}{}_recent_max_seconds {}'.format(PREFIX, t.name, t.recent_max_us() / 1000000))
+    if extra:
+        for name, (kind, help, value) in extra.items():
+            lines.append('# HELP {}{} {}'.format(PREFIX, name, help))
+            lines.append('# TYPE {}{} {}'.format(PREFIX, name, kind))
+            if isinstance(value, dict):
+                for labels, count in value.items():
+                    lines.append('{}{}{{{}}} {}'.format(PREFIX, name, labels, count))
+            else:
+                lines.append('{}{} {}'.format(PREFIX, name, value))
+    return lines
+
+
+configure(config.current)
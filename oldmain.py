@@ -5,6 +5,9 @@ import uasyncio
 import machine
 import utime
 import LCD1602
+import config
+import buttons
+import supervisor
 from micropython import const
 
 # mock class should the LCD not be detected
@@ -26,19 +29,19 @@ BLACK = (0, 0, 0)
 LED_PIN = const(17)
 LED_DUTY_CYCLE = const(5000)  # PWM rate, out of 65535
 
-buttons = []
-buttons.append(machine.Pin(21, machine.Pin.IN, machine.Pin.PULL_UP))
-buttons.append(machine.Pin(20, machine.Pin.IN, machine.Pin.PULL_UP))
-buttons.append(machine.Pin(19, machine.Pin.IN, machine.Pin.PULL_UP))
-buttons.append(machine.Pin(18, machine.Pin.IN, machine.Pin.PULL_UP))
+BUTTON_BLANK = const(0)
+BUTTON_COLOUR = const(1)
+BUTTON_START = const(2)
+BUTTON_NEXT = const(3)
+
+# each button is debounced on its own, and reports as soon as it goes down
+inputs = buttons.Buttons(config.current.button_pins, debounce_ms=50)
 
 print("Starting")
 # led = machine.Pin(LED_PIN, machine.Pin.OUT)
 led = machine.PWM(machine.Pin(LED_PIN, machine.Pin.OUT))
 led.freq(5000)
 
-debounce_ms = const(1000)
-
 machine.freq(180000000)
 
 
@@ -47,7 +50,7 @@ async def blank():
         lcd.print_lcd("ALL OFF")
         print("blanking")
         ws2812.pixels_fill(BLACK)
-        await ws2812.pixels_show()
+        ws2812.pixels_show()
     except uasyncio.CancelledError:
         pass
 
@@ -100,48 +103,34 @@ next_button_pressed = uasyncio.Event()
 async def main():
     lcd.print_lcd("Starting")
     print("Starting loop")
-    pressed = utime.ticks_ms()
-    running_task = uasyncio.create_task(blank())
+    effects = supervisor.Supervisor()
+    await effects.start("blank", blank())
     uasyncio.create_task(led_flash())
+    uasyncio.create_task(inputs.run())
     while True:
+        button, _ = await inputs.event()
 
         # Blank all lights
-        if not buttons[0].value() and utime.ticks_diff(utime.ticks_ms(), pressed) > debounce_ms:
+        if button == BUTTON_BLANK:
             print("button 1")
-            pressed=utime.ticks_ms()
-            if running_task:
-                print("cancelling existing")
-                running_task.cancel()
-                await running_task
-                print("cancelled existing")
             next_button_pressed.clear()
-            running_task = uasyncio.create_task(blank())
+            await effects.start("blank", blank())
 
         # Change colour
-        if not buttons[1].value() and utime.ticks_diff(utime.ticks_ms(), pressed) > debounce_ms:
+        elif button == BUTTON_COLOUR:
             print("button 4 - switch colour")
-            pressed=utime.ticks_ms()
             ws2812.TWINKLE_COLOUR = (ws2812.TWINKLE_COLOUR + 1) % len(ws2812.TWINKLE_COLOURS_RED)
 
         # set Next event trigger
-        if not buttons[3].value() and utime.ticks_diff(utime.ticks_ms(), pressed) > debounce_ms:
+        elif button == BUTTON_NEXT:
             print("next button pressed")
-            pressed=utime.ticks_ms()
             next_button_pressed.set()
 
         # Start sequence
-        if not buttons[2].value() and utime.ticks_diff(utime.ticks_ms(), pressed) > debounce_ms:
+        elif button == BUTTON_START:
             print("button 3")
-            pressed=utime.ticks_ms()
-            if running_task:
-                print("cancelling existing")
-                running_task.cancel()
-                await running_task
-                print("cancelled existing")
             next_button_pressed.clear()
-            running_task = uasyncio.create_task(twinkling_only())
-
-        await uasyncio.sleep(0)
+            await effects.start("twinkling only", twinkling_only())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,208 @@
+# Colour correction for the output stage: gamma, white balance, dithering.
+#
+# Effects compute linear 8-bit colours. On their way out, pixels_show runs
+# each channel through a 256-entry table with the gamma curve, that
+# channel's white balance and the power limiter's scale folded in. The
+# tables give 8.8 fixed point values. With dithering on, each LED keeps
+# the fraction it dropped last frame and adds it to the next, so over a
+# few frames a level between two 8-bit steps averages out right. That is
+# what smooths the bottom of the range, where gamma leaves only a handful
+# of steps. The tables are rebuilt only when a setting or the power scale
+# changes; a frame costs three lookups per LED. render() also adds up the
+# channels it writes, so the power limiter can estimate from the values
+# that actually reach the strip rather than from the uncorrected frame.
+#
+# With render_bits 16 the fades keep 16 bits per channel in ws2812.fine,
+# and this stage reads them instead of the 8-bit frame. It interpolates
+# between table entries and quantises with the same carried fractions, so
+# a slow fade of a dim LED moves in steps far finer than one 8-bit level.
+#
+# With gamma 1.0, full white balance, no dithering and 8-bit rendering
+# the stage is off and frames go out exactly as before. benchmark() times
+# the stage on the device, from the REPL: import output; output.benchmark()
+
+import array
+import micropython
+import utime
+import config
+import governor
+
+gamma = 1.0
+white_balance = (255, 255, 255)
+dither = False
+fine = False         # frames come with 16 bits per channel, see ws2812.pixels_set_scaled
+active = False
+
+curve = array.array("H", [0 for _ in range(256)])  # the gamma curve alone, 0..0xFF00, rebuilt by configure()
+# red, green, blue, in 8.8; entry 256 repeats 255 so a 16-bit input can interpolate to the top
+tables = tuple(array.array("H", [0 for _ in range(257)]) for _ in range(3))
+built_scale = None   # power scale the tables were built for, None when stale
+rebuilds = 0
+
+residual = bytearray()  # per LED and channel, the fraction carried to the next frame
+
+
+def configure(cfg, num_leds):
+    global gamma, white_balance, dither, fine, active, built_scale, residual
+    gamma = cfg.gamma
+    white_balance = tuple(cfg.white_balance)
+    dither = cfg.dither
+    fine = cfg.render_bits == 16
+    active = gamma != 1.0 or white_balance != (255, 255, 255) or dither or fine
+    for value in range(256):
+        curve[value] = int(0xFF00 * (value / 255) ** gamma + 0.5)
+    built_scale = None
+    if len(residual) != 3 * num_leds:
+        residual = bytearray(3 * num_leds)
+
+
+def _build(scale):
+    """Fill the tables for a power scale out of 256"""
+    global built_scale, rebuilds
+    # the curve tops out at 255.0 in 8.8, so a value plus its carried fraction never passes 0xFFFF
+    for table, balance in zip(tables, white_balance):
+        factor = balance * scale
+        for value in range(256):
+            table[value] = curve[value] * factor // (255 * 256)
+        table[256] = table[255]
+    built_scale = scale
+    rebuilds += 1
+
+
+def render(src, dst, num_leds, scale, wide=None):
+    """Write the corrected frame src into dst, with the power scale (out of 256) applied
+
+    wide is the 16-bit copy of the frame when render_bits is 16. Returns the
+    sum of every channel written, which is what the power estimate needs.
+    """
+    if scale != built_scale:
+        _build(scale)
+    # under load the governor drops dithering first; the carried fractions just wait
+    dithered = dither and governor.dithering()
+    if wide is not None:
+        return _wide(src, wide, dst, num_leds, tables[0], tables[1], tables[2], residual, dithered)
+    if dithered:
+        return _dithered(src, dst, num_leds, tables[0], tables[1], tables[2], residual)
+    return _rounded(src, dst, num_leds, tables[0], tables[1], tables[2])
+
+
+@micropython.native
+def _rounded(src, dst, num_leds, rt, gt, bt):
+    total = 0
+    for i in range(num_leds):
+        c = src[i]
+        r = (rt[c >> 16] + 0x80) >> 8
+        g = (gt[(c >> 8) & 0xFF] + 0x80) >> 8
+        b = (bt[c & 0xFF] + 0x80) >> 8
+        dst[i] = (r << 16) | (g << 8) | b
+        total += r + g + b
+    return total
+
+
+@micropython.native
+def _dithered(src, dst, num_leds, rt, gt, bt, carry):
+    total = 0
+    j = 0
+    for i in range(num_leds):
+        c = src[i]
+        r = rt[c >> 16] + carry[j]
+        g = gt[(c >> 8) & 0xFF] + carry[j + 1]
+        b = bt[c & 0xFF] + carry[j + 2]
+        carry[j] = r & 0xFF
+        carry[j + 1] = g & 0xFF
+        carry[j + 2] = b & 0xFF
+        dst[i] = ((r >> 8) << 16) | ((g >> 8) << 8) | (b >> 8)
+        total += (r >> 8) + (g >> 8) + (b >> 8)
+        j += 3
+    return total
+
+
+@micropython.native
+def _wide(src, wide, dst, num_leds, rt, gt, bt, carry, dither):
+    # a 16-bit channel whose top byte no longer matches src was rewritten at 8 bits since
+    total = 0
+    j = 0
+    for i in range(num_leds):
+        c = src[i]
+        packed = 0
+        for k in range(3):
+            v = (c >> (16 - 8 * k)) & 0xFF
+            w = wide[j + k]
+            if w >> 8 != v:
+                w = v * 257
+            table = rt if k == 0 else gt if k == 1 else bt
+            hi = w >> 8
+            low = table[hi]
+            x = low + (((table[hi + 1] - low) * (w & 0xFF)) >> 8)
+            if dither:
+                x += carry[j + k]
+                carry[j + k] = x & 0xFF
+                x >>= 8
+            else:
+                x = (x + 0x80) >> 8
+            packed = (packed << 8) | x
+            total += x
+        dst[i] = packed
+        j += 3
+    return total
+
+
+def _limit_copy(src, dst, num_leds, lut):
+    # the copy pixels_show makes when only the power limiter is on, for reference
+    for i in range(num_leds):
+        c = src[i]
+        dst[i] = (lut[c >> 16] << 16) + (lut[(c >> 8) & 0xFF] << 8) + lut[c & 0xFF]
+
+
+def benchmark(frames=100, gamma_value=2.2):
+    """Time render() per frame on the device at the configured LED count
+
+    Works on its own buffers, so the tree keeps showing what it was.
+    """
+    num_leds = config.current.num_leds
+    src = array.array("I", [(i * 7 & 0xFF) << 16 | (i * 13 & 0xFF) << 8 | (i * 29 & 0xFF) for i in range(num_leds)])
+    dst = array.array("I", [0 for _ in range(num_leds)])
+    wide = array.array("H", [((src[i // 3] >> (16 - 8 * (i % 3))) & 0xFF) << 8 | (i & 0xFF) for i in range(3 * num_leds)])
+    lut = bytearray(range(256))
+    balance = [255, 200, 170]
+    cases = (
+        ('gamma + balance', {'gamma': gamma_value, 'white_balance': balance}),
+        ('gamma + balance + dither', {'gamma': gamma_value, 'white_balance': balance, 'dither': True}),
+        ('16-bit + dither', {'render_bits': 16, 'dither': True}),
+        ('16-bit + gamma + dither', {'gamma': gamma_value, 'white_balance': balance, 'render_bits': 16, 'dither': True}),
+    )
+    budget_us = governor.budget_ms * 1000
+    level = governor.level
+    governor.level = 0  # time the dithered cases with dithering on
+    try:
+        start = utime.ticks_us()
+        for _ in range(frames):
+            _limit_copy(src, dst, num_leds, lut)
+        reference = utime.ticks_diff(utime.ticks_us(), start) // frames
+        print(f'{"power limit copy":26s} {reference:6d} us/frame  (the plain path pushes the frame as is)')
+        for name, changes in cases:
+            cfg = config.Config()
+            cfg.update(changes)
+            configure(cfg, num_leds)
+            extra = wide if fine else None
+            render(src, dst, num_leds, 256, extra)  # build the tables outside the timing
+            start = utime.ticks_us()
+            for _ in range(frames):
+                render(src, dst, num_leds, 256, extra)
+            took = utime.ticks_diff(utime.ticks_us(), start) // frames
+            print(f'{name:26s} {took:6d} us/frame  {took * 100 // budget_us:3d}% of the {budget_us} us budget')
+    finally:
+        governor.level = level
+        configure(config.current, num_leds)
+    print(f'{num_leds} LEDs, {frames} frames each')
+
+
+def stats():
+    return {
+        'active': active,
+        'gamma': gamma,
+        'white_balance': list(white_balance),
+        'dither': dither,
+        'render_bits': 16 if fine else 8,
+        'table_rebuilds': rebuilds,
+    }
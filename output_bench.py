@@ -0,0 +1,128 @@
+# Host-side benchmark of the colour correction stage in output.py.
+#
+#   python3 output_bench.py                 # cost per pixels_show, plain vs corrected
+#   python3 output_bench.py --gamma 2.5 --frames 64
+#
+# Times pixels_show on a full frame with the output stage off, with gamma
+# and white balance, and with dithering as well, and prints the extra cost
+# over the plain path. It then checks the dithering: a slow fade at the
+# bottom of the range is pushed frame by frame, and the average of what
+# reached the LEDs is compared with the exact gamma-corrected level. With
+# rounding alone the low levels collapse onto a few steps; dithered, the
+# average should land within a small fraction of a step. Last, a slow fade
+# of a dim LED, the way fadeout draws it, is rendered at 8 and at 16 bits,
+# measuring how far an 8-frame average of the output strays from the exact
+# fade.
+# The timings are host times only, useful for spotting a regression
+# between versions and nothing more: on the host the PIO put is a stub and
+# @micropython.native does nothing, so neither the absolute numbers nor
+# the ratios say what a frame costs on the Pico. For that, run
+# output.benchmark() on the device.
+
+import argparse
+import time
+
+import hostshim
+
+hostshim.install()
+
+import config   # noqa: E402
+import output   # noqa: E402
+import ws2812   # noqa: E402
+
+BALANCE = [255, 200, 170]
+
+
+def cases(gamma):
+    return (
+        ('plain', {}),
+        ('gamma + balance', {'gamma': gamma, 'white_balance': BALANCE}),
+        ('gamma + balance + dither', {'gamma': gamma, 'white_balance': BALANCE, 'dither': True}),
+        ('16-bit + dither', {'render_bits': 16, 'dither': True}),
+        ('16-bit + gamma + dither', {'gamma': gamma, 'white_balance': BALANCE, 'render_bits': 16, 'dither': True}),
+    )
+
+
+def settings(changes):
+    values = {'gamma': 1.0, 'white_balance': [255, 255, 255], 'dither': False, 'render_bits': 8}
+    values.update(changes)
+    config.current.update(values)
+    ws2812.configure(config.current)
+
+
+def fill_frame():
+    for i in range(ws2812.NUM_LEDS):
+        ws2812.pixels_set_scaled(i, (i * 7 & 0xFF, i * 13 & 0xFF, i * 29 & 0xFF), 2 * i + 1, 2 * ws2812.NUM_LEDS)
+
+
+def benchmark(gamma, seconds):
+    plain = None
+    for name, changes in cases(gamma):
+        settings(changes)
+        fill_frame()
+        shows = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            ws2812.pixels_set(shows % ws2812.NUM_LEDS, (shows & 0xFF, 0, 0))  # keep the frame dirty
+            ws2812.pixels_show()
+            shows += 1
+        us = (time.perf_counter() - started) / shows * 1000000
+        if plain is None:
+            plain = us
+        print(f'{name:26} {us:9.1f} us/frame  {us - plain:+8.1f} us over plain  ({ws2812.NUM_LEDS} LEDs)')
+
+
+def accuracy(gamma, frames):
+    print(f'\nLow-end levels over {frames} frames, gamma {gamma} (exact, rounded, dithered average):')
+    worst = {'rounded': 0.0, 'dithered': 0.0}
+    for level in (1, 2, 4, 8, 16, 24, 30, 40):
+        exact = 255 * (level / 255) ** gamma
+        result = {}
+        for name, dither in (('rounded', False), ('dithered', True)):
+            settings({'gamma': gamma, 'dither': dither})
+            ws2812.pixels_fill((level, level, level))
+            total = 0
+            for _ in range(frames):
+                ws2812.pixels_show()
+                total += ws2812.out[0] & 0xFF
+            result[name] = total / frames
+            worst[name] = max(worst[name], abs(result[name] - exact))
+        print(f'  {level:3} -> {exact:7.3f}  {result["rounded"]:7.3f}  {result["dithered"]:7.3f}')
+    print(f'worst error in 8-bit steps: rounded {worst["rounded"]:.3f}, dithered {worst["dithered"]:.3f}')
+
+
+def fade(frames):
+    print(f'\nFadeout of a dim cherry LED (brightness 30) over {frames} frames, red channel:')
+    red = ws2812.CHERRY_RED
+    steps = 1000
+    for name, changes in (('8-bit', {}), ('16-bit + dither', {'render_bits': 16, 'dither': True})):
+        settings(changes)
+        shown = []
+        exact = []
+        for f in range(frames):
+            remaining = steps - steps * f // frames
+            ws2812.pixels_set_scaled(0, (red, 0, 0), 30 * remaining, 255 * steps)
+            ws2812.pixels_show()
+            shown.append(ws2812.shown()[0] >> 16)
+            exact.append(red * 30 * remaining / (255 * steps))
+        window = 8
+        error = max(abs(sum(shown[k:k + window]) - sum(exact[k:k + window])) / window
+                    for k in range(frames - window))
+        print(f'  {name:16} worst 8-frame average error {error:.3f} steps')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark and check the output colour correction')
+    parser.add_argument('--gamma', type=float, default=2.2)
+    parser.add_argument('--seconds', type=float, default=1, help='time per benchmark case')
+    parser.add_argument('--frames', type=int, default=256, help='frames averaged per dither level')
+    args = parser.parse_args()
+    benchmark(args.gamma, args.seconds)
+    accuracy(args.gamma, args.frames)
+    fade(args.frames)
+    settings({})
+    print('table rebuilds:', output.rebuilds)
+
+
+if __name__ == '__main__':
+    main()
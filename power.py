@@ -0,0 +1,92 @@
+# Supply current estimate and limiter for the output stage.
+#
+# ws2812 keeps a running total of every channel value in the frame, updated
+# as pixels are written, so estimating a frame's current is a multiply and
+# a divide rather than a rescan. When the estimate goes over the budget the
+# frame is scaled down on its way out through a 256-entry lookup table; the
+# frame buffer itself is left alone. With colour correction on, gamma and
+# white balance make the strip draw far less than the frame's values
+# suggest, so limit_output() estimates from the corrected channels instead
+# and the scale is folded into output's tables.
+
+IDLE_MA_PER_LED = 1    # a dark WS2812 still draws about 1 mA
+SCALE_STEP = 4         # quantise the scale so the table isn't rebuilt every frame
+
+budget_ma = 8000
+ma_per_channel = 20    # one channel at 255
+
+estimate_ma = 0
+peak_ma = 0
+scale = 256            # out of 256; 256 means no limiting
+limited_frames = 0
+lut = bytearray(range(256))
+
+
+def configure(cfg):
+    global budget_ma, ma_per_channel
+    budget_ma = cfg.power_budget_ma
+    ma_per_channel = cfg.power_ma_per_channel
+
+
+def estimate(channel_total, num_leds):
+    """Estimated supply current in mA for a frame whose channel values add up to channel_total"""
+    return channel_total * ma_per_channel // 255 + num_leds * IDLE_MA_PER_LED
+
+
+def _fit(frame_ma, num_leds):
+    # scale out of 256 that brings a frame estimated at frame_ma within the budget
+    if frame_ma <= budget_ma:
+        return 256
+    # only the lit part of the current scales with the colour values
+    idle_ma = num_leds * IDLE_MA_PER_LED
+    wanted = max(budget_ma - idle_ma, 0) * 256 // (frame_ma - idle_ma)
+    return wanted - wanted % SCALE_STEP
+
+
+def limit(channel_total, num_leds):
+    """Estimate this frame; returns the scaling table to apply, or None when it is within budget"""
+    global estimate_ma, peak_ma, scale, limited_frames
+
+    estimate_ma = estimate(channel_total, num_leds)
+    peak_ma = max(peak_ma, estimate_ma)
+    wanted = _fit(estimate_ma, num_leds)
+    if wanted == 256:
+        scale = 256
+        return None
+
+    if wanted != scale:
+        scale = wanted
+        for value in range(256):
+            lut[value] = value * wanted >> 8
+    limited_frames += 1
+    return lut
+
+
+def limit_output(output_total, rendered_scale, channel_total, num_leds):
+    """Scale for a colour-corrected frame whose channels, rendered at rendered_scale, add up to output_total
+
+    The estimate is for the frame unscaled. channel_total, from before the
+    correction and never lower, stands in when a scale of 0 left nothing to
+    measure.
+    """
+    global estimate_ma, peak_ma, scale, limited_frames
+    if rendered_scale:
+        estimate_ma = estimate(output_total * 256 // rendered_scale, num_leds)
+    else:
+        estimate_ma = estimate(channel_total, num_leds)
+    peak_ma = max(peak_ma, estimate_ma)
+    scale = _fit(estimate_ma, num_leds)
+    if scale < 256:
+        limited_frames += 1
+    return scale
+
+
+def stats():
+    return {
+        'estimate_ma': estimate_ma,
+        'limited_ma': budget_ma if scale < 256 else estimate_ma,
+        'peak_ma': peak_ma,
+        'budget_ma': budget_ma,
+        'scale': scale,
+        'limited_frames': limited_frames,
+    }
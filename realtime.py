@@ -0,0 +1,137 @@
+# Realtime pixel streaming over UDP using DDP (Distributed Display Protocol).
+#
+# Controllers such as xLights, WLED or ddp_send.py push whole frames to port
+# 4048; each datagram is received straight into a preallocated buffer and
+# copied into the ws2812 frame. When the stream goes quiet for
+# REALTIME_TIMEOUT_MS the receiver lets go of the LEDs again.
+
+import socket
+import uasyncio
+import ws2812
+
+DDP_PORT = 4048
+
+DDP_HEADER_LEN = 10
+DDP_TIMECODE_LEN = 4
+DDP_MAX_DATA = 1440  # largest payload a DDP sender puts in one datagram
+
+DDP_FLAG_VERSION_MASK = 0xC0
+DDP_FLAG_VERSION_1 = 0x40
+DDP_FLAG_TIMECODE = 0x10
+DDP_FLAG_REPLY = 0x04
+DDP_FLAG_QUERY = 0x02
+DDP_FLAG_PUSH = 0x01
+
+DDP_ID_DISPLAY = 1
+
+REALTIME_TIMEOUT_MS = 2500
+
+buf = bytearray(DDP_HEADER_LEN + DDP_TIMECODE_LEN + DDP_MAX_DATA)
+
+# True while an external controller owns the LEDs
+active = False
+
+# Stream statistics
+packets = 0
+frames = 0
+dropped = 0
+late = 0
+rejected = 0
+
+last_seq = 0
+
+
+def display_packet(n):
+    """Whether the n bytes in buf carry a DDP header for our display"""
+    if n < DDP_HEADER_LEN:
+        return False
+    flags = buf[0]
+    if (flags & DDP_FLAG_VERSION_MASK) != DDP_FLAG_VERSION_1 or flags & (DDP_FLAG_QUERY | DDP_FLAG_REPLY):
+        return False
+    return buf[3] == DDP_ID_DISPLAY
+
+
+def handle_packet(n):
+    """Copy one received datagram of n bytes into the frame buffer"""
+    global packets, frames, dropped, late, rejected, last_seq
+
+    if not display_packet(n):
+        rejected += 1
+        return False
+
+    flags = buf[0]
+
+    # sequence numbers run 1..15 and wrap; 0 means the sender doesn't use them
+    seq = buf[1] & 0x0F
+    if seq and last_seq:
+        step = (seq - last_seq) % 15
+        if step == 0 or step > 7:
+            # duplicate or overtaken by a newer packet
+            late += 1
+            return False
+        dropped += step - 1
+    if seq:
+        last_seq = seq
+
+    offset = (buf[4]<<24) + (buf[5]<<16) + (buf[6]<<8) + buf[7]
+    length = (buf[8]<<8) + buf[9]
+    pos = DDP_HEADER_LEN
+    if flags & DDP_FLAG_TIMECODE:
+        pos += DDP_TIMECODE_LEN
+    if offset % 3:
+        rejected += 1
+        return False
+
+    length = min(length, n - pos)
+    first = offset // 3
+    count = min(length // 3, ws2812.NUM_LEDS - first)
+    if count > 0:
+        ws2812.pixels_set_bytes(first, buf, pos, count)
+
+    packets += 1
+    if flags & DDP_FLAG_PUSH:
+        ws2812.pixels_show()
+        frames += 1
+    return True
+
+
+async def serve(on_start=None, on_stop=None, port=DDP_PORT):
+    """Receive DDP frames until cancelled, calling on_start/on_stop as the stream comes and goes"""
+    global active, last_seq
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(socket.getaddrinfo('0.0.0.0', port)[0][-1])
+    sock.setblocking(False)
+    stream = uasyncio.StreamReader(sock)
+    print('DDP receiver listening on port', port)
+
+    try:
+        while True:
+            try:
+                n = await uasyncio.wait_for_ms(stream.readinto(buf), REALTIME_TIMEOUT_MS)
+            except uasyncio.TimeoutError:
+                if active:
+                    print('DDP stream timed out, returning to local effects')
+                    active = False
+                    last_seq = 0
+                    if on_stop:
+                        await on_stop()
+                continue
+
+            if n and not active and display_packet(n):
+                # take over before the first frame lands, so on_start still sees the old look
+                print('DDP stream started')
+                active = True
+                if on_start:
+                    await on_start()
+            if n:
+                handle_packet(n)
+    finally:
+        sock.close()
+        if active:
+            # cancelled mid-stream, when the Wi-Fi link drops: hand back the LEDs as on a timeout
+            active = False
+            last_seq = 0
+            if on_stop:
+                await on_stop()
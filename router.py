@@ -0,0 +1,156 @@
+# Route table and middleware pipeline for the web server.
+#
+# Handlers register against (method, path) with @route and /control
+# actions with @action, so dispatch is one dict lookup and a new endpoint
+# or action never touches handle_client. Each middleware runs before the
+# handler as `await mw(req, writer, key)` and returns True when it has
+# answered the request itself, which stops the pipeline. Requests for
+# unknown endpoints go through it too, as UNROUTED, so the rate limit also
+# covers a client probing paths that don't exist.
+
+import utime
+import metrics
+
+REASONS = {
+    200: 'OK',
+    202: 'Accepted',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    409: 'Conflict',
+    413: 'Payload Too Large',
+    429: 'Too Many Requests',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+    501: 'Not Implemented',
+    503: 'Service Unavailable',
+}
+
+routes = {}        # (method, path) -> async handler(req, writer)
+protected = set()  # route keys that need the API token
+actions = {}       # /control action name -> async handler(data, brightness)
+middleware = []
+
+UNROUTED = (None, None)  # the key middleware sees for a request with no route
+
+hits = {}          # route key -> requests dispatched
+unrouted = 0
+
+
+def route(method, path, auth=False):
+    """Decorator registering an async handler(req, writer) for method and path"""
+    def register(handler):
+        routes[(method, path)] = handler
+        hits[(method, path)] = 0
+        if auth:
+            protected.add((method, path))
+        return handler
+    return register
+
+
+def action(name):
+    """Decorator registering an async handler(data, brightness) for a /control action"""
+    def register(handler):
+        actions[name] = handler
+        return handler
+    return register
+
+
+def use(mw):
+    middleware.append(mw)
+    return mw
+
+
+def start_response(writer, status, content_type='text/plain', extra=None):
+    writer.write('HTTP/1.1 {} {}\r\n'.format(status, REASONS.get(status, '')))
+    writer.write('Content-Type: {}\r\n'.format(content_type))
+    if extra:
+        for header in extra:
+            writer.write(header)
+            writer.write('\r\n')
+    writer.write('Connection: close\r\n')
+    writer.write('\r\n')
+
+
+async def respond(writer, status, body='', content_type='text/plain', extra=None):
+    start_response(writer, status, content_type, extra)
+    if body:
+        writer.write(body)
+    await writer.drain()
+
+
+async def dispatch(req, writer):
+    path = req.path
+    query = path.find('?')
+    if query >= 0:
+        path = path[:query]
+    key = (req.method, path)
+    handler = routes.get(key)
+    if handler is None:
+        key = UNROUTED
+    for mw in middleware:
+        if await mw(req, writer, key):
+            return
+    if handler is None:
+        await respond(writer, 404, 'No such endpoint')
+        return
+    await handler(req, writer)
+
+
+# Middleware
+
+async def count_requests(req, writer, key):
+    """Per-route request counters for /metrics"""
+    global unrouted
+    if key is UNROUTED:
+        unrouted += 1
+    else:
+        hits[key] += 1
+    return False
+
+
+def require_token(token):
+    """Protected routes need 'Authorization: Bearer <token()>'; an empty token turns the check off"""
+    async def check(req, writer, key):
+        if key not in protected or not token():
+            return False
+        supplied = req.header(b'authorization')
+        if supplied is not None and bytes(supplied) == b'Bearer ' + token().encode():
+            return False
+        metrics.debug('Refused', key, 'from', req.client)
+        await respond(writer, 401, 'Authorization required', extra=('WWW-Authenticate: Bearer',))
+        return True
+    return check
+
+
+RATE_CLIENTS = 16  # clients tracked at once; the longest idle is forgotten beyond this
+
+limited = 0        # requests refused by rate_limit
+
+
+def rate_limit(rate, burst):
+    """Token bucket per client address: rate() requests a second, in bursts of up to burst()"""
+    buckets = {}  # address -> [milli-tokens, ticks_ms of the last refill]
+
+    async def check(req, writer, key):
+        global limited
+        now = utime.ticks_ms()
+        capacity = burst() * 1000
+        bucket = buckets.get(req.client)
+        if bucket is None:
+            if len(buckets) >= RATE_CLIENTS:
+                del buckets[max(buckets, key=lambda a: utime.ticks_diff(now, buckets[a][1]))]
+            bucket = buckets[req.client] = [capacity, now]
+        else:
+            # one ms at rate() per second refills rate() milli-tokens
+            bucket[0] = min(capacity, bucket[0] + utime.ticks_diff(now, bucket[1]) * rate())
+            bucket[1] = now
+        if bucket[0] >= 1000:
+            bucket[0] -= 1000
+            return False
+        limited += 1
+        retry = ((1000 - bucket[0]) // rate() + 999) // 1000
+        await respond(writer, 429, 'Slow down', extra=('Retry-After: {}'.format(max(retry, 1)),))
+        return True
+    return check
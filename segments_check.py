@@ -0,0 +1,123 @@
+# Host-side check of the strip mapping in ws2812.
+#
+#   python3 segments_check.py
+#
+# For a handful of strip layouts (one strip, uneven lengths, eight strips)
+# ws2812 is configured as it would be on the tree, every LED is set to its
+# own number, and pixels_show() pushes to hostshim's state machines, which
+# keep the words they are sent. A full push must put each logical LED on
+# exactly one state machine, at the right offset, in order, with no gaps
+# or overlaps. Then for dirty spans around every strip edge, a partial
+# push must send exactly the strips the span touches, each from its first
+# LED through the end of the span, since a strip keeps whatever follows
+# the data it is sent. push_plan is also run at other chunk sizes for the
+# mapping alone. Exits non-zero if anything is off.
+
+import array
+
+import hostshim
+
+hostshim.install()
+hostshim.StateMachine.record = True
+
+import config  # noqa: E402
+import ws2812  # noqa: E402
+
+LAYOUTS = (
+    [283],
+    [5],
+    [100, 7, 50, 1],
+    [8, 16, 3],
+    [30, 31, 32, 33, 34, 35, 36, 37],
+    [1, 1, 1, 1, 1, 1, 1, 1],
+)
+CHUNKS = (1, 3, 64)
+
+failures = []
+
+
+def expect(condition, what):
+    if not condition:
+        failures.append(what)
+
+
+def spans(num_leds, lengths):
+    # single LEDs at each strip edge, and spans across edges
+    edges = [0]
+    for count in lengths:
+        edges.append(edges[-1] + count)
+    found = set()
+    for edge in edges:
+        for start in (edge - 1, edge, edge + 1):
+            for stop in (start + 1, start + 2, start + 9, edge + 20):
+                if 0 <= start < stop <= num_leds:
+                    found.add((start, stop))
+    return sorted(found)
+
+
+def configure(lengths):
+    cfg = config.Config()
+    cfg.update({'strips': [[pin, count] for pin, count in enumerate(lengths)]})
+    ws2812.configure(cfg)
+    for i in range(ws2812.NUM_LEDS):
+        ws2812.ar[i] = i
+    ws2812.pixels_touched(0, ws2812.NUM_LEDS)
+
+
+def push(start, stop):
+    # what each state machine receives from pixels_show() with start..stop-1 dirty
+    for sm in ws2812.state_machines:
+        sm.received = []
+    ws2812.pixels_touched(start, stop)
+    ws2812.pixels_show()
+    return [sm.received for sm in ws2812.state_machines]
+
+
+def check_full(name, segments, received):
+    leds = []
+    for sm, (first, count) in enumerate(segments):
+        expect(received[sm] == list(range(first, first + count)), f'{name}: sm {sm} gets LEDs {first}..{first + count - 1}')
+        leds.extend(received[sm])
+    expect(sorted(leds) == list(range(sum(count for _, count in segments))), f'{name}: every LED sent exactly once')
+
+
+def check_layout(lengths):
+    name = f'{lengths}'
+    configure(lengths)
+    segments = ws2812.strip_segments(lengths)
+    expect(len(ws2812.state_machines) == len(lengths), f'{name}: one state machine per strip')
+    check_full(name, segments, push(0, ws2812.NUM_LEDS))
+
+    for start, stop in spans(ws2812.NUM_LEDS, lengths):
+        received = push(start, stop)
+        for sm, (first, count) in enumerate(segments):
+            sent = received[sm]
+            if not (first < stop and first + count > start):
+                expect(not sent, f'{name}: span {start}..{stop} leaves strip {sm} alone')
+                continue
+            need = min(stop, first + count)
+            expect(sent == list(range(first, first + len(sent))), f'{name}: span {start}..{stop} sends strip {sm} from its start')
+            expect(first + len(sent) >= need, f'{name}: span {start}..{stop} reaches LED {need - 1}')
+
+    for chunk in CHUNKS:
+        machines = [hostshim.StateMachine(sm) for sm in range(len(lengths))]
+        frame = array.array("I", range(ws2812.NUM_LEDS))
+        for sm, view, first, strip_stop in ws2812.push_plan(segments, machines, frame, chunk):
+            sm.put(view, 8)
+        check_full(f'{name} chunk {chunk}', segments, [sm.received for sm in machines])
+
+
+def main():
+    ws2812.REFRESH_MS = 0  # no periodic full resends in the middle of a partial push
+    for lengths in LAYOUTS:
+        check_layout(lengths)
+    ws2812.configure(config.current)
+    for what in failures[:20]:
+        print('FAIL', what)
+    print(f'{len(LAYOUTS)} layouts:', f'{len(failures)} failures' if failures else 'ok')
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
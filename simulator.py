@@ -0,0 +1,120 @@
+# Host-side LED simulator: the controller's web server under CPython.
+#
+#   python3 simulator.py --effect plasma                 # run an effect live
+#   python3 simulator.py --golden golden/snow.golden     # play back a recording, looped
+#
+# then open http://localhost:8080/sim. The page is the same one the Pico
+# serves: it draws the frames streamed from /frames onto a canvas at the
+# positions in layout.json, so an effect can be previewed and its frame
+# rate read off without a tree. The rest of the UI works too; /control and
+# the effect buttons drive the simulated LEDs.
+
+import argparse
+import asyncio
+
+import hostshim
+
+hostshim.install()
+
+import commands   # noqa: E402
+import golden     # noqa: E402
+import webserver  # noqa: E402
+import ws2812     # noqa: E402
+
+
+class Reader:
+    """uasyncio's readinto() on an asyncio StreamReader"""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    async def readinto(self, buf):
+        data = await self.reader.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+
+class Writer:
+    """uasyncio's StreamWriter, which also takes str and arrays, on an asyncio one"""
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, data):
+        self.writer.write(data.encode() if isinstance(data, str) else bytes(data))
+
+    async def drain(self):
+        try:
+            await self.writer.drain()
+        except ConnectionError as e:
+            raise OSError(str(e))
+
+    def close(self):
+        self.writer.close()
+
+    async def wait_closed(self):
+        await self.writer.wait_closed()
+
+    def get_extra_info(self, name):
+        return self.writer.get_extra_info(name)
+
+
+async def client(reader, writer):
+    await webserver.handle_client(Reader(reader), Writer(writer))
+
+
+async def press(button, every_ms):
+    while True:
+        await asyncio.sleep(every_ms / 1000)
+        button.set()
+
+
+async def run_effect(name):
+    step_ms, duration_ms, press_ms, factory = golden.EFFECTS[name]
+    button = asyncio.Event()
+    if press_ms:
+        asyncio.create_task(press(button, press_ms))
+    while True:
+        await factory(button)
+        button.clear()
+
+
+async def play(path, speed):
+    header, frames = golden.load(path)
+    if header['num_leds'] != ws2812.NUM_LEDS:
+        raise SystemExit('{} has {} LEDs, the tree is configured for {}'.format(
+            path, header['num_leds'], ws2812.NUM_LEDS))
+    width = 3 * header['num_leds']
+    while True:
+        for f in range(header['frames']):
+            frame = frames[f * width:(f + 1) * width]
+            for i in range(header['num_leds']):
+                ws2812.pixels_set(i, frame[3 * i:3 * i + 3])
+            ws2812.pixels_show()
+            await asyncio.sleep(header['step_ms'] / 1000 / speed)
+
+
+async def main(args):
+    asyncio.create_task(commands.run(webserver.apply_command, ws2812.pixels_show))
+    server = await asyncio.start_server(client, args.host, args.port)
+    print('Simulator on http://{}:{}/sim'.format(args.host, args.port))
+    if args.golden:
+        asyncio.create_task(play(args.golden, args.speed))
+    elif args.effect:
+        asyncio.create_task(run_effect(args.effect))
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the LED controller UI with simulated LEDs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--effect', choices=sorted(golden.EFFECTS), help='effect to run on the real clock')
+    source.add_argument('--golden', metavar='FILE', help='recording to play back in a loop')
+    parser.add_argument('--speed', type=float, default=1.0, help='playback speed for --golden')
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,99 @@
+# Last look on the tree, kept on flash so it comes back after a reset.
+#
+# The web server calls remember() after every command that changes what the
+# tree shows. run() writes the frame buffer and the running effect to flash
+# at most once per SNAPSHOT_INTERVAL_MS, through a temporary file and a
+# rename so a reset mid-write leaves the previous snapshot intact. At boot
+# restore() puts the frame back on the LEDs before Wi-Fi is even started.
+#
+# File layout: one JSON header line, then the frame buffer as raw words.
+
+import uasyncio
+import ujson
+import uos
+import utime
+import ws2812
+
+SNAPSHOT_FILE = "snapshot.bin"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_INTERVAL_MS = 30000  # a flash sector is good for ~100k erases; this is years of changes
+
+effect = None     # name of the effect to restart, or None for a static frame
+params = {}
+pending = False   # something changed since the last write
+last_write = None
+writes = 0
+
+
+def remember(name, values):
+    """Note the current look; it is written by run() once the rate limit allows"""
+    global effect, params, pending
+    effect = name
+    params = values
+    pending = True
+
+
+def save(path=SNAPSHOT_FILE):
+    global pending, last_write, writes
+    header = {
+        'version': SNAPSHOT_VERSION,
+        'num_leds': ws2812.NUM_LEDS,
+        'effect': effect,
+        'params': params,
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(ujson.dumps(header).encode())
+        f.write(b"\n")
+        f.write(ws2812.ar)
+    uos.rename(tmp, path)
+    pending = False
+    last_write = utime.ticks_ms()
+    writes += 1
+
+
+def restore(path=SNAPSHOT_FILE):
+    """Show the saved frame; returns (effect, params) to restart, or None when there is no usable snapshot"""
+    global effect, params
+    try:
+        with open(path, "rb") as f:
+            header = ujson.loads(f.readline())
+            if header.get('version') != SNAPSHOT_VERSION or header.get('num_leds') != ws2812.NUM_LEDS:
+                print('Snapshot is for a different setup, ignoring it')
+                return None
+            if f.readinto(memoryview(ws2812.ar)) != 4 * ws2812.NUM_LEDS:
+                print('Snapshot is truncated, ignoring it')
+                ws2812.pixels_fill((0, 0, 0))
+                return None
+    except (OSError, ValueError) as e:
+        print('No snapshot to restore:', e)
+        return None
+    ws2812.pixels_touched(0, ws2812.NUM_LEDS)
+    ws2812.pixels_show()
+    effect = header['effect']
+    params = header['params']
+    print('Restored snapshot', effect or 'static frame')
+    return effect, params
+
+
+async def run(interval_ms=SNAPSHOT_INTERVAL_MS):
+    """Background task writing remembered changes, no more often than interval_ms"""
+    while True:
+        await uasyncio.sleep_ms(1000)
+        if not pending:
+            continue
+        if last_write is not None and utime.ticks_diff(utime.ticks_ms(), last_write) < interval_ms:
+            continue
+        try:
+            save()
+        except OSError as e:
+            print('Snapshot write failed:', e)
+
+
+def stats():
+    return {
+        'effect': effect,
+        'pending': pending,
+        'writes': writes,
+        'last_write_ms_ago': utime.ticks_diff(utime.ticks_ms(), last_write) if last_write is not None else None,
+    }
@@ -0,0 +1,178 @@
+# Layout-aware 2D effects: falling snow, a radial pulse from the star,
+# vertical colour gradients and plasma.
+#
+# Every kernel works from the per-LED byte tables in layout.py and the sine
+# table below, so a frame is a handful of lookups per LED and no floating
+# point. Run benchmark() on the Pico to check each kernel against
+# FRAME_BUDGET_MS.
+
+import array
+import math
+import uasyncio
+import utime
+import clock
+import layout
+import metrics
+import ws2812
+
+FRAME_BUDGET_MS = 20  # 50 fps
+
+SNOW_FALL_MS = 2000      # time for a flake to fall from the top row to the bottom
+SNOW_SPAWN_MS = 40       # a new flake at most this often
+SNOW_MAX_FLAKES = 48
+PULSE_PERIOD_MS = 1500
+GRADIENT_PERIOD_MS = 6000
+PLASMA_SPEED = 3         # phase steps per 16 ms
+
+# sin8[i] = 128 + 127 * sin(2 * pi * i / 256)
+sin8 = bytearray(128 + int(127 * math.sin(i * math.pi / 128)) for i in range(256))
+
+
+def pack(r, g, b):
+    return (r<<16) + (g<<8) + b
+
+
+def scaled_palette(colour_at, brightness=255):
+    """256 packed colours from colour_at(i) -> (r, g, b), scaled by brightness"""
+    palette = array.array("I", [0] * 256)
+    for i in range(256):
+        r, g, b = colour_at(i)
+        palette[i] = pack(r * brightness // 255, g * brightness // 255, b * brightness // 255)
+    return palette
+
+
+def gradient_palette(brightness=255):
+    return scaled_palette(lambda i: ws2812.wheel(i), brightness)
+
+
+def pulse_palette(brightness=255):
+    # three warm gold rings across the tree
+    return scaled_palette(lambda i: (sin8[(i * 3) & 0xFF], sin8[(i * 3) & 0xFF] * 3 // 4, 0), brightness)
+
+
+def plasma_palette(brightness=255):
+    return scaled_palette(lambda i: (sin8[i], sin8[(i + 85) & 0xFF], sin8[(i + 170) & 0xFF]), brightness)
+
+
+def render_gradient(now, palette):
+    layout.paint(layout.y8, palette, (now % GRADIENT_PERIOD_MS) * 256 // GRADIENT_PERIOD_MS)
+
+
+def render_pulse(now, palette):
+    # the rings move outwards from the star, so the palette offset runs backwards
+    layout.paint(layout.radius8, palette, -((now % PULSE_PERIOD_MS) * 256 // PULSE_PERIOD_MS))
+
+
+def render_plasma(now, palette):
+    ar = ws2812.ar
+    x8 = layout.x8
+    y8 = layout.y8
+    t = ((now >> 4) * PLASMA_SPEED) & 0x1FF
+    t1 = t & 0xFF
+    t2 = (t * 2) & 0xFF
+    t3 = (t // 2) & 0xFF
+    for led in range(len(x8)):
+        x = x8[led]
+        y = y8[led]
+        v = sin8[(x + t1) & 0xFF] + sin8[(y + t2) & 0xFF] + sin8[((x + y) // 2 + t3) & 0xFF]
+        ar[led] = palette[(v // 3) & 0xFF]
+    ws2812.pixels_touched(0, len(x8))
+
+
+class Snow:
+    """Fixed pool of flakes falling down the layout columns"""
+
+    def __init__(self, colour=(122, 122, 122)):
+        self.colour = colour
+        # only columns that have LEDs in them are worth dropping a flake down
+        self.choices = bytearray(c for c in range(layout.num_columns) if len(layout.columns[c]))
+        self.columns = bytearray(SNOW_MAX_FLAKES)
+        self.starts = array.array("i", [0] * SNOW_MAX_FLAKES)
+        self.active = bytearray(SNOW_MAX_FLAKES)
+        self.last_spawn = 0
+
+    def spawn(self, now):
+        if now - self.last_spawn < SNOW_SPAWN_MS:
+            return
+        for flake in range(SNOW_MAX_FLAKES):
+            if not self.active[flake]:
+                self.columns[flake] = self.choices[clock.randrange(len(self.choices))]
+                self.starts[flake] = now
+                self.active[flake] = 1
+                self.last_spawn = now
+                return
+
+    def render(self, now):
+        ws2812.pixels_fill((0, 0, 0))
+        layout.fill_row(layout.num_rows - 1, self.colour)  # snow on the ground
+        self.spawn(now)
+        for flake in range(SNOW_MAX_FLAKES):
+            if not self.active[flake]:
+                continue
+            elapsed = now - self.starts[flake]
+            if elapsed >= SNOW_FALL_MS:
+                self.active[flake] = 0
+                continue
+            led = layout.led_at(elapsed * layout.num_rows // SNOW_FALL_MS, self.columns[flake])
+            if led is not None:
+                ws2812.pixels_set(led, self.colour)
+
+
+async def run_effect(name, render, *args):
+    """Render frames until cancelled, sleeping whatever is left of each frame budget"""
+    print(f'Starting {name} effect')
+    animation = clock.Animation()
+    try:
+        while True:
+            now = animation.now()
+            t0 = utime.ticks_us()
+            render(now, *args)
+            metrics.FRAME_BUILD.since(t0)
+            ws2812.pixels_show()
+            await animation.next_frame(FRAME_BUDGET_MS)
+    except uasyncio.CancelledError:
+        print(f'{name} effect cancelled')
+        raise
+
+
+async def snow_effect(brightness):
+    level = brightness * 122 // 255
+    await run_effect('snow', Snow((level, level, level)).render)
+
+
+async def pulse_effect(brightness):
+    await run_effect('pulse', render_pulse, pulse_palette(brightness))
+
+
+async def gradient_effect(brightness):
+    await run_effect('gradient', render_gradient, gradient_palette(brightness))
+
+
+async def plasma_effect(brightness):
+    await run_effect('plasma', render_plasma, plasma_palette(brightness))
+
+
+def benchmark(frames=100):
+    """Time each kernel on the device and compare it with the frame budget"""
+    kernels = (
+        ('snow', Snow().render, ()),
+        ('pulse', render_pulse, (pulse_palette(),)),
+        ('gradient', render_gradient, (gradient_palette(),)),
+        ('plasma', render_plasma, (plasma_palette(),)),
+    )
+    budget_us = FRAME_BUDGET_MS * 1000
+    for name, render, args in kernels:
+        total = 0
+        worst = 0
+        for frame in range(frames):
+            start = utime.ticks_us()
+            render(frame * FRAME_BUDGET_MS, *args)
+            took = utime.ticks_diff(utime.ticks_us(), start)
+            total += took
+            worst = max(worst, took)
+        verdict = 'ok' if worst < budget_us else 'OVER BUDGET'
+        print(f'{name:10s} avg {total // frames:6d} us  max {worst:6d} us  budget {budget_us} us  {verdict}')
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,92 @@
+# Owner of the single running effect.
+#
+# start() cancels whatever is running, gives it HANDOVER_DEADLINE_MS to
+# unwind, and then starts the new effect. The time from the start() call
+# to the new effect's first pixels_show() is recorded, so the handover
+# latency can be checked from the web server.
+
+import array
+import uasyncio
+import utime
+import ws2812
+
+HANDOVER_DEADLINE_MS = 40  # two frames at the 50 fps the effects aim for
+LATENCY_SAMPLES = 16
+
+
+class Supervisor:
+    def __init__(self, deadline_ms=HANDOVER_DEADLINE_MS):
+        self.deadline_ms = deadline_ms
+        self.name = None
+        self.task = None
+        self.finished = None  # set by the running task as it exits
+
+        self.handovers = 0
+        self.overruns = 0  # effects that were still unwinding at the deadline
+        self.requested_at = 0
+        self.waiting_for_frame = False
+        self.latencies = array.array("I", [0] * LATENCY_SAMPLES)
+        self.samples = 0
+
+        ws2812.show_listeners.append(self.frame_shown)
+
+    def frame_shown(self):
+        if self.waiting_for_frame:
+            self.waiting_for_frame = False
+            self.latencies[self.samples % LATENCY_SAMPLES] = utime.ticks_diff(utime.ticks_ms(), self.requested_at)
+            self.samples += 1
+
+    async def _run(self, effect, finished):
+        # finished is this task's own Event: an effect that overran the deadline
+        # must not mark the one that replaced it as done when it finally unwinds
+        try:
+            await effect
+        except uasyncio.CancelledError:
+            pass
+        finally:
+            finished.set()
+
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    async def stop(self):
+        """Cancel the running effect and wait up to the deadline for it to finish"""
+        if not self.running():
+            self.name = None
+            return
+        self.task.cancel()
+        try:
+            await uasyncio.wait_for_ms(self.finished.wait(), self.deadline_ms)
+        except uasyncio.TimeoutError:
+            # it will still stop at its next await; don't hold up the next effect
+            self.overruns += 1
+            print(f'Effect {self.name} missed the {self.deadline_ms} ms handover deadline')
+        self.task = None
+        self.finished = None
+        self.name = None
+
+    async def start(self, name, effect):
+        """Replace the running effect with the coroutine effect"""
+        requested_at = utime.ticks_ms()
+        await self.stop()
+        self.finished = uasyncio.Event()
+        self.name = name
+        self.task = uasyncio.create_task(self._run(effect, self.finished))
+        self.handovers += 1
+        self.requested_at = requested_at
+        self.waiting_for_frame = True
+
+    def stats(self):
+        count = min(self.samples, LATENCY_SAMPLES)
+        recent = self.latencies[:count]
+        return {
+            'effect': self.name if self.running() else None,
+            'handovers': self.handovers,
+            'overruns': self.overruns,
+            'deadline_ms': self.deadline_ms,
+            'latency_ms': {
+                'last': self.latencies[(self.samples - 1) % LATENCY_SAMPLES] if count else None,
+                'avg': sum(recent) // count if count else None,
+                'max': max(recent) if count else None,
+            },
+        }
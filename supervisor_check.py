@@ -0,0 +1,81 @@
+# Host-side check of effect handovers in supervisor.py.
+#
+#   python3 supervisor_check.py
+#
+# Runs three handovers against a Supervisor: an effect that unwinds at
+# once, one that takes UNWIND_MS in its CancelledError handler (well past
+# the handover deadline), and a final stop. After the overrun the new
+# effect must still count as running, stop() must cancel it, and no two
+# effects may ever be drawing at the same time. An AssertionError names
+# the first thing that went wrong.
+
+import asyncio
+
+import hostshim
+
+hostshim.install()
+
+import supervisor  # noqa: E402
+
+UNWIND_MS = 100
+
+drawing = set()
+overlaps = []
+
+
+async def effect(name, unwind_ms=0):
+    drawing.add(name)
+    try:
+        while True:
+            if len(drawing) > 1:
+                overlaps.append(sorted(drawing))
+            await asyncio.sleep(0.005)
+    except asyncio.CancelledError:
+        await asyncio.sleep(unwind_ms / 1000)
+        raise
+    finally:
+        drawing.discard(name)
+
+
+async def run():
+    sup = supervisor.Supervisor()
+
+    await sup.start('a', effect('a'))
+    await asyncio.sleep(0.02)
+    assert sup.running() and sup.name == 'a', 'a is running'
+
+    await sup.start('slow', effect('slow', UNWIND_MS))
+    await asyncio.sleep(0.02)
+    await sup.start('b', effect('b'))
+    assert sup.overruns == 1, 'slow missed the handover deadline'
+
+    # let the slow effect finish unwinding behind b's back
+    await asyncio.sleep(UNWIND_MS * 2 / 1000)
+    assert 'slow' not in drawing, 'slow has unwound'
+    assert sup.running() and sup.name == 'b', 'b still counts as running after the overrun'
+    assert sup.stats()['effect'] == 'b', 'stats report b'
+
+    task = sup.task
+    await sup.stop()
+    await asyncio.sleep(0.02)
+    assert task.done() and not drawing, 'stop() cancelled b'
+    assert not sup.running(), 'nothing running after stop()'
+
+    await sup.start('c', effect('c'))
+    await asyncio.sleep(0.02)
+    assert drawing == {'c'}, 'only c is drawing'
+    await sup.stop()
+
+    # the overrun itself leaves the old effect drawing until its next await,
+    # which the deadline accepts; any other overlap is a bug
+    stray = [pair for pair in overlaps if pair != ['b', 'slow']]
+    assert not stray, 'no two effects drew at once outside the overrun window'
+    print('handovers ok:', sup.stats())
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -21,7 +21,7 @@ async def rgb_test():
         ws2812.pixels_set(2, RED)
         ws2812.pixels_set(4, GREEN)
         ws2812.pixels_set(7, BLUE)
-        await ws2812.pixels_show()
+        ws2812.pixels_show()
     except uasyncio.CancelledError:
         pass
 
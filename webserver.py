@@ -1,27 +1,34 @@
+import array
 import network
 import socket
 import uasyncio
 import utime
 import ujson
 import ws2812
+import config
+import realtime
+import layout
+import spatial
+import supervisor
+import power
+import output
+import governor
+import snapshot
+import wifi
+import metrics
+import memory
+import httpreq
+import router
+import commands
+import clock
 from machine import Pin
 
-# Configuration
-SSID = "Number9"
-PASSWORD = "freyacat"
-NUM_LEDS = 283
-
-# Static IP Configuration
-STATIC_IP = "192.168.0.20"
-SUBNET_MASK = "255.255.255.0"
-GATEWAY = "192.168.0.1"
-DNS = "8.8.8.8"
-
 # Global state
 current_brightness = 128
-web_server_task = None
-animation_task = None
-led_states = ['#000000'] * 283  # Track current LED colors
+web_server = None
+ddp_task = None
+effects = supervisor.Supervisor()  # owns the running animation
+led_states = ['#000000'] * ws2812.NUM_LEDS  # Track current LED colors
 
 # Onboard LED setup
 onboard_led = Pin("LED", Pin.OUT)
@@ -75,41 +82,6 @@ def set_led_status(status):
     elif status == 'error':
         led_status_task = uasyncio.create_task(led_status_error())
 
-# Connect to WiFi
-async def connect_wifi():
-    set_led_status('connecting')
-    
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    
-    if STATIC_IP:
-        wlan.ifconfig((STATIC_IP, SUBNET_MASK, GATEWAY, DNS))
-        print('Static IP configured:', STATIC_IP)
-    
-    wlan.connect(SSID, PASSWORD)
-    
-    max_wait = 20
-    while max_wait > 0:
-        status = wlan.status()
-        if status < 0 or status >= 3:
-            break
-        max_wait -= 1
-        print('Waiting for connection...')
-        await uasyncio.sleep(1)
-    
-    if wlan.status() != 3:
-        set_led_status('error')
-        raise RuntimeError('Network connection failed')
-    else:
-        print('Connected')
-        status = wlan.ifconfig()
-        print('IP:', status[0])
-        print('Subnet:', status[1])
-        print('Gateway:', status[2])
-        print('DNS:', status[3])
-        set_led_status('connected')
-        return status[0]
-
 # HTML webpage
 def webpage():
     html = """<!DOCTYPE html>
@@ -232,7 +204,11 @@ def webpage():
         }
         .led-dot {
             cursor: pointer;
-            transition: all 0.2s;
+            transition: stroke 0.2s;
+        }
+        .led-glow {
+            fill-opacity: 0.3;
+            pointer-events: none;
         }
         .led-dot:hover {
             r: 8;
@@ -251,6 +227,8 @@ def webpage():
             pointer-events: none;
             text-anchor: middle;
         }
+        .nav { text-align: center; margin: -20px 0 20px; }
+        .nav a { color: #888; font-size: 14px; }
         .status {
             text-align: center;
             padding: 10px;
@@ -264,7 +242,8 @@ def webpage():
 </head>
 <body>
     <div class="container">
-        <h1>LED Controller (283 LEDs)</h1>
+        <h1>LED Controller (<span id="ledCount">0</span> LEDs)</h1>
+        <p class="nav"><a href="/sim">Simulator</a></p>
         
         <div class="controls">
             <div class="control-group">
@@ -282,13 +261,17 @@ def webpage():
                 <button class="btn-clear" onclick="clearAll()">Clear All</button>
                 <button class="btn-rainbow" onclick="rainbow()">Rainbow</button>
                 <button class="btn-wave" onclick="wave()">Wave Effect</button>
+                <button onclick="effect('snow')">Snow</button>
+                <button onclick="effect('pulse')">Star Pulse</button>
+                <button onclick="effect('gradient')">Gradient</button>
+                <button onclick="effect('plasma')">Plasma</button>
             </div>
 
             <div class="range-group">
                 <label>Fill Range</label>
                 <div class="range-inputs">
-                    <input type="number" id="rangeStart" placeholder="Start (0)" min="0" max="282" value="0">
-                    <input type="number" id="rangeEnd" placeholder="End (282)" min="0" max="282" value="282">
+                    <input type="number" id="rangeStart" placeholder="Start (0)" min="0" value="0">
+                    <input type="number" id="rangeEnd" placeholder="End" min="0">
                 </div>
                 <button onclick="fillRange()" style="width: 100%; margin-top: 10px;">Fill Range</button>
             </div>
@@ -299,310 +282,100 @@ def webpage():
     </div>
     
     <script>
-        const numLeds = 283;
-        const ledStates = new Array(numLeds).fill('#000000');
-        
-        function buildLedPath() {
-            const path = [];
-            // Start from bottom right - LED 0
-            let x = 900, y = 300;
-            const hSpacing = 3;  // Horizontal spacing
-            const vSpacing = 12; // Vertical spacing
-            
-            // LED 0 at start (bottom right)
-            path.push({num: 0, x: x, y: y});
-            
-            // L 7 to LED 7 (going left from 0)
-            for (let i = 1; i <= 7; i++) {
-                x -= hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            // Now at LED 7, x ≈ 879, y = 300
-            
-            // U 4 to LED 11 (going up from 7)
-            for (let i = 8; i <= 11; i++) {
-                y -= vSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            // Now at LED 11, y ≈ 252
-            
-            // R 3 to LED 14 (going right from 11)
-            for (let i = 12; i <= 14; i++) {
-                x += hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            // Now at LED 14
-            
-            // UL 5 to LED 19 (diagonal up-left)
-            for (let i = 15; i <= 19; i++) {
-                x -= hSpacing * 0.8;
-                y -= vSpacing * 0.8;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // R 3 to LED 22
-            for (let i = 20; i <= 22; i++) {
-                x += hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // UL 4 to LED 26
-            for (let i = 23; i <= 26; i++) {
-                x -= hSpacing * 0.8;
-                y -= vSpacing * 0.8;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // R 2 to LED 28
-            for (let i = 27; i <= 28; i++) {
-                x += hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // UL 3 to LED 31
-            for (let i = 29; i <= 31; i++) {
-                x -= hSpacing * 0.8;
-                y -= vSpacing * 0.8;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // U 1 to LED 32
-            y -= vSpacing;
-            path.push({num: 32, x: x, y: y});
-            
-            // Star LEDs 33-37 (clustered at top)
-            const starX = x;
-            const starY = y - vSpacing;
-            for (let i = 33; i <= 37; i++) {
-                path.push({num: i, x: starX + (i - 35) * 2, y: starY});
-            }
-            
-            // D 1 from star to LED 38
-            y -= vSpacing;
-            path.push({num: 38, x: x, y: y});
-            
-            // D 1 to LED 39
-            y += vSpacing;
-            path.push({num: 39, x: x, y: y});
-            
-            // DL 3 to LED 42
-            for (let i = 40; i <= 42; i++) {
-                x -= hSpacing * 0.8;
-                y += vSpacing * 0.8;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // R 3 to LED 45
-            for (let i = 43; i <= 45; i++) {
-                x += hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // DL 3 to LED 48
-            for (let i = 46; i <= 48; i++) {
-                x -= hSpacing * 0.8;
-                y += vSpacing * 0.8;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // R 4 to LED 52
-            for (let i = 49; i <= 52; i++) {
-                x += hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // DL 5 to LED 57
-            for (let i = 53; i <= 57; i++) {
-                x -= hSpacing * 0.8;
-                y += vSpacing * 0.8;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // R 5 to LED 62
-            for (let i = 58; i <= 62; i++) {
-                x += hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // D 3 to LED 65
-            for (let i = 63; i <= 65; i++) {
-                y += vSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // L 30 to LED 95 (long horizontal line to left side)
-            const targetX = 600;  // Left side position
-            const ledCount = 95 - 65;
-            const stepX = (targetX - x) / ledCount;
-            for (let i = 66; i <= 95; i++) {
-                x += stepX;
-                path.push({num: i, x: x, y: y});
-            }
-            x = targetX;  // Ensure we're at exact position
-            
-            // Now on left side - zigzag pattern
-            // U 2 to LED 97
-            for (let i = 96; i <= 97; i++) {
-                y -= vSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // R 23 to LED 120
-            for (let i = 98; i <= 120; i++) {
-                x += hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // U 2 to LED 122
-            for (let i = 121; i <= 122; i++) {
-                y -= vSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // L 22 to LED 144
-            for (let i = 123; i <= 144; i++) {
-                x -= hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // U 2 to LED 146
-            for (let i = 145; i <= 146; i++) {
-                y -= vSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // R 24 to LED 170
-            for (let i = 147; i <= 170; i++) {
-                x += hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // U 2 to LED 172
-            for (let i = 171; i <= 172; i++) {
-                y -= vSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // L 24 to LED 196
-            for (let i = 173; i <= 196; i++) {
-                x -= hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // U 2 to LED 198
-            for (let i = 197; i <= 198; i++) {
-                y -= vSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // R 23 to LED 221
-            for (let i = 199; i <= 221; i++) {
-                x += hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // U 2 to LED 223
-            for (let i = 222; i <= 223; i++) {
-                y -= vSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // L 22 to LED 245
-            for (let i = 224; i <= 245; i++) {
-                x -= hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // U 2 to LED 247
-            for (let i = 246; i <= 247; i++) {
-                y -= vSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // R 14 to LED 261
-            for (let i = 248; i <= 261; i++) {
-                x += hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // U 2 to LED 263
-            for (let i = 262; i <= 263; i++) {
-                y -= vSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // L 15 to LED 278
-            for (let i = 264; i <= 278; i++) {
-                x -= hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            // U 1 to LED 279
-            y -= vSpacing;
-            path.push({num: 279, x: x, y: y});
-            
-            // R 3 to LED 282
-            for (let i = 280; i <= 282; i++) {
-                x += hSpacing;
-                path.push({num: i, x: x, y: y});
-            }
-            
-            return path;
-        }
+        let numLeds = 0;
+        let ledStates = [];
         
-        const ledPath = buildLedPath();
+        // DOM nodes per LED, and the colour each one currently shows
+        let circles = [];
+        let glows = [];
+        let shown = [];
+        let paintPending = false;
         
+        // LED positions come from the same layout.json the effects use
+        let ledPath = [];
         const treeContainer = document.getElementById('treeMap');
         const svg = document.createElementNS('http://www.w3.org/2000/svg', 'svg');
         svg.setAttribute('class', 'tree-svg');
         svg.setAttribute('width', '100%');
         svg.setAttribute('height', '350');
-        svg.setAttribute('viewBox', '550 50 400 330');
         svg.setAttribute('preserveAspectRatio', 'xMidYMid meet');
+        treeContainer.appendChild(svg);
         
-        for (let i = 0; i < ledPath.length - 1; i++) {
-            const line = document.createElementNS('http://www.w3.org/2000/svg', 'line');
-            line.setAttribute('class', 'led-line');
-            line.setAttribute('x1', ledPath[i].x);
-            line.setAttribute('y1', ledPath[i].y);
-            line.setAttribute('x2', ledPath[i + 1].x);
-            line.setAttribute('y2', ledPath[i + 1].y);
-            svg.appendChild(line);
-        }
+        // The LED count is whatever the controller is configured for
+        fetch('/state')
+            .then(response => response.json())
+            .then(data => {
+                numLeds = data.states.length;
+                ledStates = data.states.slice();
+                document.getElementById('ledCount').textContent = numLeds;
+                ['rangeStart', 'rangeEnd'].forEach(id => document.getElementById(id).max = numLeds - 1);
+                document.getElementById('rangeEnd').value = numLeds - 1;
+                return fetch('/layout');
+            })
+            .then(response => response.json())
+            .then(buildTree)
+            .catch(err => updateStatus('Layout error: ' + err));
         
-        ledPath.forEach((led, idx) => {
-            const circle = document.createElementNS('http://www.w3.org/2000/svg', 'circle');
-            circle.setAttribute('class', 'led-dot');
-            circle.setAttribute('cx', led.x);
-            circle.setAttribute('cy', led.y);
-            circle.setAttribute('r', '2');
-            circle.setAttribute('fill', '#0a0a0a');
-            circle.setAttribute('stroke', '#333');
-            circle.setAttribute('stroke-width', '0.5');
-            circle.setAttribute('data-index', led.num);
-            circle.style.cursor = 'pointer';
-            circle.onclick = () => toggleLed(led.num);
+        function buildTree(layout) {
+            ledPath = layout.leds.slice(0, numLeds).map((p, i) => ({num: i, x: p[0], y: p[1]}));
+            const labels = new Set(layout.labels);
+            svg.setAttribute('viewBox', layout.viewbox.join(' '));
             
-            const title = document.createElementNS('http://www.w3.org/2000/svg', 'title');
-            title.textContent = 'LED ' + led.num;
-            circle.appendChild(title);
+            for (let i = 0; i < ledPath.length - 1; i++) {
+                const line = document.createElementNS('http://www.w3.org/2000/svg', 'line');
+                line.setAttribute('class', 'led-line');
+                line.setAttribute('x1', ledPath[i].x);
+                line.setAttribute('y1', ledPath[i].y);
+                line.setAttribute('x2', ledPath[i + 1].x);
+                line.setAttribute('y2', ledPath[i + 1].y);
+                svg.appendChild(line);
+            }
             
-            svg.appendChild(circle);
+            // a translucent disc behind each lit LED; far cheaper than a drop-shadow filter per circle
+            const glowLayer = document.createElementNS('http://www.w3.org/2000/svg', 'g');
+            svg.appendChild(glowLayer);
             
-            if (led.num === 0 || led.num === 7 || led.num === 11 || led.num === 14 || 
-                led.num === 19 || led.num === 22 || led.num === 26 || led.num === 28 || 
-                led.num === 31 || led.num === 35 || led.num === 65 || led.num === 95 ||
-                led.num % 50 === 0) {
-                const text = document.createElementNS('http://www.w3.org/2000/svg', 'text');
-                text.setAttribute('class', 'led-text');
-                text.setAttribute('x', led.x);
-                text.setAttribute('y', led.y - 3);
-                text.textContent = led.num;
-                svg.appendChild(text);
-            }
-        });
-        
-        treeContainer.appendChild(svg);
+            ledPath.forEach((led, idx) => {
+                const glow = document.createElementNS('http://www.w3.org/2000/svg', 'circle');
+                glow.setAttribute('class', 'led-glow');
+                glow.setAttribute('cx', led.x);
+                glow.setAttribute('cy', led.y);
+                glow.setAttribute('r', '5');
+                glow.setAttribute('fill', 'none');
+                glowLayer.appendChild(glow);
+                glows.push(glow);
+                
+                const circle = document.createElementNS('http://www.w3.org/2000/svg', 'circle');
+                circle.setAttribute('class', 'led-dot');
+                circle.setAttribute('cx', led.x);
+                circle.setAttribute('cy', led.y);
+                circle.setAttribute('r', '2');
+                circle.setAttribute('fill', '#0a0a0a');
+                circle.setAttribute('stroke', '#333');
+                circle.setAttribute('stroke-width', '0.5');
+                circle.setAttribute('data-index', led.num);
+                circle.style.cursor = 'pointer';
+                circle.onclick = () => toggleLed(led.num);
+                
+                const title = document.createElementNS('http://www.w3.org/2000/svg', 'title');
+                title.textContent = 'LED ' + led.num;
+                circle.appendChild(title);
+                
+                svg.appendChild(circle);
+                circles.push(circle);
+                shown.push(null);
+                
+                if (labels.has(led.num)) {
+                    const text = document.createElementNS('http://www.w3.org/2000/svg', 'text');
+                    text.setAttribute('class', 'led-text');
+                    text.setAttribute('x', led.x);
+                    text.setAttribute('y', led.y - 3);
+                    text.textContent = led.num;
+                    svg.appendChild(text);
+                }
+            });
+            updateDisplay();
+        }
         
         // Poll for LED state updates every 500ms
         setInterval(() => {
@@ -650,7 +423,7 @@ def webpage():
         
         function fillRange() {
             const start = parseInt(document.getElementById('rangeStart').value) || 0;
-            const end = parseInt(document.getElementById('rangeEnd').value) || 282;
+            const end = parseInt(document.getElementById('rangeEnd').value) || numLeds - 1;
             const color = document.getElementById('colorPicker').value;
             
             for (let i = start; i <= end && i < numLeds; i++) {
@@ -670,19 +443,34 @@ def webpage():
             sendCommand('wave', {});
         }
         
+        function effect(name) {
+            updateStatus('Running ' + name + '...');
+            sendCommand(name, {});
+        }
+        
+        // Changes are painted once per animation frame, touching only the LEDs whose colour changed
         function updateDisplay() {
-            document.querySelectorAll('.led-dot').forEach(circle => {
-                const index = parseInt(circle.getAttribute('data-index'));
-                const color = ledStates[index];
-                circle.setAttribute('fill', color);
+            if (!paintPending) {
+                paintPending = true;
+                requestAnimationFrame(paint);
+            }
+        }
+        
+        function paint() {
+            paintPending = false;
+            for (let i = 0; i < circles.length; i++) {
+                const color = ledStates[i];
+                if (color === shown[i]) continue;
+                shown[i] = color;
+                circles[i].setAttribute('fill', color);
                 if (color !== '#000000') {
-                    circle.setAttribute('r', '3');
-                    circle.style.filter = `drop-shadow(0 0 4px ${color})`;
+                    circles[i].setAttribute('r', '3');
+                    glows[i].setAttribute('fill', color);
                 } else {
-                    circle.setAttribute('r', '2');
-                    circle.style.filter = 'none';
+                    circles[i].setAttribute('r', '2');
+                    glows[i].setAttribute('fill', 'none');
                 }
-            });
+            }
         }
         
         function sendCommand(action, data) {
@@ -703,80 +491,253 @@ def webpage():
 </html>"""
     return html
 
+# Canvas view of the frames actually pushed to the LEDs, streamed from /frames
+def simulator_page():
+    html = """<!DOCTYPE html>
+<html>
+<head>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <title>LED Simulator</title>
+    <style>
+        * { margin: 0; padding: 0; box-sizing: border-box; }
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
+            background: #0a0a0a;
+            color: #fff;
+            padding: 20px;
+        }
+        .container { max-width: 1200px; margin: 0 auto; }
+        h1 { text-align: center; margin-bottom: 20px; font-size: 2em; font-family: monospace; }
+        .nav { text-align: center; margin: -10px 0 20px; }
+        .nav a { color: #888; font-size: 14px; }
+        canvas {
+            display: block;
+            width: 100%;
+            background: #000;
+            border-radius: 15px;
+        }
+        .status {
+            text-align: center;
+            padding: 10px;
+            background: #1a1a1a;
+            border-radius: 8px;
+            margin-top: 10px;
+            font-size: 12px;
+            font-family: monospace;
+            color: #888;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>LED Simulator</h1>
+        <p class="nav"><a href="/">Controller</a></p>
+        <canvas id="tree"></canvas>
+        <div class="status" id="status">Loading layout...</div>
+    </div>
+
+    <script>
+        // Each record on /frames is little-endian uint32s: the frame number,
+        // then 0x00RRGGBB for every LED. The newest complete record waits in
+        // `latest` until the next animation frame, which repaints only the
+        // LEDs whose colour changed since the last paint.
+        const OFF = '#161616';
+        const canvas = document.getElementById('tree');
+        const ctx = canvas.getContext('2d');
+        let points = [];
+        let scale = 1, radius = 2, cell = 4;
+        let painted = new Uint32Array(0);
+        let latest = null;
+        let counts = {received: 0, painted: 0, changed: 0, first: null, last: null};
+
+        fetch('/layout')
+            .then(response => response.json())
+            .then(layout => {
+                const [x0, y0, width, height] = layout.viewbox;
+                const ratio = window.devicePixelRatio || 1;
+                canvas.width = Math.round(canvas.clientWidth * ratio);
+                canvas.height = Math.round(canvas.width * height / width);
+                scale = canvas.width / width;
+                cell = 3 * scale;          // horizontal LED pitch
+                radius = 0.45 * cell;
+                points = layout.leds.map(p => [(p[0] - x0) * scale, (p[1] - y0) * scale]);
+                stream();
+                requestAnimationFrame(paint);
+            })
+            .catch(err => status('Layout error: ' + err));
+
+        function status(text) {
+            document.getElementById('status').textContent = text;
+        }
+
+        async function stream() {
+            try {
+                const response = await fetch('/frames', {cache: 'no-store'});
+                if (!response.ok) throw new Error(response.status + ' ' + await response.text());
+                const leds = parseInt(response.headers.get('X-Leds'));
+                const record = new Uint8Array(4 * (leds + 1));
+                if (painted.length !== leds) {
+                    painted = new Uint32Array(leds).fill(0xFFFFFFFF);
+                }
+                const reader = response.body.getReader();
+                let filled = 0;
+                while (true) {
+                    const {value, done} = await reader.read();
+                    if (done) break;
+                    let offset = 0;
+                    while (offset < value.length) {
+                        const n = Math.min(record.length - filled, value.length - offset);
+                        record.set(value.subarray(offset, offset + n), filled);
+                        filled += n;
+                        offset += n;
+                        if (filled === record.length) {
+                            latest = new DataView(record.slice().buffer);
+                            counts.received++;
+                            filled = 0;
+                        }
+                    }
+                }
+                status('Stream ended, reconnecting...');
+            } catch (err) {
+                status('Stream error: ' + err.message + ', reconnecting...');
+            }
+            setTimeout(stream, 1000);
+        }
+
+        function paint(now) {
+            if (latest) {
+                const frame = latest;
+                latest = null;
+                const seq = frame.getUint32(0, true);
+                if (counts.first === null) counts.first = {seq: seq, at: now};
+                counts.last = {seq: seq, at: now};
+                let changed = 0;
+                for (let i = 0; i < painted.length && i < points.length; i++) {
+                    const color = frame.getUint32(4 * (i + 1), true);
+                    if (color === painted[i]) continue;
+                    painted[i] = color;
+                    changed++;
+                    const [x, y] = points[i];
+                    ctx.clearRect(x - cell / 2, y - cell / 2, cell, cell);
+                    ctx.fillStyle = color ? '#' + color.toString(16).padStart(6, '0') : OFF;
+                    ctx.beginPath();
+                    ctx.arc(x, y, radius, 0, 2 * Math.PI);
+                    ctx.fill();
+                }
+                counts.painted++;
+                counts.changed += changed;
+            }
+            requestAnimationFrame(paint);
+        }
+
+        // Once a second: how often frames arrive and are painted, and how fast the effect runs
+        let previous = {received: 0, painted: 0, changed: 0, seq: null, at: null};
+        setInterval(() => {
+            if (!counts.last) return;
+            const painted = counts.painted - previous.painted;
+            const changed = counts.changed - previous.changed;
+            let device = '';
+            if (previous.seq !== null && counts.last.at > previous.at) {
+                device = ((counts.last.seq - previous.seq) * 1000 / (counts.last.at - previous.at)).toFixed(1);
+            }
+            status('received ' + (counts.received - previous.received) + ' fps | painted ' + painted +
+                   ' fps | effect ' + (device || '-') + ' fps | ' +
+                   (painted ? Math.round(changed / painted) : 0) + ' LEDs changed per paint | frame ' + counts.last.seq);
+            previous = {received: counts.received, painted: counts.painted, changed: counts.changed,
+                        seq: counts.last.seq, at: counts.last.at};
+        }, 1000);
+    </script>
+</body>
+</html>"""
+    return html
+
 # Convert hex color to RGB with brightness
 def hex_to_rgb(hex_color, brightness=255):
     hex_color = hex_color.lstrip('#')
     r = int(hex_color[0:2], 16) * brightness // 255
     g = int(hex_color[2:4], 16) * brightness // 255
     b = int(hex_color[4:6], 16) * brightness // 255
-    print(f'hex_to_rgb: {hex_color} -> ({r}, {g}, {b}) with brightness {brightness}')
+    metrics.debug('hex_to_rgb:', hex_color, '->', (r, g, b), 'with brightness', brightness)
     return (r, g, b)
 
+# Stream a file from flash in small chunks
+async def send_file(writer, path, content_type):
+    writer.write('HTTP/1.1 200 OK\r\n')
+    writer.write('Content-Type: {}\r\n'.format(content_type))
+    writer.write('Connection: close\r\n')
+    writer.write('\r\n')
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(512)
+            if not chunk:
+                break
+            writer.write(chunk)
+            await writer.drain()
+
 # Helper function to stop any running animation
 async def stop_animation():
-    global animation_task
-    if animation_task and not animation_task.done():
+    if effects.running():
         print('Stopping running animation')
-        animation_task.cancel()
-        try:
-            await animation_task
-        except uasyncio.CancelledError:
-            pass
-        animation_task = None
+    await effects.stop()
 
-# LED control functions
+# LED control functions; the command queue pushes the frame after each batch
 async def set_led(index, color, brightness):
     global led_states
     await stop_animation()
     rgb = hex_to_rgb(color, brightness)
-    print(f'Setting LED {index} to {rgb} (brightness: {brightness})')
+    metrics.debug('Setting LED', index, 'to', rgb)
     ws2812.pixels_set(index, rgb)
-    await ws2812.pixels_show()
     led_states[index] = color
-    print('LED updated')
 
 async def fill_all(color, brightness):
     global led_states
     await stop_animation()
     rgb = hex_to_rgb(color, brightness)
-    print(f'Filling all LEDs with {rgb} (brightness: {brightness})')
+    metrics.debug('Filling all LEDs with', rgb)
     ws2812.pixels_fill(rgb)
-    await ws2812.pixels_show()
-    led_states = [color] * NUM_LEDS
-    print('All LEDs filled')
+    led_states = [color] * ws2812.NUM_LEDS
 
 async def fill_range(start, end, color, brightness):
     global led_states
     await stop_animation()
     rgb = hex_to_rgb(color, brightness)
-    print(f'Filling range {start}-{end} with {rgb} (brightness: {brightness})')
-    for i in range(start, min(end + 1, NUM_LEDS)):
-        ws2812.pixels_set(i, rgb)
-        led_states[i] = color
-    await ws2812.pixels_show()
-    print(f'Range {start}-{end} filled')
+    metrics.debug('Filling range', start, end, 'with', rgb)
+    stop = min(end + 1, ws2812.NUM_LEDS)
+    ws2812.pixels_fill_range(start, stop, rgb)
+    led_states[start:stop] = [color] * max(stop - start, 0)
 
 async def clear_all():
     global led_states
     await stop_animation()
-    print('Clearing all LEDs')
+    metrics.debug('Clearing all LEDs')
     ws2812.pixels_fill((0, 0, 0))
-    await ws2812.pixels_show()
-    led_states = ['#000000'] * NUM_LEDS
-    print('All LEDs cleared')
+    ws2812.pixels_show()
+    led_states = ['#000000'] * ws2812.NUM_LEDS
+
+# Both effects draw the step that is due now, so a slow frame skips ahead instead of stretching the run
+RAINBOW_STEP_MS = 20
+RAINBOW_STEPS = 255
+WAVE_STEP_MS = 30
+WAVE_STEPS = 100
 
 async def rainbow_effect(brightness):
     print(f'Starting rainbow effect (brightness: {brightness})')
+    animation = clock.Animation()
     try:
-        for j in range(255):
-            for i in range(NUM_LEDS):
-                pixel_index = (i * 256 // NUM_LEDS) + j
+        while True:
+            j = animation.now() // RAINBOW_STEP_MS
+            if j >= RAINBOW_STEPS:
+                break
+            t0 = utime.ticks_us()
+            for i in range(ws2812.NUM_LEDS):
+                pixel_index = (i * 256 // ws2812.NUM_LEDS) + j
                 r = int((128 + 127 * (pixel_index & 0xFF) / 255) * brightness / 255)
                 g = int((128 + 127 * ((pixel_index >> 8) & 0xFF) / 255) * brightness / 255)
                 b = int((128 + 127 * ((pixel_index >> 16) & 0xFF) / 255) * brightness / 255)
                 ws2812.pixels_set(i, (r, g, b))
-            await ws2812.pixels_show()
-            await uasyncio.sleep_ms(20)
+            metrics.FRAME_BUILD.since(t0)
+            ws2812.pixels_show()
+            await animation.next_frame(RAINBOW_STEP_MS)
         print('Rainbow effect complete')
     except uasyncio.CancelledError:
         print('Rainbow effect cancelled')
@@ -784,138 +745,412 @@ async def rainbow_effect(brightness):
 
 async def wave_effect(brightness):
     print(f'Starting wave effect (brightness: {brightness})')
+    animation = clock.Animation()
     try:
-        for j in range(100):
-            for i in range(NUM_LEDS):
-                val = int((128 + 127 * ((i + j * 3) % NUM_LEDS) / NUM_LEDS) * brightness / 255)
+        while True:
+            j = animation.now() // WAVE_STEP_MS
+            if j >= WAVE_STEPS:
+                break
+            t0 = utime.ticks_us()
+            for i in range(ws2812.NUM_LEDS):
+                val = int((128 + 127 * ((i + j * 3) % ws2812.NUM_LEDS) / ws2812.NUM_LEDS) * brightness / 255)
                 ws2812.pixels_set(i, (0, val, val))
-            await ws2812.pixels_show()
-            await uasyncio.sleep_ms(30)
+            metrics.FRAME_BUILD.since(t0)
+            ws2812.pixels_show()
+            await animation.next_frame(WAVE_STEP_MS)
         print('Wave effect complete')
     except uasyncio.CancelledError:
         print('Wave effect cancelled')
         raise
 
+# Validate, apply and persist new settings
+async def apply_config(values, save=True):
+    global led_states
+    cfg = config.current
+    checked = cfg.validate(values)
+    if 'strips' in checked and sum(count for _, count in checked['strips']) > layout.capacity:
+        raise ValueError('{} only places {} LEDs'.format(layout.LAYOUT_FILE, layout.capacity))
+    if cfg.size_changed(checked):
+        # effects hold LED indices, so nothing may run while the buffers are swapped
+        await stop_animation()
+    changed = cfg.apply(checked)
+    metrics.configure(cfg)
+    if ws2812.configure(cfg):
+        print(f'Resized to {ws2812.NUM_LEDS} LEDs on {len(ws2812.STRIPS)} strips')
+        layout.load()
+        led_states = ['#000000'] * ws2812.NUM_LEDS
+        ws2812.pixels_show()
+    if save and changed:
+        config.save(cfg)
+    return changed
+
+# Animations by /control action name; each takes the brightness
+EFFECTS = {
+    'rainbow': rainbow_effect,
+    'wave': wave_effect,
+    'snow': spatial.snow_effect,
+    'pulse': spatial.pulse_effect,
+    'gradient': spatial.gradient_effect,
+    'plasma': spatial.plasma_effect,
+}
+
+# /control actions; each notes the new look for the snapshot itself, as it starts an effect or
+# replaces it with a static frame
+@router.action('set')
+async def action_set(data, brightness):
+    await set_led(data['data']['index'], data['data']['color'], brightness)
+    snapshot.remember(None, {'brightness': brightness})
+
+@router.action('fill')
+async def action_fill(data, brightness):
+    await fill_all(data['data']['color'], brightness)
+    snapshot.remember(None, {'brightness': brightness})
+
+@router.action('clear')
+async def action_clear(data, brightness):
+    await clear_all()
+    snapshot.remember(None, {'brightness': brightness})
+
+@router.action('range')
+async def action_range(data, brightness):
+    await fill_range(data['data']['start'], data['data']['end'], data['data']['color'], brightness)
+    snapshot.remember(None, {'brightness': brightness})
+
+def effect_action(name):
+    async def start(data, brightness):
+        await effects.start(name, EFFECTS[name](brightness))
+        snapshot.remember(name, {'brightness': brightness})
+    return start
+
+for name in EFFECTS:
+    router.action(name)(effect_action(name))
+
+# Endpoints
+@router.route('GET', '/')
+async def get_page(req, writer):
+    response = webpage()
+    await router.respond(writer, 200, response, 'text/html')
+
+@router.route('GET', '/state')
+async def get_state(req, writer):
+    # Return current LED states for synchronization
+    await router.respond(writer, 200, ujson.dumps({'states': led_states}), 'application/json')
+
+@router.route('GET', '/layout')
+async def get_layout(req, writer):
+    # LED positions shared with the effects in layout.py
+    await send_file(writer, layout.LAYOUT_FILE, 'application/json')
+
+@router.route('GET', '/sim')
+async def get_simulator(req, writer):
+    await router.respond(writer, 200, simulator_page(), 'text/html')
+
+# Frame stream for the simulator page
+STREAM_MIN_MS = 16      # at most about 60 frames a second to the viewer
+STREAM_IDLE_MS = 1000   # resend a still frame this often, which also notices a viewer that left
+MAX_VIEWERS = 1         # a viewer holds a request buffer for as long as it watches
+
+frame_ready = uasyncio.Event()
+viewers = 0
+frame_number = array.array('I', [0])
+
+def frame_pushed():
+    frame_ready.set()
+
+ws2812.show_listeners.append(frame_pushed)
+
+@router.route('GET', '/frames')
+async def get_frames(req, writer):
+    # one record per pushed frame, all little-endian uint32:
+    # the frame number, then 0x00RRGGBB for each LED as the LEDs show it
+    global viewers
+    if viewers >= MAX_VIEWERS:
+        await router.respond(writer, 503, 'Simulator open elsewhere', extra=('Retry-After: 5',))
+        return
+    viewers += 1
+    req.held = True
+    leds = ws2812.NUM_LEDS
+    try:
+        router.start_response(writer, 200, 'application/octet-stream',
+                              ('X-Leds: {}'.format(leds), 'Cache-Control: no-store'))
+        sent = None
+        while ws2812.NUM_LEDS == leds:
+            if ws2812.frames_sent == sent:
+                frame_ready.clear()
+                try:
+                    await uasyncio.wait_for_ms(frame_ready.wait(), STREAM_IDLE_MS)
+                    continue
+                except uasyncio.TimeoutError:
+                    pass
+            started = utime.ticks_ms()
+            sent = ws2812.frames_sent
+            frame_number[0] = sent
+            writer.write(frame_number)
+            writer.write(ws2812.shown())
+            await writer.drain()
+            await uasyncio.sleep_ms(max(STREAM_MIN_MS - utime.ticks_diff(utime.ticks_ms(), started), 0))
+    except OSError:
+        metrics.debug('Simulator viewer left')
+    finally:
+        viewers -= 1
+
+@router.route('GET', '/stats')
+async def get_stats(req, writer):
+    stats_json = ujson.dumps({
+        'supervisor': effects.stats(),
+        'power': power.stats(),
+        'output': output.stats(),
+        'governor': governor.stats(),
+        'frames': ws2812.frame_stats(),
+        'snapshot': snapshot.stats(),
+        'wifi': link.stats(),
+        'commands': commands.stats(),
+    })
+    await router.respond(writer, 200, stats_json, 'application/json')
+
+@router.route('GET', '/memory')
+async def get_memory(req, writer):
+    await router.respond(writer, 200, ujson.dumps(memory.stats()), 'application/json')
+
+@router.route('GET', '/metrics')
+async def get_metrics(req, writer):
+    frames = ws2812.frame_stats()
+    supervised = effects.stats()
+    lines = metrics.prometheus({
+        'frames_sent_total': ('counter', 'Frames pushed to the LEDs', frames['sent']),
+        'frames_skipped_total': ('counter', 'Frames with nothing to push', frames['skipped']),
+        'power_estimate_ma': ('gauge', 'Estimated supply current of the last frame', power.estimate_ma),
+        'power_limited_frames_total': ('counter', 'Frames scaled down to the power budget', power.limited_frames),
+        'quality_level': ('gauge', 'Frame governor quality level, 0 is full quality', governor.level),
+        'quality_degrades_total': ('counter', 'Quality drops because frames ran over budget', governor.degrades),
+        'quality_restores_total': ('counter', 'Quality restored once frames were back within budget', governor.restores),
+        'frame_busy_smoothed_seconds': ('gauge', 'Smoothed busy time per animation frame', governor.smoothed / 8000),
+        'frame_budget_seconds': ('gauge', 'Busy time per frame the governor aims for', governor.budget_ms / 1000),
+        'handovers_total': ('counter', 'Effect changes', supervised['handovers']),
+        'handover_overruns_total': ('counter', 'Effects that missed the handover deadline', supervised['overruns']),
+        'wifi_drops_total': ('counter', 'Wi-Fi link losses', link.drops),
+        'heap_free_bytes': ('gauge', 'Free heap', memory.gc.mem_free()),
+        'heap_largest_block_bytes': ('gauge', 'Largest free heap block at the last sample', memory.largest),
+        'gc_threshold_bytes': ('gauge', 'Allocation between automatic collections', memory.threshold),
+        'shed_connections_total': ('counter', 'Connections refused while the heap was fragmented', memory.shed),
+        'http_requests_total': ('counter', 'Requests dispatched, by route',
+                                {'method="{}",path="{}"'.format(*key): count for key, count in router.hits.items()}),
+        'http_unrouted_total': ('counter', 'Requests for unknown endpoints', router.unrouted),
+        'http_rate_limited_total': ('counter', 'Requests refused by the per-client rate limit', router.limited),
+        'command_queue_depth': ('gauge', 'Commands waiting for the next tick', len(commands.order)),
+        'commands_coalesced_total': ('counter', 'Commands replaced by a later one before being applied', commands.coalesced),
+        'commands_rejected_total': ('counter', 'Commands refused because the queue was full', commands.rejected),
+    })
+    router.start_response(writer, 200, 'text/plain; version=0.0.4')
+    for line in lines:
+        writer.write(line)
+        writer.write('\n')
+    await writer.drain()
+
+@router.route('GET', '/config')
+async def get_config(req, writer):
+    await router.respond(writer, 200, ujson.dumps(config.current.to_dict()), 'application/json')
+
+@router.route('POST', '/config', auth=True)
+async def post_config(req, writer):
+    # a JSON object of settings to change, or an empty body to reload config.json
+    try:
+        if req.body:
+            changed = await apply_config(ujson.loads(bytes(req.body)))
+        else:
+            changed = await apply_config(config.load().to_dict(secrets=True), save=False)
+    except ValueError as e:
+        await router.respond(writer, 400, str(e))
+        return
+    print('Config changed:', changed)
+    await router.respond(writer, 200, ujson.dumps({'changed': sorted(changed)}), 'application/json')
+
+# Commands are applied later by the queue, so anything that would fail there is refused up front
+def _color(value):
+    digits = value[1:] if isinstance(value, str) and value.startswith('#') else value
+    if not isinstance(digits, str) or len(digits) != 6 or not all(c in '0123456789abcdefABCDEF' for c in digits):
+        raise ValueError('color must be #rrggbb')
+
+def _index(value, name):
+    if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value < ws2812.NUM_LEDS:
+        raise ValueError('{} must be an LED index from 0 to {}'.format(name, ws2812.NUM_LEDS - 1))
+    return value
+
+def check_command(action, data, brightness):
+    """Raise ValueError, KeyError or TypeError for a /control payload that can't be applied"""
+    if not isinstance(brightness, int) or isinstance(brightness, bool) or not 0 <= brightness <= 255:
+        raise ValueError('brightness must be 0 to 255')
+    if action == 'set':
+        _index(data['data']['index'], 'index')
+        _color(data['data']['color'])
+    elif action == 'fill':
+        _color(data['data']['color'])
+    elif action == 'range':
+        start = _index(data['data']['start'], 'start')
+        end = _index(data['data']['end'], 'end')
+        if start > end:
+            raise ValueError('start must not be after end')
+        _color(data['data']['color'])
+
+@router.route('POST', '/control')
+async def post_control(req, writer):
+    if realtime.active:
+        # an external DDP controller owns the LEDs until its stream times out
+        await router.respond(writer, 409, 'Realtime stream active')
+        return
+
+    try:
+        data = ujson.loads(bytes(req.body))
+        action = data['action']
+        brightness = data['brightness']
+        if action not in router.actions:
+            await router.respond(writer, 400, 'Unknown action')
+            return
+        check_command(action, data, brightness)
+        metrics.debug('Received command:', action, data)
+        queued = commands.submit(action, data, brightness)
+    except (ValueError, KeyError, TypeError) as e:
+        await router.respond(writer, 400, 'Bad command: {}'.format(e))
+        return
+    if queued:
+        await router.respond(writer, 202, 'Queued')
+    else:
+        await router.respond(writer, 503, 'Command queue full', extra=('Retry-After: 1',))
+
+async def apply_command(action, data, brightness):
+    if realtime.active:
+        return
+    await router.actions[action](data, brightness)
+    metrics.debug('Command', action, 'completed')
+
+# Every request passes through these, in order, before its handler
+router.use(router.count_requests)
+router.use(router.rate_limit(lambda: config.current.rate_limit_per_s, lambda: config.current.rate_limit_burst))
+router.use(router.require_token(lambda: config.current.api_token))
+
+# A burst of clients queues briefly for a request buffer rather than being turned away
+REQUEST_WAIT_MS = 1000
+request_freed = uasyncio.Event()
+
+async def acquire_request():
+    """A pooled Request, waiting up to REQUEST_WAIT_MS for one to be released; None if none was"""
+    deadline = utime.ticks_add(utime.ticks_ms(), REQUEST_WAIT_MS)
+    while True:
+        req = httpreq.acquire()
+        if req is not None:
+            return req
+        left = utime.ticks_diff(deadline, utime.ticks_ms())
+        if left <= 0:
+            return None
+        request_freed.clear()
+        try:
+            await uasyncio.wait_for_ms(request_freed.wait(), left)
+        except uasyncio.TimeoutError:
+            return None
+
 # Handle HTTP requests
 async def handle_client(reader, writer):
+    parsed_at = None
+    req = None
     try:
-        uasyncio.create_task(led_status_request())
-        
-        request_line = await reader.readline()
-        if not request_line:
+        if memory.shedding:
+            # the heap is too fragmented to build a response safely
+            memory.shed += 1
+            await router.respond(writer, 503, extra=('Retry-After: 10',))
             return
-        
-        request = request_line.decode().strip()
-        print('Request:', request)
-        
-        headers = {}
-        content_length = 0
-        while True:
-            line = await reader.readline()
-            if line == b'\r\n' or line == b'\n' or not line:
-                break
-            if b':' in line:
-                key, value = line.decode().strip().split(':', 1)
-                headers[key.strip().lower()] = value.strip()
-                if key.strip().lower() == 'content-length':
-                    content_length = int(value.strip())
-        
-        parts = request.split()
-        if len(parts) < 2:
+
+        req = await acquire_request()
+        if req is None:
+            await router.respond(writer, 503, extra=('Retry-After: 1',))
             return
+
+        uasyncio.create_task(led_status_request())
         
-        method = parts[0]
-        path = parts[1]
-        
-        if path == '/' and method == 'GET':
-            response = webpage()
-            writer.write('HTTP/1.1 200 OK\r\n')
-            writer.write('Content-Type: text/html\r\n')
-            writer.write('Connection: close\r\n')
-            writer.write('\r\n')
-            writer.write(response)
-            await writer.drain()
-        
-        elif path == '/state' and method == 'GET':
-            # Return current LED states for synchronization
-            state_json = ujson.dumps({'states': led_states})
-            writer.write('HTTP/1.1 200 OK\r\n')
-            writer.write('Content-Type: application/json\r\n')
-            writer.write('Connection: close\r\n')
-            writer.write('\r\n')
-            writer.write(state_json)
-            await writer.drain()
+        started = utime.ticks_us()
+        try:
+            if not await req.read(reader):
+                return
+        except httpreq.HttpError as e:
+            metrics.debug('Bad request:', e.status, e.reason)
+            await router.respond(writer, e.status, e.reason)
+            return
+        req.client = writer.get_extra_info('peername')[0]
+        metrics.HTTP_PARSE.since(started)
+        metrics.debug('Request:', req.method, req.path)
+        parsed_at = utime.ticks_us()
         
-        elif path == '/control' and method == 'POST':
-            body = b''
-            if content_length > 0:
-                body = await reader.read(content_length)
-            
-            try:
-                data = ujson.loads(body.decode())
-                action = data['action']
-                brightness = data['brightness']
-                
-                print('='*40)
-                print(f'Received command: {action}')
-                print(f'Data: {data}')
-                print(f'Brightness: {brightness}')
-                print('='*40)
-                
-                if action == 'set':
-                    await set_led(data['data']['index'], data['data']['color'], brightness)
-                elif action == 'fill':
-                    await fill_all(data['data']['color'], brightness)
-                elif action == 'clear':
-                    await clear_all()
-                elif action == 'range':
-                    await fill_range(data['data']['start'], data['data']['end'], 
-                                   data['data']['color'], brightness)
-                elif action == 'rainbow':
-                    global animation_task
-                    await stop_animation()
-                    animation_task = uasyncio.create_task(rainbow_effect(brightness))
-                elif action == 'wave':
-                    global animation_task
-                    await stop_animation()
-                    animation_task = uasyncio.create_task(wave_effect(brightness))
-                
-                print(f'Command {action} completed successfully')
-                
-                writer.write('HTTP/1.1 200 OK\r\n')
-                writer.write('Content-Type: text/plain\r\n')
-                writer.write('Connection: close\r\n')
-                writer.write('\r\n')
-                writer.write('OK')
-                await writer.drain()
-            except Exception as e:
-                print('Control error:', e)
-                writer.write('HTTP/1.1 500 Error\r\n\r\n')
-                await writer.drain()
+        await router.dispatch(req, writer)
         
     except Exception as e:
         print('Request error:', e)
     finally:
+        if parsed_at is not None and not req.held:
+            metrics.HTTP_RESPOND.since(parsed_at)
+        if req is not None:
+            httpreq.release(req)
+            request_freed.set()
         try:
             writer.close()
             await writer.wait_closed()
         except:
             pass
 
-# Start web server
-async def start_server(ip):
-    print('Starting server on', ip)
-    server = await uasyncio.start_server(handle_client, "0.0.0.0", 80)
+# A DDP stream takes over the tree; when it times out, whatever was showing before comes back:
+# the effect snapshot.remember() last noted, or else the static frame kept here
+paused_frame = array.array("I")
+
+async def realtime_started():
+    global paused_frame
+    await stop_animation()
+    if len(paused_frame) != ws2812.NUM_LEDS:
+        paused_frame = array.array("I", [0 for _ in range(ws2812.NUM_LEDS)])
+    paused_frame[:] = ws2812.ar
+
+async def realtime_stopped():
+    name = snapshot.effect
+    if name in EFFECTS:
+        print('Resuming', name)
+        await effects.start(name, EFFECTS[name](snapshot.params['brightness']))
+    elif len(paused_frame) == ws2812.NUM_LEDS:
+        ws2812.ar[:] = paused_frame
+        ws2812.pixels_touched(0, ws2812.NUM_LEDS)
+        ws2812.pixels_show()
+
+# Listeners follow the Wi-Fi link: started when it comes up, closed when it drops
+async def network_up(ip):
+    global web_server, ddp_task
+    web_server = await uasyncio.start_server(handle_client, "0.0.0.0", 80)
+    ddp_task = uasyncio.create_task(realtime.serve(on_start=realtime_started, on_stop=realtime_stopped))
     print('Server running on http://{}:80'.format(ip))
-    print('Multiple devices can connect!')
-    while True:
-        await uasyncio.sleep(1)
+
+async def network_down():
+    global web_server, ddp_task
+    if ddp_task:
+        ddp_task.cancel()
+        ddp_task = None
+    if web_server:
+        web_server.close()
+        await web_server.wait_closed()
+        web_server = None
+    print('Server stopped until Wi-Fi is back')
+
+link = wifi.Link(config.current, on_up=network_up, on_down=network_down, on_status=set_led_status)
 
 # Main function
 async def main():
-    await clear_all()
-    ip = await connect_wifi()
-    await start_server(ip)
+    # bring back the last look before Wi-Fi, which can take 20 s to come up
+    restored = snapshot.restore()
+    if restored is None:
+        await clear_all()
+    else:
+        led_states[:] = ['#{:06x}'.format(ws2812.ar[i]) for i in range(ws2812.NUM_LEDS)]
+        name, params = restored
+        if name in EFFECTS:
+            await effects.start(name, EFFECTS[name](params['brightness']))
+    uasyncio.create_task(snapshot.run())
+    uasyncio.create_task(memory.run())
+    uasyncio.create_task(commands.run(apply_command, ws2812.pixels_show))
+    await link.run()
 
 # Run the server
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+# Wi-Fi link supervisor.
+#
+# Link.run() owns the station interface: it connects in the background,
+# backs off exponentially while the access point is unreachable, and watches
+# the link once it is up. on_up/on_down let the web server start and stop
+# its listeners as the link comes and goes, so nothing else has to wait for
+# Wi-Fi and a dropped AP no longer needs a reboot.
+
+import network
+import uasyncio
+import utime
+
+CONNECT_TIMEOUT_MS = 20000
+POLL_MS = 250              # status polling while a connect is in progress
+CHECK_PERIOD_MS = 2000     # link polling once connected
+BACKOFF_MIN_MS = 1000
+BACKOFF_MAX_MS = 60000
+
+STAT_GOT_IP = 3
+
+DOWN = 'down'
+CONNECTING = 'connecting'
+UP = 'up'
+
+
+class Link:
+    """Keeps the station interface connected to the configured network
+
+    on_up(ip) and on_down() are coroutines; on_status(status) is called with
+    'connecting', 'connected' or 'error' for the onboard LED.
+    """
+
+    def __init__(self, cfg, on_up=None, on_down=None, on_status=None):
+        self.cfg = cfg
+        self.on_up = on_up
+        self.on_down = on_down
+        self.on_status = on_status
+        self.wlan = None
+        self.state = DOWN
+        self.ip = None
+        self.backoff_ms = BACKOFF_MIN_MS
+
+        self.attempts = 0
+        self.failures = 0
+        self.drops = 0
+        self.up_since = 0
+
+    def _status(self, status):
+        if self.on_status:
+            self.on_status(status)
+
+    async def _call(self, callback, *args):
+        # False when the callback raised; the link carries on either way
+        try:
+            await callback(*args)
+            return True
+        except Exception as e:
+            print('Wi-Fi link callback failed:', e)
+            return False
+
+    async def _backoff(self):
+        print('Retrying Wi-Fi in', self.backoff_ms, 'ms')
+        await uasyncio.sleep_ms(self.backoff_ms)
+        self.backoff_ms = min(self.backoff_ms * 2, BACKOFF_MAX_MS)
+
+    async def _connect(self):
+        # one attempt; returns the IP address, or None when it failed or timed out
+        wlan = self.wlan
+        cfg = self.cfg
+        wlan.active(True)
+        if cfg.static_ip:
+            wlan.ifconfig((cfg.static_ip, cfg.subnet_mask, cfg.gateway, cfg.dns))
+        wlan.connect(cfg.ssid, cfg.password)
+
+        started = utime.ticks_ms()
+        while utime.ticks_diff(utime.ticks_ms(), started) < CONNECT_TIMEOUT_MS:
+            status = wlan.status()
+            if status < 0 or status >= STAT_GOT_IP:
+                break
+            await uasyncio.sleep_ms(POLL_MS)
+
+        if wlan.status() == STAT_GOT_IP:
+            return wlan.ifconfig()[0]
+        print('Wi-Fi connect failed, status', wlan.status())
+        wlan.disconnect()
+        return None
+
+    async def run(self):
+        """Connect, watch and reconnect forever"""
+        if self.wlan is None:
+            self.wlan = network.WLAN(network.STA_IF)
+        while True:
+            self.state = CONNECTING
+            self.attempts += 1
+            self._status('connecting')
+            print('Connecting to', self.cfg.ssid)
+            ip = await self._connect()
+            if ip is None:
+                self.state = DOWN
+                self.failures += 1
+                self._status('error')
+                await self._backoff()
+                continue
+
+            self.state = UP
+            self.ip = ip
+            self.backoff_ms = BACKOFF_MIN_MS
+            self.up_since = utime.ticks_ms()
+            print('Connected, IP:', ip)
+            self._status('connected')
+            if self.on_up and not await self._call(self.on_up, ip):
+                # e.g. EADDRINUSE from start_server after a fast reconnect: tear down and try again
+                self.state = DOWN
+                self.ip = None
+                self.failures += 1
+                self._status('error')
+                if self.on_down:
+                    await self._call(self.on_down)
+                self.wlan.disconnect()
+                await self._backoff()
+                continue
+
+            while self.wlan.status() == STAT_GOT_IP:
+                await uasyncio.sleep_ms(CHECK_PERIOD_MS)
+
+            print('Wi-Fi link lost, status', self.wlan.status())
+            self.state = DOWN
+            self.ip = None
+            self.drops += 1
+            if self.on_down:
+                await self._call(self.on_down)
+            self.wlan.disconnect()
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'ip': self.ip,
+            'attempts': self.attempts,
+            'failures': self.failures,
+            'drops': self.drops,
+            'backoff_ms': self.backoff_ms,
+            'up_ms': utime.ticks_diff(utime.ticks_ms(), self.up_since) if self.state == UP else 0,
+        }
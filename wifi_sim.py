@@ -0,0 +1,61 @@
+# Host-side run of wifi.Link against a flapping fake access point.
+#
+#   python3 wifi_sim.py --script fail,fail,800,fail,1500,0
+#
+# Each entry is one connect attempt: "fail" when the AP is not found, or
+# how many ms the link stays up ("0" stays up). Timings are scaled down so
+# a whole script plays out in a few seconds, and every state change is
+# printed alongside the link stats at the end.
+
+import argparse
+import asyncio
+import time
+
+import hostshim
+
+hostshim.install()
+
+import config  # noqa: E402
+import wifi    # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run wifi.Link against a flapping fake access point')
+    parser.add_argument('--script', default='fail,fail,800,fail,1500,0',
+                        help='comma separated connect outcomes: fail or ms of uptime')
+    parser.add_argument('--seconds', type=float, default=6)
+    args = parser.parse_args()
+
+    hostshim.FakeWLAN.script = [None if s == 'fail' else int(s) for s in args.script.split(',')]
+    hostshim.FakeWLAN.connect_ms = 50
+    wifi.CONNECT_TIMEOUT_MS = 400
+    wifi.POLL_MS = 10
+    wifi.CHECK_PERIOD_MS = 50
+    wifi.BACKOFF_MIN_MS = 100
+    wifi.BACKOFF_MAX_MS = 800
+
+    start = time.monotonic()
+
+    def log(*what):
+        print(f'{(time.monotonic() - start) * 1000:7.0f} ms', *what)
+
+    async def on_up(ip):
+        log('listeners up on', ip)
+
+    async def on_down():
+        log('listeners down')
+
+    link = wifi.Link(config.current, on_up=on_up, on_down=on_down, on_status=lambda s: log('LED', s))
+
+    async def run():
+        try:
+            await asyncio.wait_for(link.run(), args.seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(run())
+    print(link.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -4,16 +4,21 @@ from micropython import const
 import rp2
 import uasyncio
 import utime
-import random
 import gc
-
-PIN_NUM = const(22)
-
-# Configure the number of WS2812 LEDs.
-NUM_LEDS = const(283)  # must be a multiple of GROUP_SIZE
+import config
+import power
+import output
+import governor
+import clock
+import metrics
+
+MAX_STRIPS = const(8)  # 4 state machines on each of PIO0 and PIO1
+PUSH_CHUNK = const(8)  # words per FIFO write, the depth of a joined TX FIFO
 GROUP_SIZE = const(1)
 
 BRIGHTNESSES = array.array("I", [30, 100, 200, 255, 200, 100])
+BRIGHTNESS_PERIOD = const(6)  # brightness[] repeats every len(BRIGHTNESSES) LEDs
+FREEZE_PERIOD = const(30)     # ... and lines up with every 10th LED again after 30
 
 FOREST_RED = const(0)
 FOREST_GREEN = const(255)
@@ -23,28 +28,31 @@ CHERRY_RED = const(208)
 CHERRY_GREEN = const(45)
 CHERRY_BLUE = const(121)
 
-FAST_SEQUENCE_PERIOD_MS = const(750)
-FAST_SEQUENCE_TWINKLE_DURATION_MS = const(200)
+# Output strips as (pin, number of LEDs). Each strip is driven by its own PIO
+# state machine and shows the next slice of the logical frame buffer, so
+# adding strips adds LEDs without slowing the refresh.
+# The wiring and the timings below come from config.json, see configure().
+STRIPS = ()
+NUM_LEDS = 0  # must be a multiple of GROUP_SIZE
 
-TWINKLING_PERIOD_FIXED_MS = const(20)
-TWINKLING_PERIOD_MAX_VARIABLE_MS = const(100)
-TWINKLING_DURATION_MS = const(700)  # this is the half-period
+FAST_SEQUENCE_PERIOD_MS = 750
+FAST_SEQUENCE_TWINKLE_DURATION_MS = 200
 
-FADE_IN_DURATION_MS = const(2000)
-FADEOUT_TIME_MS = const(800)
-FADE_TO_CHERRY_DURATION = const(2000)
+TWINKLING_PERIOD_FIXED_MS = 20
+TWINKLING_PERIOD_MAX_VARIABLE_MS = 100
+TWINKLING_DURATION_MS = 700  # this is the half-period
+
+FADE_IN_DURATION_MS = 2000
+FADEOUT_TIME_MS = 800
+FADE_TO_CHERRY_DURATION = 2000
 
 TWINKLE_COLOURS_RED = [255, 255, 255]
 TWINKLE_COLOURS_GREEN = [255, 54, 230]
 TWINKLE_COLOURS_BLUE = [255, 158, 0]
 TWINKLE_COLOUR = 1
 
-brightness = array.array("I", [0 for _ in range(NUM_LEDS)])
-for led in range(NUM_LEDS):
-    brightness[led] = BRIGHTNESSES[led % 6]
-
 
-@rp2.asm_pio(sideset_init=rp2.PIO.OUT_LOW, out_shiftdir=rp2.PIO.SHIFT_LEFT, autopull=True, pull_thresh=24)
+@rp2.asm_pio(sideset_init=rp2.PIO.OUT_LOW, out_shiftdir=rp2.PIO.SHIFT_LEFT, autopull=True, pull_thresh=24, fifo_join=rp2.PIO.JOIN_TX)
 def ws2812():
     T1 = 2
     T2 = 5
@@ -59,33 +67,419 @@ def ws2812():
     wrap()
 
 
-# Create the StateMachine with the ws2812 program, outputting on pin
-sm = rp2.StateMachine(0, ws2812, freq=8_000_000, sideset_base=Pin(PIN_NUM))
-
-# Start the StateMachine, it will wait for data on its FIFO.
-sm.active(1)
-
-# Display a pattern on the LEDs via an array of LED RGB values.
-ar = array.array("I", [0 for _ in range(NUM_LEDS)])
+def strip_segments(lengths):
+    # (first LED, count) of each strip's slice of the logical frame
+    segments = []
+    first = 0
+    for count in lengths:
+        segments.append((first, count))
+        first += count
+    return segments
+
+
+def push_plan(segments, state_machines, buffer, chunk=PUSH_CHUNK):
+    # Interleave the strips in FIFO-sized chunks so every state machine keeps
+    # shifting while the others are fed. The views are built once, so a frame
+    # push allocates nothing. Each entry is (state machine, view, first LED of
+    # the view, end of its strip) so pixels_show can leave out clean strips.
+    mv = memoryview(buffer)
+    if len(segments) == 1:
+        first, count = segments[0]
+        return [(state_machines[0], mv[first:first + count], first, first + count)]
+    plan = []
+    longest = max(count for _, count in segments)
+    for offset in range(0, longest, chunk):
+        for (first, count), sm in zip(segments, state_machines):
+            if offset < count:
+                plan.append((sm, mv[first + offset:first + min(offset + chunk, count)], first + offset, first + count))
+    return plan
+
+
+state_machines = []
+ar = array.array("I")
+brightness = array.array("I")
+segments = []
+plan = []
+
+# r + g + b of every pixel and their running total, for the power estimate
+channel_sums = array.array("H")
+channel_total = 0
+
+# the power limiter and colour correction write their copy of the frame here
+out = array.array("I")
+out_plan = []
+
+# With render_bits 16, fades also keep 16 bits per channel here, r, g, b for
+# each LED, and the output stage quantises from it. ar still holds the top
+# byte of every channel, so everything else reads the frame as before. An
+# LED whose top bytes no longer match ar was since written at 8 bits, and
+# goes out from ar.
+FINE = False
+fine = array.array("H")
+
+# room to stage moves within the frame, so source and destination may overlap
+scratch = array.array("I")
+scratch_sums = array.array("H")
+scratch_fine = array.array("H")
+
+# LEDs start..stop-1 changed since the last push; an empty range means nothing to send
+REFRESH_MS = const(1000)  # resend an unchanged frame this often anyway, 0 never
+dirty_start = 0
+dirty_stop = 0
+last_sent = 0
+sent_copy = False
+frames_sent = 0
+frames_skipped = 0
+
+
+def configure(cfg):
+    """Apply a config.Config; buffers and state machines are only rebuilt when the strips changed"""
+    global FAST_SEQUENCE_PERIOD_MS, FAST_SEQUENCE_TWINKLE_DURATION_MS
+    global TWINKLING_PERIOD_FIXED_MS, TWINKLING_PERIOD_MAX_VARIABLE_MS, TWINKLING_DURATION_MS
+    global FADE_IN_DURATION_MS, FADEOUT_TIME_MS, FADE_TO_CHERRY_DURATION
+    global STRIPS, NUM_LEDS, state_machines, ar, brightness, segments, plan
+    global channel_sums, channel_total, out, out_plan, dirty_start, dirty_stop
+    global scratch, scratch_sums, FINE, fine, scratch_fine
+
+    FAST_SEQUENCE_PERIOD_MS = cfg.fast_sequence_period_ms
+    FAST_SEQUENCE_TWINKLE_DURATION_MS = cfg.fast_sequence_twinkle_duration_ms
+    TWINKLING_PERIOD_FIXED_MS = cfg.twinkling_period_fixed_ms
+    TWINKLING_PERIOD_MAX_VARIABLE_MS = cfg.twinkling_period_max_variable_ms
+    TWINKLING_DURATION_MS = cfg.twinkling_duration_ms
+    FADE_IN_DURATION_MS = cfg.fade_in_duration_ms
+    FADEOUT_TIME_MS = cfg.fadeout_time_ms
+    FADE_TO_CHERRY_DURATION = cfg.fade_to_cherry_duration
+    power.configure(cfg)
+    output.configure(cfg, cfg.num_leds)
+    governor.configure(cfg)
+    FINE = cfg.render_bits == 16
+    if len(fine) != (3 * cfg.num_leds if FINE else 0):
+        fine = array.array("H", [0 for _ in range(3 * cfg.num_leds if FINE else 0)])
+        scratch_fine = array.array("H", [0 for _ in range(len(fine))])
+
+    strips = tuple((pin, count) for pin, count in cfg.strips)
+    if strips == STRIPS:
+        return False
+    if len(strips) > MAX_STRIPS:
+        raise ValueError("at most {} strips are supported".format(MAX_STRIPS))
+
+    # Create a StateMachine with the ws2812 program for each strip, outputting on its pin.
+    # Each one starts straight away and waits for data on its FIFO.
+    for sm in state_machines:
+        sm.active(0)
+    state_machines = []
+    for sm_id, (pin, _) in enumerate(strips):
+        sm = rp2.StateMachine(sm_id, ws2812, freq=8_000_000, sideset_base=Pin(pin))
+        sm.active(1)
+        state_machines.append(sm)
+    STRIPS = strips
+    NUM_LEDS = sum(count for _, count in strips)
+
+    # Display a pattern on the LEDs via an array of LED RGB values.
+    ar = array.array("I", [0 for _ in range(NUM_LEDS)])
+    brightness = array.array("I", [BRIGHTNESSES[led % 6] for led in range(NUM_LEDS)])
+    channel_sums = array.array("H", [0 for _ in range(NUM_LEDS)])
+    channel_total = 0
+    out = array.array("I", [0 for _ in range(NUM_LEDS)])
+    scratch = array.array("I", [0 for _ in range(NUM_LEDS)])
+    scratch_sums = array.array("H", [0 for _ in range(NUM_LEDS)])
+
+    segments = strip_segments([count for _, count in strips])
+    plan = push_plan(segments, state_machines, ar)
+    out_plan = push_plan(segments, state_machines, out)
+    dirty_start = 0
+    dirty_stop = NUM_LEDS
+    return True
+
+
+configure(config.current)
+
+
+# called with no arguments after every frame is pushed out
+show_listeners = [governor.frame_shown]
 
 
 def pixels_show():
-    dimmer_ar = array.array("I", [0 for _ in range(NUM_LEDS)])
-    for i,c in enumerate(ar):
-        r = (c >> 8) & 0xFF
-        g = (c >> 16) & 0xFF
-        b = c & 0xFF
-        dimmer_ar[i] = (g<<16) + (r<<8) + b
-    sm.put(dimmer_ar, 8)
+    global dirty_start, dirty_stop, last_sent, sent_copy, frames_sent, frames_skipped
+    now = utime.ticks_ms()
+    if output.dither and governor.dithering():
+        # the fractions carried between frames move every LED on every push
+        start, stop = 0, NUM_LEDS
+    elif REFRESH_MS and utime.ticks_diff(now, last_sent) >= REFRESH_MS:
+        # a periodic full resend recovers LEDs upset by noise on the data line
+        start, stop = 0, NUM_LEDS
+    else:
+        start, stop = dirty_start, dirty_stop
+
+    if start < stop:
+        t0 = utime.ticks_us()
+        lut = None
+        if output.active:
+            # colour correction writes out, with the power scale folded into its tables. The
+            # estimate comes from the corrected channels, which is what the strip draws. It is
+            # only known once the frame is rendered at the last frame's scale, so when that
+            # scale turns out wrong the frame is rendered again at the right one
+            rendered = power.scale
+            wide = fine if FINE else None
+            total = output.render(ar, out, NUM_LEDS, rendered, wide)
+            wanted = power.limit_output(total, rendered, channel_total, NUM_LEDS)
+            if wanted != rendered:
+                output.render(ar, out, NUM_LEDS, wanted, wide)
+            chunks = out_plan
+        else:
+            lut = power.limit(channel_total, NUM_LEDS)
+            if lut is None:
+                chunks = plan
+            else:
+                # over budget: push a scaled copy and leave the frame itself untouched
+                for i in range(NUM_LEDS):
+                    c = ar[i]
+                    out[i] = (lut[c >> 16] << 16) + (lut[(c >> 8) & 0xFF] << 8) + lut[c & 0xFF]
+                chunks = out_plan
+        metrics.FRAME_LIMIT.since(t0)
+        if lut is not None or sent_copy or output.active:
+            # the scale and the correction apply to every LED, including the ones that didn't change
+            start, stop = 0, NUM_LEDS
+        sent_copy = lut is not None or output.active
+        # a strip keeps whatever follows the data it is sent, so stop after the last change
+        t0 = utime.ticks_us()
+        for sm, chunk, first, strip_stop in chunks:
+            if first < stop and strip_stop > start:
+                sm.put(chunk, 8)
+        metrics.PIO_PUSH.since(t0)
+        dirty_start = NUM_LEDS
+        dirty_stop = 0
+        last_sent = now
+        frames_sent += 1
+    else:
+        frames_skipped += 1
+
+    for listener in show_listeners:
+        listener()
 
 
 def pixels_set(i, color):
+    global channel_total, dirty_start, dirty_stop
     ar[i] = (color[0]<<16) + (color[1]<<8) + color[2]
+    s = color[0] + color[1] + color[2]
+    channel_total += s - channel_sums[i]
+    channel_sums[i] = s
+    if i < dirty_start:
+        dirty_start = i
+    if i >= dirty_stop:
+        dirty_stop = i + 1
+
+
+def pixels_set_scaled(i, color, num, den):
+    """Set LED i to color * num // den, kept at 16 bits per channel when render_bits is 16"""
+    if not FINE:
+        pixels_set(i, (min(color[0] * num // den, 255), min(color[1] * num // den, 255), min(color[2] * num // den, 255)))
+        return
+    num *= 257  # so a full 255 comes out as 0xFFFF
+    r = min(color[0] * num // den, 0xFFFF)
+    g = min(color[1] * num // den, 0xFFFF)
+    b = min(color[2] * num // den, 0xFFFF)
+    j = 3 * i
+    fine[j] = r
+    fine[j + 1] = g
+    fine[j + 2] = b
+    pixels_set(i, (r >> 8, g >> 8, b >> 8))
 
 
 def pixels_fill(color):
-    for i in range(len(ar)):
-        pixels_set(i, color)
+    pixels_fill_range(0, NUM_LEDS, color)
+
+
+def _tile(buf, start, period, stop):
+    # repeat buf[start:start+period] up to stop, doubling the copied block
+    # each time: log2(n) memory copies instead of n interpreted stores
+    mv = memoryview(buf)
+    done = period
+    count = stop - start
+    while done < count:
+        step = min(done, count - done)
+        mv[start + done:start + done + step] = mv[start:start + step]
+        done += step
+
+
+def _range_sum(start, stop):
+    return sum(memoryview(channel_sums)[start:stop])
+
+
+def pixels_fill_range(start, stop, color):
+    """Set LEDs start..stop-1 to one colour"""
+    global channel_total
+    if start >= stop:
+        return
+    s = color[0] + color[1] + color[2]
+    channel_total += s * (stop - start) - _range_sum(start, stop)
+    ar[start] = (color[0]<<16) + (color[1]<<8) + color[2]
+    channel_sums[start] = s
+    _tile(ar, start, 1, stop)
+    _tile(channel_sums, start, 1, stop)
+    if FINE:
+        j = 3 * start
+        fine[j] = color[0] * 257
+        fine[j + 1] = color[1] * 257
+        fine[j + 2] = color[2] * 257
+        _tile(fine, j, 3, 3 * stop)
+    _mark(start, stop)
+
+
+def pixels_tile(start, period, stop):
+    """Repeat the pattern in LEDs start..start+period-1 up to stop"""
+    global channel_total
+    if start + period >= stop:
+        return
+    before = _range_sum(start + period, stop)
+    _tile(ar, start, period, stop)
+    _tile(channel_sums, start, period, stop)
+    if FINE:
+        _tile(fine, 3 * start, 3 * period, 3 * stop)
+    channel_total += _range_sum(start + period, stop) - before
+    _mark(start + period, stop)
+
+
+def _moved():
+    # (buffer, its scratch, entries per LED) for every per-LED buffer a move has to carry
+    if FINE:
+        return ((ar, scratch, 1), (channel_sums, scratch_sums, 1), (fine, scratch_fine, 3))
+    return ((ar, scratch, 1), (channel_sums, scratch_sums, 1))
+
+
+def pixels_copy(dst, src, count):
+    """Copy count LEDs from src to dst; the ranges may overlap"""
+    global channel_total
+    if count <= 0:
+        return
+    before = _range_sum(dst, dst + count)
+    for buf, stage, width in _moved():
+        mv = memoryview(buf)
+        staged = memoryview(stage)
+        staged[:width * count] = mv[width * src:width * (src + count)]
+        mv[width * dst:width * (dst + count)] = staged[:width * count]
+    channel_total += _range_sum(dst, dst + count) - before
+    _mark(dst, dst + count)
+
+
+def pixels_rotate(start, stop, n):
+    """Move LEDs start..stop-1 along by n (negative goes backwards), wrapping round"""
+    count = stop - start
+    if count <= 0:
+        return
+    n %= count
+    if n == 0:
+        return
+    for buf, stage, width in _moved():
+        mv = memoryview(buf)
+        staged = memoryview(stage)
+        staged[:width * count] = mv[width * start:width * stop]
+        mv[width * (start + n):width * stop] = staged[:width * (count - n)]
+        mv[width * start:width * (start + n)] = staged[width * (count - n):width * count]
+    _mark(start, stop)
+
+
+def pixels_shift(start, stop, n, color=(0, 0, 0)):
+    """Move LEDs start..stop-1 along by n, filling the LEDs left behind with color"""
+    if abs(n) >= stop - start:
+        pixels_fill_range(start, stop, color)
+    elif n > 0:
+        pixels_copy(start + n, start, stop - start - n)
+        pixels_fill_range(start, start + n, color)
+    elif n < 0:
+        pixels_copy(start, start - n, stop - start + n)
+        pixels_fill_range(stop + n, stop, color)
+
+
+def pixels_mirror(start, stop):
+    """Make the second half of start..stop-1 a reflection of the first half"""
+    global channel_total
+    for k in range((stop - start) // 2):
+        i = stop - 1 - k
+        channel_total += channel_sums[start + k] - channel_sums[i]
+        ar[i] = ar[start + k]
+        channel_sums[i] = channel_sums[start + k]
+        if FINE:
+            j = 3 * i
+            m = 3 * (start + k)
+            fine[j] = fine[m]
+            fine[j + 1] = fine[m + 1]
+            fine[j + 2] = fine[m + 2]
+    _mark(start, stop)
+
+
+def pixels_blend_range(start, stop, color, amount):
+    """Mix color into LEDs start..stop-1; amount runs from 0 (unchanged) to 256 (all color)"""
+    keep = 256 - amount
+    red = color[0] * amount
+    green = color[1] * amount
+    blue = color[2] * amount
+    if FINE:
+        # blend the 16-bit channels, starting from the frame where it was since written at 8 bits,
+        # and take the frame's top bytes from the result
+        j = 3 * start
+        for i in range(start, stop):
+            c = ar[i]
+            r = fine[j] if fine[j] >> 8 == c >> 16 else (c >> 16) * 257
+            g = fine[j + 1] if fine[j + 1] >> 8 == (c >> 8) & 0xFF else ((c >> 8) & 0xFF) * 257
+            b = fine[j + 2] if fine[j + 2] >> 8 == c & 0xFF else (c & 0xFF) * 257
+            r = (r * keep + red * 257) >> 8
+            g = (g * keep + green * 257) >> 8
+            b = (b * keep + blue * 257) >> 8
+            fine[j] = r
+            fine[j + 1] = g
+            fine[j + 2] = b
+            ar[i] = ((r >> 8) << 16) + ((g >> 8) << 8) + (b >> 8)
+            j += 3
+        pixels_touched(start, stop)
+        return
+    for i in range(start, stop):
+        c = ar[i]
+        ar[i] = ((((c >> 16) * keep + red) >> 8) << 16) + (((((c >> 8) & 0xFF) * keep + green) >> 8) << 8) + (((c & 0xFF) * keep + blue) >> 8)
+    pixels_touched(start, stop)
+
+
+def pixels_set_bytes(first, buf, pos, count):
+    # copy count packed RGB triplets from buf[pos:] into the frame, starting at LED first
+    global channel_total
+    _mark(first, first + count)
+    for i in range(first, first + count):
+        ar[i] = (buf[pos]<<16) + (buf[pos+1]<<8) + buf[pos+2]
+        s = buf[pos] + buf[pos+1] + buf[pos+2]
+        channel_total += s - channel_sums[i]
+        channel_sums[i] = s
+        pos += 3
+
+
+def _mark(start, stop):
+    global dirty_start, dirty_stop
+    if start < dirty_start:
+        dirty_start = start
+    if stop > dirty_stop:
+        dirty_stop = stop
+
+
+def pixels_touched(start, stop):
+    # re-derive the bookkeeping for LEDs start..stop-1 after writing ar directly
+    global channel_total
+    _mark(start, stop)
+    for i in range(start, stop):
+        c = ar[i]
+        s = (c >> 16) + ((c >> 8) & 0xFF) + (c & 0xFF)
+        channel_total += s - channel_sums[i]
+        channel_sums[i] = s
+
+
+def shown():
+    """The buffer last pushed to the LEDs: the frame, or its power-limited copy"""
+    return out if sent_copy else ar
+
+
+def frame_stats():
+    return {
+        'sent': frames_sent,
+        'skipped': frames_skipped,
+    }
 
 
 def wheel(pos, milli_brightness:int=1000):
@@ -109,15 +503,16 @@ def wheel(pos, milli_brightness:int=1000):
  
  
 async def rainbow_cycle_2(wait, color_range=list(range(255)), duration=10, speed=1, wavelength=1.0, milli_brightness=1000):
-    start_time = utime.time()
-    start_ticks = utime.ticks_ms()
-    while utime.time() < start_time + duration:
-        hue_offset = int(utime.ticks_diff(start_ticks, utime.ticks_ms()) * speed / 1000)
+    animation = clock.Animation()
+    now = 0
+    while now < duration * 1000:
+        hue_offset = int(-now * speed / 1000)
         for i in range(NUM_LEDS):
             arr_offset = (int(hue_offset + (i * wavelength))) % len(color_range)
             pixels_set(i, wheel(color_range[arr_offset], milli_brightness))
-        await pixels_show()
-        await uasyncio.sleep(wait)
+        pixels_show()
+        await clock.sleep_ms(int(wait * 1000))
+        now = animation.now()
 
 
 async def fast_sequence(next_button_pressed, twinkles, ticks):
@@ -128,37 +523,39 @@ async def fast_sequence(next_button_pressed, twinkles, ticks):
     next_led = 5
 
     while not next_button_pressed.is_set():
-        for led in range(NUM_LEDS):
-            pixels_set(led, (
-                (red*brightness[led]) // 255,
-                (green*brightness[led]) // 255,
-                (blue*brightness[led]) // 255
-            ))
-
-        if utime.ticks_diff(utime.ticks_ms(), ticks) >= FAST_SEQUENCE_PERIOD_MS:
-            for i in range(0, NUM_LEDS, GROUP_SIZE):
+        if governor.static_due():
+            for led in range(min(BRIGHTNESS_PERIOD, NUM_LEDS)):
+                pixels_set(led, (
+                    (red*brightness[led]) // 255,
+                    (green*brightness[led]) // 255,
+                    (blue*brightness[led]) // 255
+                ))
+            pixels_tile(0, BRIGHTNESS_PERIOD, NUM_LEDS)
+
+        if clock.ticks_diff(clock.ticks_ms(), ticks) >= FAST_SEQUENCE_PERIOD_MS:
+            for i in range(0, NUM_LEDS, GROUP_SIZE * governor.twinkle_stride()):
                 twinkles.append({
-                    "starttime": utime.ticks_ms(),
-                    "position": next_led + i,
+                    "starttime": clock.ticks_ms(),
+                    "position": (next_led + i) % NUM_LEDS,
                 })
                 twinkles.append({
-                    "starttime": utime.ticks_ms(),
-                    "position": next_led + i + 2,
+                    "starttime": clock.ticks_ms(),
+                    "position": (next_led + i + 2) % NUM_LEDS,
                 })
-            ticks = utime.ticks_ms()
+            ticks = clock.ticks_ms()
             next_led = (next_led + 10) % GROUP_SIZE
 
         for twinkle in twinkles:
-            offset = utime.ticks_diff(utime.ticks_ms(),twinkle["starttime"])
+            offset = clock.ticks_diff(clock.ticks_ms(),twinkle["starttime"])
             red_blue_component = 255 - abs(((offset-FAST_SEQUENCE_TWINKLE_DURATION_MS) * 255) // FAST_SEQUENCE_TWINKLE_DURATION_MS)
             green_component = 255 - abs(((offset-FAST_SEQUENCE_TWINKLE_DURATION_MS) * (255-brightness[twinkle["position"]])) // FAST_SEQUENCE_TWINKLE_DURATION_MS)
             pixels_set(twinkle["position"], (max(red_blue_component,0),max(green_component,brightness[twinkle["position"]]),max(red_blue_component,0)))
         
-        while (len(twinkles) > 0) and (utime.ticks_diff(utime.ticks_ms(),twinkles[0]["starttime"]) > FAST_SEQUENCE_TWINKLE_DURATION_MS * 2):
+        while (len(twinkles) > 0) and (clock.ticks_diff(clock.ticks_ms(),twinkles[0]["starttime"]) > FAST_SEQUENCE_TWINKLE_DURATION_MS * 2):
             twinkles.pop(0)
         
-        await pixels_show()
-        await uasyncio.sleep(0)
+        pixels_show()
+        await clock.sleep_ms(0)
 
 
 async def twinkling(next_button_pressed, twinkles, ticks, cherry=False):
@@ -172,45 +569,51 @@ async def twinkling(next_button_pressed, twinkles, ticks, cherry=False):
         blue = CHERRY_BLUE
 
     # TODO: make pause a feature of each twinkle
-    pause = random.randrange(TWINKLING_PERIOD_MAX_VARIABLE_MS)
+    pause = clock.randrange(TWINKLING_PERIOD_MAX_VARIABLE_MS)
+    spawned = 0
 
     while not next_button_pressed.is_set():
 
-        for led in range(NUM_LEDS):
-            pixels_set(led, (
-                (red*brightness[led]) // 255,
-                (green*brightness[led]) // 255,
-                (blue*brightness[led]) // 255
-            ))
+        if governor.static_due():
+            for led in range(min(BRIGHTNESS_PERIOD, NUM_LEDS)):
+                pixels_set(led, (
+                    (red*brightness[led]) // 255,
+                    (green*brightness[led]) // 255,
+                    (blue*brightness[led]) // 255
+                ))
+            pixels_tile(0, BRIGHTNESS_PERIOD, NUM_LEDS)
 
         # select a LED and make sure it isn't already twinkling
-        dice = random.randrange(NUM_LEDS)
+        dice = clock.randrange(NUM_LEDS)
         while True:
             existing_twinkles = filter(lambda item: item["position"] == dice, twinkles)
             if all(False for _ in existing_twinkles):
                 break
-            dice = random.randrange(NUM_LEDS)
+            dice = clock.randrange(NUM_LEDS)
 
-        if utime.ticks_diff(utime.ticks_ms(), ticks) > TWINKLING_PERIOD_FIXED_MS + pause:
-            twinkles.append({
-                "starttime": utime.ticks_ms(),
-                "position": dice,
-            })
-            ticks = utime.ticks_ms()
-            pause = random.randrange(TWINKLING_PERIOD_MAX_VARIABLE_MS)
+        if clock.ticks_diff(clock.ticks_ms(), ticks) > TWINKLING_PERIOD_FIXED_MS + pause:
+            # under load the governor keeps only one in twinkle_stride() of them
+            if spawned % governor.twinkle_stride() == 0:
+                twinkles.append({
+                    "starttime": clock.ticks_ms(),
+                    "position": dice,
+                })
+            spawned += 1
+            ticks = clock.ticks_ms()
+            pause = clock.randrange(TWINKLING_PERIOD_MAX_VARIABLE_MS)
 
         for twinkle in twinkles:
-            offset = utime.ticks_diff(utime.ticks_ms(),twinkle["starttime"])
+            offset = clock.ticks_diff(clock.ticks_ms(),twinkle["starttime"])
             red_component = 255 - abs(((offset-TWINKLING_DURATION_MS) * (255-(red*brightness[twinkle["position"]]//255))) // TWINKLING_DURATION_MS)
             green_component = 255 - abs(((offset-TWINKLING_DURATION_MS) * (255-(green*brightness[twinkle["position"]]//255))) // TWINKLING_DURATION_MS)
             blue_component = 255 - abs(((offset-TWINKLING_DURATION_MS) * (255-(blue*brightness[twinkle["position"]]//255))) // TWINKLING_DURATION_MS)
             pixels_set(twinkle["position"], (max(red_component,0),max(green_component,0),max(blue_component,0)))
         
-        while (len(twinkles) > 0) and (utime.ticks_diff(utime.ticks_ms(),twinkles[0]["starttime"]) > TWINKLING_DURATION_MS * 2):
+        while (len(twinkles) > 0) and (clock.ticks_diff(clock.ticks_ms(),twinkles[0]["starttime"]) > TWINKLING_DURATION_MS * 2):
             twinkles.pop(0)
         
-        await pixels_show()
-        await uasyncio.sleep(0)
+        pixels_show()
+        await clock.sleep_ms(0)
 
 
 async def fadeout(twinkles, ticks):
@@ -219,42 +622,36 @@ async def fadeout(twinkles, ticks):
     green = CHERRY_GREEN
     blue = CHERRY_BLUE
 
-    fade_start_ticks = utime.ticks_ms()
-    fade = max(FADEOUT_TIME_MS - utime.ticks_diff(utime.ticks_ms(), fade_start_ticks), 0)
+    fade_start_ticks = clock.ticks_ms()
+    fade = max(FADEOUT_TIME_MS - clock.ticks_diff(clock.ticks_ms(), fade_start_ticks), 0)
     while fade > 0:
-        for led in range(NUM_LEDS):
-            pixels_set(led, (
-                (red*brightness[led]*fade) // (255*FADEOUT_TIME_MS),
-                (green*brightness[led]*fade) // (255*FADEOUT_TIME_MS),
-                (blue*brightness[led]*fade) // (255*FADEOUT_TIME_MS)
-            ))
-        await pixels_show()
-        await uasyncio.sleep(0)
-        fade = max(FADEOUT_TIME_MS - utime.ticks_diff(utime.ticks_ms(), fade_start_ticks), 0)
+        for led in range(min(BRIGHTNESS_PERIOD, NUM_LEDS)):
+            pixels_set_scaled(led, (red, green, blue), brightness[led] * fade, 255 * FADEOUT_TIME_MS)
+        pixels_tile(0, BRIGHTNESS_PERIOD, NUM_LEDS)
+        pixels_show()
+        await clock.sleep_ms(0)
+        fade = max(FADEOUT_TIME_MS - clock.ticks_diff(clock.ticks_ms(), fade_start_ticks), 0)
 
     pixels_fill((0,0,0)) 
-    await pixels_show()
+    pixels_show()
 
 
 async def enchanted_forest_base(lcd, next_button_pressed):
     lcd.print_lcd("Enchanted Forest")
     lcd.setCursor(0,1)
     lcd.printout("FADE IN")
-    await uasyncio.sleep(0)
+    await clock.sleep_ms(0)
 
-    ticks = utime.ticks_ms()
+    ticks = clock.ticks_ms()
     diff = 0
 
     while diff < FADE_IN_DURATION_MS:
-        diff = utime.ticks_diff(utime.ticks_ms(), ticks)
-        for led in range(NUM_LEDS):
-            pixels_set(led, (
-                0,
-                min((brightness[led] * diff) // FADE_IN_DURATION_MS, 255)
-                ,0
-            ))
-        await pixels_show()
-        await uasyncio.sleep(0)
+        diff = clock.ticks_diff(clock.ticks_ms(), ticks)
+        for led in range(min(BRIGHTNESS_PERIOD, NUM_LEDS)):
+            pixels_set_scaled(led, (0, brightness[led], 0), diff, FADE_IN_DURATION_MS)
+        pixels_tile(0, BRIGHTNESS_PERIOD, NUM_LEDS)
+        pixels_show()
+        await clock.sleep_ms(0)
 
     twinkles = []
 
@@ -279,7 +676,7 @@ async def enchanted_forest_base(lcd, next_button_pressed):
     red = FOREST_RED
     green = FOREST_GREEN
     blue = FOREST_BLUE
-    for led in range(NUM_LEDS):
+    for led in range(min(FREEZE_PERIOD, NUM_LEDS)):
         if (led % 10) != 0:
             pixels_set(led, (
                 (brightness[led] * red) // 255,
@@ -288,19 +685,19 @@ async def enchanted_forest_base(lcd, next_button_pressed):
             ))
         else:
             pixels_set(led, (255, 255, 255))
-    await pixels_show()
-    while not next_button_pressed.is_set():
-        await uasyncio.sleep(0)
+    pixels_tile(0, FREEZE_PERIOD, NUM_LEDS)
+    pixels_show()
+    await next_button_pressed.wait()
 
     # setup twinkles array for fadeout
-    ticks = utime.ticks_ms() - TWINKLING_DURATION_MS
+    ticks = clock.ticks_ms() - TWINKLING_DURATION_MS
     twinkles = []
     for led in range(0, NUM_LEDS, 10):
         twinkles.append({
             "starttime": ticks,
             "position": led,
         })
-    ticks = utime.ticks_ms()
+    ticks = clock.ticks_ms()
 
     next_button_pressed.clear()
     lcd.print_lcd("Enchanted Forest")
@@ -315,19 +712,20 @@ async def enchanted_forest_base(lcd, next_button_pressed):
     cherry_red = CHERRY_RED
     cherry_green = CHERRY_GREEN
     cherry_blue = CHERRY_BLUE
-    fade_start_ticks = utime.ticks_ms()
-    fade = min(utime.ticks_diff(utime.ticks_ms(), fade_start_ticks), FADE_TO_CHERRY_DURATION)
+    fade_start_ticks = clock.ticks_ms()
+    fade = min(clock.ticks_diff(clock.ticks_ms(), fade_start_ticks), FADE_TO_CHERRY_DURATION)
     while fade < FADE_TO_CHERRY_DURATION:
 
-        for led in range(NUM_LEDS):
-            pixels_set(led, (
-                ((red * (FADE_TO_CHERRY_DURATION - fade)) + (cherry_red * fade)) * brightness[led] // (255 * FADE_TO_CHERRY_DURATION),
-                ((green * (FADE_TO_CHERRY_DURATION - fade)) + (cherry_green * fade)) * brightness[led] // (255 * FADE_TO_CHERRY_DURATION),
-                ((blue * (FADE_TO_CHERRY_DURATION - fade)) + (cherry_blue * fade)) * brightness[led] // (255 * FADE_TO_CHERRY_DURATION),
-            ))
-        await pixels_show()
-        await uasyncio.sleep(0)
-        fade = min(utime.ticks_diff(utime.ticks_ms(), fade_start_ticks), FADE_TO_CHERRY_DURATION)
+        for led in range(min(BRIGHTNESS_PERIOD, NUM_LEDS)):
+            pixels_set_scaled(led, (
+                (red * (FADE_TO_CHERRY_DURATION - fade)) + (cherry_red * fade),
+                (green * (FADE_TO_CHERRY_DURATION - fade)) + (cherry_green * fade),
+                (blue * (FADE_TO_CHERRY_DURATION - fade)) + (cherry_blue * fade),
+            ), brightness[led], 255 * FADE_TO_CHERRY_DURATION)
+        pixels_tile(0, BRIGHTNESS_PERIOD, NUM_LEDS)
+        pixels_show()
+        await clock.sleep_ms(0)
+        fade = min(clock.ticks_diff(clock.ticks_ms(), fade_start_ticks), FADE_TO_CHERRY_DURATION)
 
     twinkles = []
 
@@ -347,12 +745,12 @@ async def enchanted_forest_base(lcd, next_button_pressed):
 
 
 async def twinkling_only(lcd, next_button_pressed):
-    ticks = utime.ticks_ms()
+    ticks = clock.ticks_ms()
     twinkles = []
-    pause = random.randrange(TWINKLING_PERIOD_MAX_VARIABLE_MS)
+    pause = clock.randrange(TWINKLING_PERIOD_MAX_VARIABLE_MS)
 
     pixels_fill((0,0,0))
-    await pixels_show()
+    pixels_show()
 
     # next_button_pressed.clear()
     lcd.print_lcd("CEST LA VIE - FAST")
@@ -361,38 +759,38 @@ async def twinkling_only(lcd, next_button_pressed):
 
     next_led = 5
     while not next_button_pressed.is_set():
-        if utime.ticks_diff(utime.ticks_ms(), ticks) >= FAST_SEQUENCE_PERIOD_MS:
-            for i in range(0, NUM_LEDS, GROUP_SIZE):
+        if clock.ticks_diff(clock.ticks_ms(), ticks) >= FAST_SEQUENCE_PERIOD_MS:
+            for i in range(0, NUM_LEDS, GROUP_SIZE * governor.twinkle_stride()):
                 twinkles.append({
-                    "starttime": utime.ticks_ms() - TWINKLING_DURATION_MS // 4,
-                    "position": next_led + i,
+                    "starttime": clock.ticks_ms() - TWINKLING_DURATION_MS // 4,
+                    "position": (next_led + i) % NUM_LEDS,
                 })
                 twinkles.append({
-                    "starttime": utime.ticks_ms() - TWINKLING_DURATION_MS // 4,
-                    "position": next_led + i + 2,
+                    "starttime": clock.ticks_ms() - TWINKLING_DURATION_MS // 4,
+                    "position": (next_led + i + 2) % NUM_LEDS,
                 })
-            ticks = utime.ticks_ms()
+            ticks = clock.ticks_ms()
             next_led = (next_led + 10) % GROUP_SIZE
 
         for twinkle in twinkles:
-            offset = utime.ticks_diff(utime.ticks_ms(), twinkle["starttime"])
+            offset = clock.ticks_diff(clock.ticks_ms(), twinkle["starttime"])
             red_component = TWINKLE_COLOURS_RED[TWINKLE_COLOUR] - abs(((offset-TWINKLING_DURATION_MS) * TWINKLE_COLOURS_RED[TWINKLE_COLOUR]) // TWINKLING_DURATION_MS)
             green_component = TWINKLE_COLOURS_GREEN[TWINKLE_COLOUR] - abs(((offset-TWINKLING_DURATION_MS) * TWINKLE_COLOURS_GREEN[TWINKLE_COLOUR]) // TWINKLING_DURATION_MS)
             blue_component = TWINKLE_COLOURS_BLUE[TWINKLE_COLOUR] - abs(((offset-TWINKLING_DURATION_MS) * TWINKLE_COLOURS_BLUE[TWINKLE_COLOUR]) // TWINKLING_DURATION_MS)
             pixels_set(twinkle["position"], (max(red_component,0),max(green_component,0),max(blue_component,0)))
         
-        while (len(twinkles) > 0) and (utime.ticks_diff(utime.ticks_ms(),twinkles[0]["starttime"]) > TWINKLING_DURATION_MS * 2):
+        while (len(twinkles) > 0) and (clock.ticks_diff(clock.ticks_ms(),twinkles[0]["starttime"]) > TWINKLING_DURATION_MS * 2):
             twinkles.pop(0)
         
-        await pixels_show()
-        await uasyncio.sleep(0)
+        pixels_show()
+        await clock.sleep_ms(0)
 
     next_button_pressed.clear()
     lcd.print_lcd("FREEZE")
     lcd.setCursor(0,1)
     lcd.printout("next: twinkling")
 
-    for led in range(NUM_LEDS):
+    for led in range(min(10, NUM_LEDS)):
         if (led % 10) == 0:
             pixels_set(led, (
                 TWINKLE_COLOURS_RED[TWINKLE_COLOUR],
@@ -401,18 +799,18 @@ async def twinkling_only(lcd, next_button_pressed):
             ))
         else:
             pixels_set(led, (0,0,0))
-    await pixels_show()
-    while not next_button_pressed.is_set():
-        await uasyncio.sleep(0)
+    pixels_tile(0, 10, NUM_LEDS)
+    pixels_show()
+    await next_button_pressed.wait()
 
-    ticks = utime.ticks_ms() - TWINKLING_DURATION_MS
+    ticks = clock.ticks_ms() - TWINKLING_DURATION_MS
     twinkles = []
     for led in range(0, NUM_LEDS, 10):
         twinkles.append({
             "starttime": ticks,
             "position": led,
         })
-    ticks = utime.ticks_ms()
+    ticks = clock.ticks_ms()
 
     next_button_pressed.clear()
     lcd.print_lcd("TWINKLING")
@@ -420,53 +818,53 @@ async def twinkling_only(lcd, next_button_pressed):
     lcd.printout("next: fadeout")
 
     while not next_button_pressed.is_set():
-        dice = random.randrange(NUM_LEDS)
+        dice = clock.randrange(NUM_LEDS)
 
         while True:
             existing_twinkles = filter(lambda item: item["position"] == dice, twinkles)
             if all(False for _ in existing_twinkles):
                 break
-            dice = random.randrange(NUM_LEDS)
+            dice = clock.randrange(NUM_LEDS)
 
-        if utime.ticks_diff(utime.ticks_ms(), ticks) > TWINKLING_PERIOD_FIXED_MS + pause:
+        if clock.ticks_diff(clock.ticks_ms(), ticks) > TWINKLING_PERIOD_FIXED_MS + pause:
             twinkles.append({
-                "starttime": utime.ticks_ms() - TWINKLING_DURATION_MS // 4,
+                "starttime": clock.ticks_ms() - TWINKLING_DURATION_MS // 4,
                 "position": dice,
             })
-            ticks = utime.ticks_ms()
-            pause = random.randrange(TWINKLING_PERIOD_MAX_VARIABLE_MS)
+            ticks = clock.ticks_ms()
+            pause = clock.randrange(TWINKLING_PERIOD_MAX_VARIABLE_MS)
 
         for twinkle in twinkles:
-            offset = utime.ticks_diff(utime.ticks_ms(), twinkle["starttime"])
+            offset = clock.ticks_diff(clock.ticks_ms(), twinkle["starttime"])
             red_component = TWINKLE_COLOURS_RED[TWINKLE_COLOUR] - abs(((offset-TWINKLING_DURATION_MS) * TWINKLE_COLOURS_RED[TWINKLE_COLOUR]) // TWINKLING_DURATION_MS)
             green_component = TWINKLE_COLOURS_GREEN[TWINKLE_COLOUR] - abs(((offset-TWINKLING_DURATION_MS) * TWINKLE_COLOURS_GREEN[TWINKLE_COLOUR]) // TWINKLING_DURATION_MS)
             blue_component = TWINKLE_COLOURS_BLUE[TWINKLE_COLOUR] - abs(((offset-TWINKLING_DURATION_MS) * TWINKLE_COLOURS_BLUE[TWINKLE_COLOUR]) // TWINKLING_DURATION_MS)
             pixels_set(twinkle["position"], (max(red_component,0),max(green_component,0),max(blue_component,0)))
         
-        while (len(twinkles) > 0) and (utime.ticks_diff(utime.ticks_ms(),twinkles[0]["starttime"]) > TWINKLING_DURATION_MS * 2):
+        while (len(twinkles) > 0) and (clock.ticks_diff(clock.ticks_ms(),twinkles[0]["starttime"]) > TWINKLING_DURATION_MS * 2):
             twinkles.pop(0)
         
-        await pixels_show()
-        await uasyncio.sleep(0)
+        pixels_show()
+        await clock.sleep_ms(0)
 
     next_button_pressed.clear()
     lcd.print_lcd("FADEOUT")
 
     while len(twinkles) > 0:
         for twinkle in twinkles:
-            offset = utime.ticks_diff(utime.ticks_ms(), twinkle["starttime"])
+            offset = clock.ticks_diff(clock.ticks_ms(), twinkle["starttime"])
             red_component = TWINKLE_COLOURS_RED[TWINKLE_COLOUR] - abs(((offset-TWINKLING_DURATION_MS) * TWINKLE_COLOURS_RED[TWINKLE_COLOUR]) // TWINKLING_DURATION_MS)
             green_component = TWINKLE_COLOURS_GREEN[TWINKLE_COLOUR] - abs(((offset-TWINKLING_DURATION_MS) * TWINKLE_COLOURS_GREEN[TWINKLE_COLOUR]) // TWINKLING_DURATION_MS)
             blue_component = TWINKLE_COLOURS_BLUE[TWINKLE_COLOUR] - abs(((offset-TWINKLING_DURATION_MS) * TWINKLE_COLOURS_BLUE[TWINKLE_COLOUR]) // TWINKLING_DURATION_MS)
             pixels_set(twinkle["position"], (max(red_component,0),max(green_component,0),max(blue_component,0)))
         
-        while (len(twinkles) > 0) and (utime.ticks_diff(utime.ticks_ms(),twinkles[0]["starttime"]) > TWINKLING_DURATION_MS * 2):
+        while (len(twinkles) > 0) and (clock.ticks_diff(clock.ticks_ms(),twinkles[0]["starttime"]) > TWINKLING_DURATION_MS * 2):
             twinkles.pop(0)
         
-        await pixels_show()
-        await uasyncio.sleep(0)
+        pixels_show()
+        await clock.sleep_ms(0)
 
     pixels_fill((0,0,0))
-    await pixels_show()
+    pixels_show()
     lcd.print_lcd("ALL OFF")
 